@@ -1,13 +1,13 @@
-from lipd.lipd_io import lipd_read, lipd_write
+from lipd.lipd_io import lipd_read, lipd_read_batch, lipd_read_iter, lipd_scan_batch, lipd_write_batch
 from lipd.timeseries import extract, collapse, mode_ts, translate_expression, get_matches
 from lipd.doi_main import doi_main
-from lipd.csvs import get_csv_from_metadata
+from lipd.csvs import get_csv_from_metadata, CSV_ENGINES
 from lipd.excel import excel_main
 from lipd.noaa import noaa_prompt, noaa_to_lpd, lpd_to_noaa, noaa_prompt_1
 from lipd.dataframes import *
 from lipd.directory import get_src_or_dst, list_files, collect_metadata_file
 from lipd.loggers import create_logger, log_benchmark, create_benchmark
-from lipd.misc import path_type, load_fn_matches_ext, rm_values_fields, get_dsn, rm_empty_fields, print_filename, rm_wds_url, rm_od_url
+from lipd.misc import path_type, load_fn_matches_ext, rm_values_fields, copy_metadata, get_dsn, rm_empty_fields, print_filename, rm_wds_url, rm_od_url
 from lipd.tables import addModel, addTable
 from lipd.validator_api import call_validator_api, display_results, get_validator_format
 from lipd.alternates import FILE_TYPE_MAP
@@ -15,6 +15,11 @@ from lipd.regexes import re_url
 from lipd.fetch_doi import update_dois
 from lipd.download_lipd import download_from_url, get_download_path
 from lipd.directory import _go_to_package
+from lipd.zips import COMPRESSION_POLICIES
+from lipd.query import compile_query, get_query_matches
+from lipd.indexes import index_ts, get_ts_index, drop_ts_index
+from lipd.spatial import search_box, search_radius, search_nearest
+from lipd.cache import DiskCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, DEFAULT_MEMORY_SIZE, memory_cache
 
 import re
 from time import process_time as clock
@@ -36,7 +41,17 @@ def run():
     global cwd, files, logger_start, logger_benchmark, settings, _timeseries_data
     _timeseries_data = {}
     # files = {".lpd": [ {"full_path", "filename_ext", "filename_no_ext", "dir"} ], ".xls": [...], ".txt": [...]}
-    settings = {"note_update": True, "note_validate": True, "verbose": True}
+    # workers: default number of processes used to read or write multiple LiPD files. 1 works serially.
+    # compression: how LiPD files are compressed on write. "stored" (none, fastest), "fast", "default", or "max"
+    # cache: keep processed datasets in cache_dir, so reading the same file again is fast. Limited to cache_max_bytes.
+    # cache_dir: the entries are pickles, and loading a pickle can run code. Use a directory that only you can write
+    #     to. It is made with mode 0700, and one that belongs to another user, or that others can write to, is not used.
+    # memory_cache_size: number of recently read datasets kept in memory, for repeated reads of a file. 0 turns it off.
+    # track_changes: remember the tables read, so that writeLipd copies the unchanged ones instead of writing them again
+    settings = {"note_update": True, "note_validate": True, "verbose": True, "workers": 1, "csv_engine": "auto",
+                "precision": 3, "compression": "default", "cache": False, "cache_dir": DEFAULT_CACHE_DIR,
+                "cache_max_bytes": DEFAULT_MAX_BYTES, "memory_cache_size": DEFAULT_MEMORY_SIZE,
+                "track_changes": False}
     cwd = os.getcwd()
     # logger created in whatever directory lipd is called from
     logger_start = create_logger("start")
@@ -45,30 +60,159 @@ def run():
     return
 
 
-def readLipd(usr_path="", remote_file_save=False):
+def readLipd(usr_path="", remote_file_save=False, workers=None, lazy=False, as_numpy=False, csv_engine=None,
+             cache=None):
     """
     Read LiPD file(s).
     Enter a file path, directory path, or leave args blank to trigger gui.
 
+    | Example: Read a directory using 4 processes
+    | D = lipd.readLipd("/path/to/lipd/files", workers=4)
+
+    | Example: Metadata first. Column values are loaded from the file when first used
+    | D = lipd.readLipd("/path/to/lipd/files", lazy=True)
+
+    | Example: Numeric columns as numpy arrays. Text columns stay as lists
+    | D = lipd.readLipd("/path/to/lipd/files", as_numpy=True)
+
+    | Example: Keep the processed datasets on disk. Reading the same files again loads them from the cache
+    | D = lipd.readLipd("/path/to/lipd/files", cache=True)
+
+    | Example: Keep the last 20 datasets read in memory. Reading an unchanged file again returns a copy of it
+    | lipd.settings["memory_cache_size"] = 20
+    | D = lipd.readLipd("/path/to/file.lpd")
+
     :param str usr_path: Path to file / directory (optional)
+    :param bool remote_file_save: Keep the local copy of a file downloaded from a URL
+    :param int workers: Number of processes used to read multiple files (optional, default: settings["workers"])
+    :param bool lazy: Defer reading table values (and inferred data) until they are accessed. The LiPD files must
+        stay in place until then.
+    :param bool as_numpy: Store numeric column values as numpy arrays (float64, NaN for missing values). Ensemble
+        tables become one 2D array.
+    :param str csv_engine: CSV parser: "auto", "python", "numpy", or "pandas" (optional, default:
+        settings["csv_engine"]). "auto" uses numpy for purely numeric files, and the csv module for the rest. Every
+        engine gives the same values, and falls back to the csv module for any file it can't parse the same way.
+    :param bool cache: Use the on-disk cache of processed datasets in settings["cache_dir"] (optional, default:
+        settings["cache"]). A file that changes is read again. Lazy reads don't use the cache. The entries are
+        pickles, so settings["cache_dir"] must be a directory that only you can write to.
+        The memory cache is set with settings["memory_cache_size"]. Datasets from it have their own dicts and lists,
+        but numpy arrays are read-only views, to be copied before they are changed.
     :return dict _d: Metadata
     """
-    global cwd, settings, files
+    global settings
+    _d = {}
+    if workers is None:
+        workers = settings["workers"]
+    if csv_engine is None:
+        csv_engine = settings["csv_engine"]
+    if csv_engine not in CSV_ENGINES:
+        print("Error: readLipd: csv_engine must be one of: {}".format(", ".join(CSV_ENGINES)))
+        return _d
     try:
         if settings["verbose"]:
             __disclaimer(opt="update")
-        files[".lpd"] = []
-        __read(usr_path, ".lpd")
-        _d = __read_lipd_contents(usr_path, remote_file_save)
-        # Clear out the lipd files metadata. We're done loading, we dont need it anymore.
-        files[".lpd"] = []
+        # Keep the file list local to this call (not in the global "files") so that concurrent reads don't collide
+        _files = __read(usr_path, ".lpd")
+        _d = __read_lipd_contents(_files, usr_path, remote_file_save, workers, lazy, as_numpy, csv_engine,
+                                  __get_cache(cache), __get_memory_cache())
     except Exception as e:
         pass
-        # Placeholder to catch errors so we can always chdir back to cwd
-    os.chdir(cwd)
     return _d
 
 
+def iterLipd(usr_path="", workers=None, prefetch=0, lazy=False, as_numpy=False, csv_engine=None, cache=None):
+    """
+    Read LiPD file(s) one at a time. Each dataset is yielded as soon as it is read, and nothing is kept afterwards,
+    so large libraries can be processed without holding every dataset in memory.
+
+    | Example: Time series from a large library, one dataset at a time
+    | for dsn, L in lipd.iterLipd("/path/to/lipd/files", prefetch=2):
+    |     ts = lipd.extractTs(L)
+
+    :param str usr_path: Path to file / directory (optional)
+    :param int workers: Number of processes used to read ahead (optional, default: settings["workers"])
+    :param int prefetch: Number of files to read ahead in the background (optional, default: 0)
+    :param bool lazy: Defer reading table values (and inferred data) until they are accessed
+    :param bool as_numpy: Store numeric column values as numpy arrays
+    :param str csv_engine: CSV parser: "auto", "python", "numpy", or "pandas" (optional, default: settings["csv_engine"])
+    :param bool cache: Use the on-disk cache of processed datasets (optional, default: settings["cache"])
+    :return generator: (dataSetName, metadata) for each file
+    """
+    global settings
+    if workers is None:
+        workers = settings["workers"]
+    if csv_engine is None:
+        csv_engine = settings["csv_engine"]
+    if csv_engine not in CSV_ENGINES:
+        print("Error: iterLipd: csv_engine must be one of: {}".format(", ".join(CSV_ENGINES)))
+        return
+    if settings["verbose"]:
+        __disclaimer(opt="update")
+    _files = __read(usr_path, ".lpd")
+    _paths = [file["full_path"] for file in _files]
+    for _path, _d, _error in lipd_read_iter(_paths, workers, prefetch, lazy, as_numpy, csv_engine,
+                                            __get_cache(cache), settings["track_changes"]):
+        if _error:
+            print("Error: iterLipd: {}: {}".format(print_filename(_path), _error))
+        else:
+            yield _d["dataSetName"], _d
+
+
+def scanLipd(usr_path="", workers=None):
+    """
+    Scan LiPD file(s) for a quick catalog. Only the jsonld metadata is read from each file, which is much faster
+    than a full readLipd. Records are yielded one at a time as each file is scanned.
+
+    | Example: Catalog a directory
+    | for rec in lipd.scanLipd("/path/to/lipd/files", workers=4):
+    |     print(rec["dataSetName"], rec["archiveType"], rec["coordinates"])
+
+    Record keys: path, dataSetName, archiveType, lipdVersion, coordinates, variableNames,
+    tables (tableName, filename, columns, rows, bytes)
+
+    :param str usr_path: Path to file / directory (optional)
+    :param int workers: Number of processes used to scan multiple files (optional, default: settings["workers"])
+    :return generator: Scan record for each file
+    """
+    global settings
+    if workers is None:
+        workers = settings["workers"]
+    _files = __read(usr_path, ".lpd")
+    for _path, _record, _error in lipd_scan_batch([file["full_path"] for file in _files], workers):
+        if _error:
+            print("Error: scanLipd: {}: {}".format(print_filename(_path), _error))
+        else:
+            yield _record
+
+
+def clearCache():
+    """
+    Remove all the processed datasets from the memory cache, and from the on-disk cache in settings["cache_dir"].
+
+    :return none:
+    """
+    global settings
+    memory_cache.clear()
+    DiskCache(settings["cache_dir"], settings["cache_max_bytes"]).clear()
+    return
+
+
+def cacheInfo():
+    """
+    Statistics for the caches of processed datasets.
+
+    | Example: Check how often repeated reads come from memory
+    | info = lipd.cacheInfo()
+    | print(info["memory"]["hits"], info["memory"]["misses"])
+
+    :return dict: memory (hits, misses, size, max_size), disk (path, bytes, max_bytes)
+    """
+    global settings
+    _disk = DiskCache(settings["cache_dir"], settings["cache_max_bytes"])
+    return {"memory": memory_cache.info(),
+            "disk": {"path": _disk.path, "bytes": _disk.size(), "max_bytes": _disk.max_bytes}}
+
+
 def readExcel(usr_path=""):
     """
     Read Excel file(s)
@@ -80,8 +224,8 @@ def readExcel(usr_path=""):
     global cwd, files
     try:
         files[".xls"] = []
-        __read(usr_path, ".xls")
-
+        files[".xls"] = __read(usr_path, ".xls")
+        cwd = __get_files_dir(files[".xls"], cwd)
     except Exception as e:
         pass
         # Placeholder to catch errors so we can always chdir back to cwd
@@ -101,7 +245,8 @@ def readNoaa(usr_path=""):
     global cwd, files
     try:
         files[".txt"] = []
-        __read(usr_path, ".txt")
+        files[".txt"] = __read(usr_path, ".txt")
+        cwd = __get_files_dir(files[".txt"], cwd)
     except Exception as e:
         pass
         # Placeholder to catch errors so we can always chdir back to cwd
@@ -325,7 +470,6 @@ def validate(D, detailed=True):
     except Exception as e:
         print("Error: validate: {}".format(e))
 
-    __move_to_cwd()
     return
 
 
@@ -387,7 +531,6 @@ def ensToDf(ensemble):
         df = create_dataframe(ensemble)
     except Exception as e:
         pass
-    __move_to_cwd()
     return df
 
 
@@ -422,7 +565,6 @@ def tsToDf(tso):
     except Exception as e:
         print("Error: Unable to create data frame")
         logger_start.warn("ts_to_df: tso malformed: {}".format(e))
-    __move_to_cwd()
     return dfs
 
 
@@ -445,7 +587,7 @@ def tsToDf(tso):
 # ANALYSIS - TIME SERIES
 
 
-def extractTs(d, whichtables="meas", mode="paleo"):
+def extractTs(d, whichtables="meas", mode="paleo", shared=False, as_table=False):
     """
     Create a time series using LiPD data (uses paleoData by default)
 
@@ -457,9 +599,29 @@ def extractTs(d, whichtables="meas", mode="paleo"):
     | 1. D = lipd.readLipd()
     | 2. ts = lipd.extractTs(D, "all", "chron")
 
+    | Example : shared time series, for large collections
+    | 1. D = lipd.readLipd()
+    | 2. ts = lipd.extractTs(D, shared=True)
+
+    Shared, the data is not copied. Each entry is a ChainMap of its column items on top of the table and root items,
+    which all the entries of a table share, and its values are the same lists as in the LiPD data. Memory grows with
+    the number of columns, not with the columns times the size of the metadata. Setting a key only changes that
+    entry. Changing a value in place (i.e. appending to a list) changes it in the LiPD data, and in every entry that
+    shares it. Use dict(entry) for a plain dictionary.
+
+    | Example : time series table
+    | 1. D = lipd.readLipd()
+    | 2. df = lipd.extractTs(D, shared=True, as_table=True)
+    | 3. df = df[df["archiveType"] == "marine sediment"]
+    | 4. New_D = lipd.collapseTs(lipd.tableToTs(df))
+
+    As a table, there is one row per entry, and one column per key. See tsToTable().
+
     :param dict d: Metadata
     :param str whichtables: "all", "summ", "meas", "ens" - The tables that you would like in the timeseries
     :param str mode: "paleo" or "chron" mode
+    :param bool shared: Share the data between entries, and with the LiPD data, instead of copying it
+    :param bool as_table: Return the time series as a pandas DataFrame
     :return list l: Time series
     """
     # instead of storing each raw dataset per tso, store it once in the global scope. saves memory
@@ -480,9 +642,9 @@ def extractTs(d, whichtables="meas", mode="paleo"):
                     # Use the LiPD data given to start time series extract
                     print("extracting: {}".format(_dsn))
                     # Copy, so we don't affect the original data
-                    _v = copy.deepcopy(d)
+                    _v = d if shared else copy.deepcopy(d)
                     # Start extract...
-                    _l = (extract(_v, whichtables, mode, start))
+                    _l = (extract(_v, whichtables, mode, start, shared))
                 except Exception as e:
                     print("Error: Unable to extractTs for dataset: {}: {}".format(_dsn, e))
                     logger_start.debug("extractTs: Exception: {}, {}".format(_dsn, e))
@@ -495,20 +657,67 @@ def extractTs(d, whichtables="meas", mode="paleo"):
                         # Use the LiPD data given to start time series extract
                         print("extracting: {}".format(k))
                         # Copy, so we don't affect the original data
-                        _v = copy.deepcopy(v)
+                        _v = v if shared else copy.deepcopy(v)
                         # Start extract...
-                        _l += (extract(_v, whichtables, mode, start))
+                        _l += (extract(_v, whichtables, mode, start, shared))
                     except Exception as e:
                         print("Error: Unable to extractTs for dataset: {}: {}".format(k, e))
                         logger_start.debug("extractTs: Exception: {}".format(e))
             print("Created time series: {} entries".format(len(_l)))
+            if as_table:
+                _l = ts_to_table(_l)
     except Exception as e:
         print("Error: Unable to extractTs: {}".format(e))
         logger_start.error("extractTs: Exception: {}".format(e))
-    __move_to_cwd()
     return _l
 
 
+def tsToTable(ts):
+    """
+    Create a table from a time series, with one row per entry, and one column per key. A key that an entry doesn't
+    have is <NA> in its row. Columns of strings, booleans, ints, or floats get a nullable pandas type, so they can be
+    filtered and grouped in one go. Values lists (or arrays) are kept as they are, and are not copied.
+
+    | Example
+    | 1. D = lipd.readLipd()
+    | 2. ts = lipd.extractTs(D)
+    | 3. df = lipd.tsToTable(ts)
+    | 4. df = df[df["geo_meanLat"] > 0]
+
+    :param list ts: Time series
+    :return obj: Pandas DataFrame
+    """
+    _table = None
+    try:
+        _table = ts_to_table(ts)
+    except Exception as e:
+        print("Error: Unable to create a table from the time series: {}".format(e))
+        logger_start.error("tsToTable: Exception: {}".format(e))
+    return _table
+
+
+def tableToTs(table):
+    """
+    Create a time series from a time series table, with one entry per row. <NA> cells are left out. The result can be
+    filtered, queried, or collapsed like any time series.
+
+    | Example
+    | 1. df = lipd.extractTs(D, as_table=True)
+    | 2. ts = lipd.tableToTs(df[df["paleoData_units"] == "degC"])
+    | 3. New_D = lipd.collapseTs(ts)
+
+    :param obj table: Pandas DataFrame
+    :return list: Time series
+    """
+    _ts = []
+    try:
+        _ts = table_to_ts(table)
+    except Exception as e:
+        print("Error: Unable to create a time series from the table: {}".format(e))
+        logger_start.error("tableToTs: Exception: {}".format(e))
+    return _ts
+
+
 def collapseTs(ts=None):
     """
     Collapse a time series back into LiPD record form.
@@ -542,11 +751,10 @@ def collapseTs(ts=None):
                 logger_start.error("collapseTs: unable to collapse the time series: {}".format(e))
     except Exception as e:
         pass
-    __move_to_cwd()
     return _d
 
 
-def filterTs(ts, expressions):
+def filterTs(ts, expressions, index=False):
     """
     Create a new time series that only contains entries that match the given expression.
 
@@ -555,47 +763,34 @@ def filterTs(ts, expressions):
     | ts = lipd.extractTs(D)
     | new_ts = filterTs(ts, "archiveType == marine sediment")
     | new_ts = filterTs(ts, ["paleoData_variableName == sst", "archiveType == marine sediment"])
+    | new_ts = filterTs(ts, "(archiveType ~= Coral) or (geo_meanLat >= 10) and not (geo_meanLat > 30)")
     | Expressions should use underscores to denote data nesting.
     | Ex: paleoData_hasResolution_hasMedian or
 
+    Expressions are compiled once (see compileQuery), and the same compiled query can be passed in again.
+    A time series table (see tsToTable) is filtered in one vectorized pass, and gives back a table.
+    With index=True, a time series list is searched through its index (see indexTs), which is made the first time.
+
     :param list OR str expressions: Expressions
     :param list ts:                 Time series
+    :param bool index:              Use the index of the time series (optional, default: False)
     :return list new_ts:            Filtered time series that matches the expression
     """
 
     try:
-        # Make a copy of the ts. We're going to work directly on it.
+        # Make a copy of the ts, in case no expression is usable.
         new_ts = ts[:]
-
-        # User provided a single query string
-        if isinstance(expressions, str):
-            # Use some magic to turn the given string expression into a machine-usable comparative expression.
-            expr_lst = translate_expression(expressions)
-            # Only proceed if the translation resulted in a usable expression.
-            if expr_lst:
-                # Return the new filtered time series. This will use the same time series
-                # that filters down each loop.
-                new_ts, _idx = get_matches(expr_lst, new_ts)
-
-        # User provided a list of multiple queries
-        elif isinstance(expressions, list):
-            # Loop for each query
-            for expr in expressions:
-                # Use some magic to turn the given string expression into a machine-usable comparative expression.
-                expr_lst = translate_expression(expr)
-                # Only proceed if the translation resulted in a usable expression.
-                if expr_lst:
-                    # Return the new filtered time series. This will use the same time series
-                    # that filters down each loop.
-                    new_ts, _idx = get_matches(expr_lst, new_ts)
+        _query = compile_query(expressions)
+        # Only proceed if the translation resulted in a usable expression.
+        if _query:
+            new_ts, _idx = get_query_matches(_query, ts, get_ts_index(ts) if index else None)
     except Exception as e:
-        pass
+        logger_start.debug("filterTs: Exception: {}".format(e))
 
-    __move_to_cwd()
     return new_ts
 
 
-def queryTs(ts, expression):
+def queryTs(ts, expression, index=False):
     """
     Find the indices of the time series entries that match the given expression.
 
@@ -604,42 +799,182 @@ def queryTs(ts, expression):
     | ts = lipd.extractTs(D)
     | matches = queryTs(ts, "archiveType == marine sediment")
     | matches = queryTs(ts, "geo_meanElev <= 2000")
+    | matches = queryTs(ts, ["geo_meanElev <= 2000", "archiveType == marine sediment"])
+
+    Expressions are the same as for filterTs(). For a time series table, the indices are row positions.
+    With index=True, a time series list is searched through its index (see indexTs), which is made the first time.
 
     :param str expression: Expression
     :param list ts: Time series
+    :param bool index: Use the index of the time series (optional, default: False)
     :return list _idx: Indices of entries that match the criteria
     """
+    _idx = []
     try:
-        # Make a copy of the ts. We're going to work directly on it.
-        _idx = []
-
-        # User provided a single query string
-        if isinstance(expression, str):
-            # Use some magic to turn the given string expression into a machine-usable comparative expression.
-            expr_lst = translate_expression(expression)
-            # Only proceed if the translation resulted in a usable expression.
-            if expr_lst:
-                # Return the new filtered time series. This will use the same time series
-                # that filters down each loop.
-                new_ts, _idx = get_matches(expr_lst, ts)
-
-        # User provided a list of multiple queries
-        elif isinstance(expression, list):
-            # Loop for each query
-            for expr in expression:
-                # Use some magic to turn the given string expression into a machine-usable comparative expression.
-                expr_lst = translate_expression(expr)
-                # Only proceed if the translation resulted in a usable expression.
-                if expr_lst:
-                    # Return the new filtered time series. This will use the same time series
-                    # that filters down each loop.
-                    new_ts, _idx = get_matches(expr_lst, ts)
+        _query = compile_query(expression)
+        # Only proceed if the translation resulted in a usable expression.
+        if _query:
+            new_ts, _idx = get_query_matches(_query, ts, get_ts_index(ts) if index else None)
     except Exception as e:
-        pass
-    __move_to_cwd()
+        logger_start.debug("queryTs: Exception: {}".format(e))
+    return _idx
+
+
+def indexTs(ts, keys=None):
+    """
+    Index a time series, for running many queries on it. filterTs() and queryTs() called with index=True use the index
+    for this time series, and find their matches without checking every entry. (They make the index themselves if
+    indexTs() wasn't called.) Spatial queries (queryTsBox, queryTsRadius, queryTsNearest) with index=True keep the
+    locations of the entries in the index too.
+    Each key is indexed the first time that a query uses it, or now if it is given in keys. Entries appended to the
+    time series are indexed on the next query, and the index is made again if entries were replaced, removed, or
+    sorted. Changes made inside an entry (i.e. ts[0]["archiveType"] = "coral") aren't seen: call indexTs() again.
+    The index keeps the time series in memory until dropIndexTs() is called. Up to 16 indexes are kept, and the
+    oldest is dropped first.
+
+    | Example:
+    | ts = lipd.extractTs(D)
+    | lipd.indexTs(ts, ["archiveType", "geo_meanLat"])
+    | matches = lipd.queryTs(ts, "geo_meanLat >= 30", index=True)
+    | matches = lipd.queryTs(ts, "geo_meanLat >= 45", index=True)
+
+    :param list ts: Time series
+    :param list keys: Keys to index now (optional)
+    :return none:
+    """
+    try:
+        if not isinstance(ts, list):
+            print("Error: Only a time series list can be indexed")
+            logger_start.error("indexTs: not a time series list: {}".format(type(ts)))
+        else:
+            index_ts(ts, keys)
+    except Exception as e:
+        print("Error: Unable to index the time series: {}".format(e))
+        logger_start.error("indexTs: Exception: {}".format(e))
+    return
+
+
+def dropIndexTs(ts):
+    """
+    Drop the index of a time series, and free its memory. The index no longer keeps the time series in memory.
+
+    :param list ts: Time series
+    :return none:
+    """
+    drop_ts_index(ts)
+    return
+
+
+def queryTsBox(ts, lat_min, lat_max, lon_min, lon_max, index=False):
+    """
+    Find the indices of the time series entries inside a lat/lon box, edges included. Uses geo_meanLat and
+    geo_meanLon. A box with lon_min east of lon_max crosses the date line.
+
+    | Example:
+    | ts = lipd.extractTs(D)
+    | matches = lipd.queryTsBox(ts, -10, 10, 40, 100)
+    | matches = lipd.queryTsBox(ts, -30, 30, 160, -120)
+    | new_ts = [ts[i] for i in matches]
+
+    With index=True, a time series list only looks at the entries near the box, through its index (see indexTs).
+
+    :param list ts: Time series, or time series table
+    :param float lat_min: Southern edge
+    :param float lat_max: Northern edge
+    :param float lon_min: Western edge
+    :param float lon_max: Eastern edge
+    :param bool index: Use the index of the time series (optional, default: False)
+    :return list _idx: Indices of entries inside the box
+    """
+    _idx = []
+    try:
+        _idx = search_box(ts, float(lat_min), float(lat_max), float(lon_min), float(lon_max), index)
+        print("Found {} matches from {} columns".format(len(_idx), len(ts)))
+    except Exception as e:
+        print("Error: Unable to query the time series: {}".format(e))
+        logger_start.error("queryTsBox: Exception: {}".format(e))
+    return _idx
+
+
+def queryTsRadius(ts, lat, lon, radius, index=False):
+    """
+    Find the indices of the time series entries within a great circle distance of a point. Uses geo_meanLat and
+    geo_meanLon.
+
+    | Example: records within 500 km of a site
+    | ts = lipd.extractTs(D)
+    | matches = lipd.queryTsRadius(ts, -41.2, 174.8, 500)
+
+    With index=True, a time series list only looks at the entries near the circle, through its index (see indexTs).
+
+    :param list ts: Time series, or time series table
+    :param float lat: Latitude of the point
+    :param float lon: Longitude of the point
+    :param float radius: Distance, in km
+    :param bool index: Use the index of the time series (optional, default: False)
+    :return list _idx: Indices of entries within the distance
+    """
+    _idx = []
+    try:
+        _idx = search_radius(ts, float(lat), float(lon), float(radius), index)
+        print("Found {} matches from {} columns".format(len(_idx), len(ts)))
+    except Exception as e:
+        print("Error: Unable to query the time series: {}".format(e))
+        logger_start.error("queryTsRadius: Exception: {}".format(e))
     return _idx
 
 
+def queryTsNearest(ts, lat, lon, k=1, index=False):
+    """
+    Find the indices of the k time series entries nearest to a point, nearest first, and their great circle distances.
+    Uses geo_meanLat and geo_meanLon.
+
+    | Example:
+    | ts = lipd.extractTs(D)
+    | matches, km = lipd.queryTsNearest(ts, -41.2, 174.8, k=10)
+
+    :param list ts: Time series, or time series table
+    :param float lat: Latitude of the point
+    :param float lon: Longitude of the point
+    :param int k: Number of entries
+    :param bool index: Use the index of the time series (optional, default: False)
+    :return list _idx: Indices of the nearest entries
+    :return list _km: Distance of each, in km
+    """
+    _idx = []
+    _km = []
+    try:
+        _idx, _km = search_nearest(ts, float(lat), float(lon), int(k), index)
+    except Exception as e:
+        print("Error: Unable to query the time series: {}".format(e))
+        logger_start.error("queryTsNearest: Exception: {}".format(e))
+    return _idx, _km
+
+
+def compileQuery(expressions):
+    """
+    Compile time series expressions once, to filter or query with them many times.
+
+    | Example:
+    | q = lipd.compileQuery(["geo_meanLat >= -10", "geo_meanLat <= 10", "(archiveType ~= coral) or (archiveType ~= sclerosponge)"])
+    | new_ts = lipd.filterTs(ts, q)
+    | matches = lipd.queryTs(ts2, q)
+
+    Comparisons: ==, =, is, equals, <, <=, >, >=, less than, greater than, in (contains), ~= (equal, ignoring case).
+    Comparisons in parentheses can be combined with and, or, not. A list of expressions must all match.
+
+    :param list OR str expressions: Expressions
+    :return obj: Compiled query, or None if no expression is valid
+    """
+    _query = None
+    try:
+        _query = compile_query(expressions)
+    except Exception as e:
+        print("Error: Unable to compile the query: {}".format(e))
+        logger_start.error("compileQuery: Exception: {}".format(e))
+    return _query
+
+
 def viewTs(ts):
     """
     View the contents of one time series entry in a nicely formatted way
@@ -692,7 +1027,6 @@ def viewTs(ts):
                 print("{} : {}".format(k2, v2))
     except Exception as e:
         pass
-    __move_to_cwd()
     return
 
 # DEPRECATED - TS no longer uses dictionaries or names.
@@ -733,7 +1067,6 @@ def showLipds(D=None):
             print(json.dumps(D.keys(), indent=2))
     except Exception as e:
         pass
-    __move_to_cwd()
     return
 
 
@@ -748,11 +1081,10 @@ def showMetadata(dat):
     :return none:
     """
     try:
-        _tmp = rm_values_fields(copy.deepcopy(dat))
+        _tmp = copy_metadata(dat, values=False)
         print(json.dumps(_tmp, indent=2))
     except Exception as e:
         pass
-    __move_to_cwd()
     return
 
 
@@ -784,7 +1116,6 @@ def showDfs(d):
                 pass
     except Exception as e:
         pass
-    __move_to_cwd()
     return
 
 
@@ -807,7 +1138,6 @@ def getLipdNames(D=None):
             _names = D.keys()
     except Exception:
         pass
-    __move_to_cwd()
     return _names
 
 
@@ -823,10 +1153,8 @@ def getMetadata(L):
     """
     _l = {}
     try:
-        # Create a copy. Do not affect the original data.
-        _l = copy.deepcopy(L)
-        # Remove values fields
-        _l = rm_values_fields(_l)
+        # Create a copy, without the values fields. Do not affect the original data.
+        _l = copy_metadata(L, values=False)
     except Exception as e:
         # Input likely not formatted correctly, though other problems can occur.
         print("Error: Unable to get data. Please check that input is LiPD data: {}".format(e))
@@ -859,17 +1187,46 @@ def getCsv(L=None):
 
 # WRITE
 
-def writeLipd(dat, path=""):
+def writeLipd(dat, path="", precision=None, workers=None, compression=None):
     """
     Write LiPD data to file(s)
 
+    | Example: Write a whole library, 4 files at a time, and check for errors
+    | report = lipd.writeLipd(D, "/path/to/dir", workers=4)
+    | failed = {name: r["error"] for name, r in report.items() if not r["success"]}
+    | Example: Write uncompressed files, for the fastest reads
+    | lipd.writeLipd(D, "/path/to/dir", compression="stored")
+    | Example: Fix metadata in large files, and only write the tables that changed
+    | lipd.settings["track_changes"] = True
+    | D = lipd.readLipd("/path/to/dir")
+    | lipd.writeLipd(D, "/path/to/dir")
+
+    With settings["track_changes"], tables that haven't changed since they were read (or last written) are copied from
+    their source LiPD file as they are, instead of being formatted and hashed again. They are still compressed with
+    the given compression policy. A table is only copied when this writer wrote it before with the same precision,
+    which each file records in its bag-info.txt, and the copy keeps the exact csv bytes written then. Tables from files
+    made by other writers, or written with another precision, are always written again. Without the setting (the
+    default), every table is written again, and reads don't pay for tracking.
+
     :param dict dat: Metadata
     :param str path: Destination (optional)
-    :return none:
+    :param int precision: Number of decimals to keep in the csv values (optional, default: settings["precision"])
+    :param int workers: Number of processes used to write multiple files (optional, default: settings["workers"])
+    :param str compression: Compression policy: "stored" (no compression), "fast", "default", or "max" (smallest
+        files) (optional, default: settings["compression"]). readLipd() opens files written with any of them.
+    :return dict: Report for each dataset name. Keys: success, path (LiPD file written), error
     """
     global settings
-    __write_lipd(dat, path)
-    return
+    if precision is None:
+        precision = settings["precision"]
+    if workers is None:
+        workers = settings["workers"]
+    if compression is None:
+        compression = settings["compression"]
+    if compression not in COMPRESSION_POLICIES:
+        print("Error: writeLipd: compression must be one of: {}".format(", ".join(COMPRESSION_POLICIES)))
+        return {}
+    return __write_lipd(dat, path, precision, workers, compression)
 
 
 # HELPERS
@@ -877,14 +1234,13 @@ def writeLipd(dat, path=""):
 
 def __universal_read(file_path, file_type):
     """
-    Use a file path to create file metadata and load a file in the appropriate way, according to the provided file type.
+    Use a file path to create file metadata for a file, according to the provided file type.
 
     :param str file_path: Path to file
     :param str file_type: One of approved file types: xls, xlsx, txt, lpd
-    :return none:
+    :return dict: File metadata, or None if the file can't be loaded
     """
-    global files, cwd, settings
-
+    file_meta = None
     try:
         # check that we are using the correct function to load this file type. (i.e. readNoaa for a .txt file)
         correct_ext = load_fn_matches_ext(file_path, file_type)
@@ -898,31 +1254,12 @@ def __universal_read(file_path, file_type):
             # get file metadata for one file
             file_meta = collect_metadata_file(file_path)
 
-            # append to global files, then load in D
-            if file_type == ".lpd":
-                # add meta to global file meta
-                files[".lpd"].append(file_meta)
-            # append to global files
-            elif file_type in [".xls", ".xlsx"]:
-                print("reading: {}".format(print_filename(file_meta["full_path"])))
-                files[".xls"].append(file_meta)
-            # append to global files
-            elif file_type == ".txt":
+            if file_type in [".xls", ".xlsx", ".txt"]:
                 print("reading: {}".format(print_filename(file_meta["full_path"])))
-                files[".txt"].append(file_meta)
-
-
-            # we want to move around with the files we load
-            # change dir into the dir of the target file
-            cwd = file_meta["dir"]
-            if cwd:
-                os.chdir(cwd)
     except Exception as e:
         pass
-        # Placeholder to catch errors so we can always chdir back to cwd
 
-    os.chdir(cwd)
-    return
+    return file_meta
 
 
 def __read(usr_path, file_type):
@@ -931,10 +1268,9 @@ def __read(usr_path, file_type):
 
     :param str usr_path: Path  (optional)
     :param str file_type: File type to read
-    :return none:
+    :return list: File metadata for each file found
     """
-    global cwd
-
+    _files = []
     try:
         # is there a file path specified ?
         if usr_path:
@@ -945,10 +1281,10 @@ def __read(usr_path, file_type):
                 usr_path = download_from_url(usr_path)
             # Directory path
             if os.path.isdir(usr_path):
-                __read_directory(usr_path, file_type)
+                _files = __read_directory(usr_path, file_type)
             # File path
             elif os.path.isfile(usr_path):
-                __read_file(usr_path, file_type)
+                _files = __read_file(usr_path, file_type)
             # Invalid path given
             else:
                 print("Error: Path given is invalid")
@@ -966,10 +1302,10 @@ def __read(usr_path, file_type):
                     if choice in ["1", "2", "3"]:
                         # open directory picker
                         if choice == "3":
-                            __read_directory(usr_path, file_type)
+                            _files = __read_directory(usr_path, file_type)
                         else:
                             # open a file picker
-                            __read_file(usr_path, file_type)
+                            _files = __read_file(usr_path, file_type)
                         break
                     else:
                         count -= 1
@@ -980,55 +1316,97 @@ def __read(usr_path, file_type):
                     print("Error: Invalid input: {}".format(e))
     except Exception as e:
         pass
-        # Placeholder to catch errors so we can always chdir back to cwd
 
-    os.chdir(cwd)
-
-    return
+    return _files
 
 
-def __read_lipd_contents(usr_path, remote_file_save):
+def __read_lipd_contents(files, usr_path, remote_file_save, workers=1, lazy=False, as_numpy=False, csv_engine="auto",
+                         cache=None, memory_cache=None):
     """
     Use the file metadata to read in the LiPD file contents as a dataset library
 
+    :param list files: File metadata for each LiPD file
+    :param str usr_path: Path to file / directory
+    :param bool remote_file_save: Keep the local copy of a file downloaded from a URL
+    :param int workers: Number of processes used to read multiple files
+    :param bool lazy: Defer reading table values until they are accessed
+    :param bool as_numpy: Store numeric column values as numpy arrays
+    :param str csv_engine: CSV parser
+    :param obj cache: DiskCache of processed datasets, or None
+    :param obj memory_cache: MemoryCache of processed datasets, or None
     :return dict: Metadata
     """
-    global files, settings
+    global settings
     _d = {}
     try:
         # Read in one file, set data directly into dictionary
-        if len(files[".lpd"]) == 1:
-            _d = lipd_read(files[".lpd"][0]["full_path"])
+        if len(files) == 1:
+            _d = lipd_read(files[0]["full_path"], lazy, as_numpy, csv_engine, cache, memory_cache,
+                           settings["track_changes"])
             # Remove any files that were downloaded remotely and user doesn't want to save
             is_url = re.match(re_url, usr_path)
             if not remote_file_save and is_url:
                 try:
-                    os.remove(files[".lpd"][0]["full_path"])
+                    os.remove(files[0]["full_path"])
                 except FileNotFoundError:
                     print("Unable to delete locally saved remote file")
             if settings["verbose"]:
                 print("Finished read: 1 record")
         # Read in multiple files, organize data by dataSetName (one extra layer)
         else:
-            for file in files[".lpd"]:
-                _contents = lipd_read(file["full_path"])
-                _d[_contents["dataSetName"]] = _contents
+            _d, _errors = lipd_read_batch([file["full_path"] for file in files], workers, lazy, as_numpy, csv_engine,
+                                          cache, memory_cache, settings["track_changes"])
+            # One bad file shouldn't lose the whole batch. Report the files that failed.
+            for _path, _error in _errors.items():
+                print("Error: read_lipd_contents: {}: {}".format(print_filename(_path), _error))
             if settings["verbose"]:
                 print("Finished read: {} records".format(len(_d)))
+                if _errors:
+                    print("Unable to read: {} records".format(len(_errors)))
     except Exception as e:
         print("Error: read_lipd_contents: {}".format(e))
     return _d
 
 
+def __get_cache(cache=None):
+    """
+    Get the on-disk cache of processed datasets, if it's turned on.
+
+    :param bool cache: Use the cache. None uses settings["cache"].
+    :return obj: DiskCache, or None
+    """
+    global settings
+    if cache is None:
+        cache = settings["cache"]
+    if cache:
+        return DiskCache(settings["cache_dir"], settings["cache_max_bytes"])
+    return None
+
+
+def __get_memory_cache():
+    """
+    Get the memory cache of processed datasets, sized from settings["memory_cache_size"], if it's turned on.
+
+    :return obj: MemoryCache, or None
+    """
+    global settings
+    memory_cache.max_size = settings["memory_cache_size"]
+    if memory_cache.max_size:
+        return memory_cache
+    # Turned off. Let go of anything it still holds.
+    memory_cache.clear()
+    return None
+
+
 def __read_file(usr_path, file_type):
     """
     Universal read file. Given a path and a type, it will do the appropriate read actions
 
     :param str usr_path: Path to file
     :param str file_type: One of approved file types: xls, xlsx, txt, lpd
-    :return none:
+    :return list: File metadata for each file
     """
-    global files
+    _files = []
 
     # no path provided. start gui browse
     if not usr_path:
@@ -1037,13 +1415,13 @@ def __read_file(usr_path, file_type):
         # check if src_files is a list of multiple files
         if src_files:
             for file_path in src_files:
-                __universal_read(file_path, file_type)
+                _files.append(__universal_read(file_path, file_type))
         else:
             print("No file(s) chosen")
     else:
-        __universal_read(usr_path, file_type)
+        _files.append(__universal_read(usr_path, file_type))
 
-    return
+    return [i for i in _files if i]
 
 
 def __read_directory(usr_path, file_type):
@@ -1052,8 +1430,9 @@ def __read_directory(usr_path, file_type):
 
     :param str usr_path: Path to directory
     :param str file_type: .xls, .xlsx, .txt, .lpd
-    :return none:
+    :return list: File metadata for each file
     """
+    _files = []
     # no path provided. start gui browse
     if not usr_path:
         # got dir path
@@ -1075,22 +1454,25 @@ def __read_directory(usr_path, file_type):
         # Loop for each file found
         for file_path in files_found:
             # Call read lipd for each file found
-            __read_file(file_path, file_type)
+            _files += __read_file(file_path, file_type)
     else:
         print("Directory path is not valid: {}".format(usr_path))
-    return
+    return _files
 
 
-def __write_lipd(dat, usr_path):
+def __write_lipd(dat, usr_path, precision=3, workers=1, compression="default"):
     """
     Write LiPD data to file, provided an output directory and dataset name.
 
     :param dict dat: Metadata
     :param str usr_path: Destination path
-    :param str dsn: Dataset name of one specific file to write
-    :return none:
+    :param int precision: Number of decimals to keep in the csv values
+    :param int workers: Number of processes used to write multiple files
+    :param str compression: Compression policy
+    :return dict: Report for each dataset name
     """
     global settings
+    _report = {}
     # no path provided. start gui browse
     if not usr_path:
         # got dir path
@@ -1098,29 +1480,23 @@ def __write_lipd(dat, usr_path):
     # Check if this is a valid directory path
     valid_path = path_type(usr_path, "directory")
     # If dir path is valid
-    if valid_path:
+    if valid_path and dat:
         # Filename is given, write out one file
         if "paleoData" in dat:
-            try:
-                if settings["verbose"]:
-                    print("writing: {}".format(dat["dataSetName"]))
-                lipd_write(dat, usr_path)
-            except KeyError as ke:
-                print("Error: Unable to write file: unknown, {}".format(ke))
-            except Exception as e:
-                print("Error: Unable to write file: {}, {}".format(dat["dataSetName"], e))
+            _datasets = [(dat.get("dataSetName", "unknown"), dat)]
         # Filename is not given, write out whole library
         else:
-            if dat:
-                for name, lipd_dat in dat.items():
-                    try:
-                        if settings["verbose"]:
-                            print("writing: {}".format(name))
-                        lipd_write(lipd_dat, usr_path)
-                    except Exception as e:
-                        print("Error: Unable to write file: {}, {}".format(name, e))
-
-    return
+            _datasets = list(dat.items())
+        if settings["verbose"]:
+            for _name, _d in _datasets:
+                print("writing: {}".format(_name))
+        _report = lipd_write_batch(_datasets, usr_path, workers, precision, compression, settings["track_changes"])
+        if settings["verbose"]:
+            _errors = sum(1 for i in _report.values() if not i["success"])
+            print("Finished write: {} records".format(len(_report) - _errors))
+            if _errors:
+                print("Unable to write: {} records".format(_errors))
+    return _report
 
 
 def __disclaimer(opt=""):
@@ -1140,6 +1516,20 @@ def __disclaimer(opt=""):
     return
 
 
+def __get_files_dir(files, cwd):
+    """
+    Excel and NOAA conversions work inside the directory of the files that were loaded. Get that directory.
+
+    :param list files: File metadata for each file
+    :param str cwd: Current working directory, used when no files were loaded
+    :return str: Directory path
+    """
+    if files and files[-1]["dir"]:
+        cwd = files[-1]["dir"]
+        os.chdir(cwd)
+    return cwd
+
+
 def __move_to_cwd():
     global cwd
     os.chdir(cwd)
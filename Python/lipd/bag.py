@@ -1,10 +1,38 @@
 import bagit
+import datetime
+import hashlib
 from .loggers import create_logger
+try:
+    from importlib import metadata
+except ImportError:
+    # python < 3.8
+    metadata = None
 
 
 logger_bagit = create_logger('bag')
 
 
+def _get_lipd_version():
+    """
+    Version of the installed LiPD package. Looked up once, when this module is imported.
+    :return str: Version, or "unknown" when running from a checkout that isn't installed
+    """
+    try:
+        if metadata is not None:
+            return metadata.version("LiPD")
+        import pkg_resources
+        return pkg_resources.get_distribution("LiPD").version
+    except Exception:
+        return "unknown"
+
+
+# Bag-info entries written into every LiPD bag
+BAG_INFO = {'Name': 'LiPD Project', 'Reference': 'www.lipds.net', 'DOI-Resolved': 'True'}
+# Bag-Software-Agent of the bags that the LiPD writer makes itself (get_tag_files)
+BAG_SOFTWARE_AGENT = "LiPD utilities {} <https://github.com/nickmckay/LiPD-utilities>"
+LIPD_VERSION = _get_lipd_version()
+
+
 def create_bag(dir_bag):
     """
     Create a Bag out of given files.
@@ -27,6 +55,45 @@ def create_bag(dir_bag):
     return None
 
 
+def get_bag_files(payload, known=None, info=None):
+    """
+    Build the contents of the bagit tag files (bagit.txt, bag-info.txt, manifest-md5.txt, tagmanifest-md5.txt).
+    :param list payload: (path, bytes) for each payload file. Paths are relative to the bag root, i.e. "data/x.csv"
+    :param list known: (path, md5, size) for each payload file whose md5 is already known, and isn't in payload
+    :param dict info: More bag-info entries (optional)
+    :return list: (filename, bytes) for each tag file
+    """
+    known = known or []
+    _manifest = ["{}  {}\n".format(hashlib.md5(_data).hexdigest(), _path) for _path, _data in payload]
+    _manifest += ["{}  {}\n".format(_md5, _path) for _path, _md5, _size in known]
+    _bytes = sum(len(_data) for _path, _data in payload) + sum(_size for _path, _md5, _size in known)
+    _oxum = "{}.{}".format(_bytes, len(payload) + len(known))
+    return get_tag_files(_manifest, _oxum, info)
+
+
+def get_tag_files(manifest, oxum, info=None):
+    """
+    Build the bagit tag files from manifest lines that are already known.
+    :param list manifest: Lines of manifest-md5.txt, i.e. "<md5>  data/x.csv\n"
+    :param str oxum: Payload-Oxum value, "<total bytes>.<file count>"
+    :param dict info: More bag-info entries (optional)
+    :return list: (filename, bytes) for each tag file
+    """
+    _info = dict(BAG_INFO)
+    _info.update(info or {})
+    _info["Bag-Software-Agent"] = BAG_SOFTWARE_AGENT.format(LIPD_VERSION)
+    _info["Bagging-Date"] = datetime.date.strftime(datetime.date.today(), "%Y-%m-%d")
+    _info["Payload-Oxum"] = oxum
+    _files = [
+        ("bagit.txt", b"BagIt-Version: 0.97\nTag-File-Character-Encoding: UTF-8\n"),
+        ("bag-info.txt", "".join("{}: {}\n".format(k, _info[k]) for k in sorted(_info)).encode("utf-8")),
+        ("manifest-md5.txt", "".join(sorted(manifest, key=lambda i: i.split("  ", 1)[1])).encode("utf-8")),
+    ]
+    _tagmanifest = ["{}  {}\n".format(hashlib.md5(_data).hexdigest(), _filename) for _filename, _data in _files]
+    _files.append(("tagmanifest-md5.txt", "".join(_tagmanifest).encode("utf-8")))
+    return _files
+
+
 def open_bag(dir_bag):
     """
     Open Bag at the given path
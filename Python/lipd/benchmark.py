@@ -0,0 +1,185 @@
+import csv
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter as clock
+
+import numpy as np
+
+from .csvs import get_csv_from_metadata, write_csv_to_file, _reorder_csv
+from .lipd_io import lipd_read, _lipd_write
+from .loggers import log_benchmark
+from .misc import decimal_precision, get_dsn
+from .tracking import put_sources
+from .zips import COMPRESSION_POLICIES
+
+"""
+Benchmarks for the LiPD read / write internals. Compares the current code to the implementation that it replaced,
+and checks that both give the same output.
+
+Run from the command line:
+python -m lipd.benchmark /path/to/file.lpd
+"""
+
+
+def benchmark_csv_writer(D, precision=3, repeat=3):
+    """
+    Time the csv writer (one column at a time, bulk row writes) against the old writer (one row at a time, with
+    decimal_precision() on each row), for all the csv tables of one dataset.
+
+    :param dict D: Metadata
+    :param int precision: Number of decimals to keep
+    :param int repeat: Number of runs. The fastest run is kept.
+    :return dict: Seconds for each writer, and whether the files match
+    """
+    _d, _csvs = get_csv_from_metadata(get_dsn(D), D)
+    _dir = tempfile.mkdtemp()
+    try:
+        _dir_new = os.path.join(_dir, "new")
+        _dir_old = os.path.join(_dir, "old")
+        os.makedirs(_dir_new)
+        os.makedirs(_dir_old)
+        _new = _time(lambda: write_csv_to_file(_csvs, _dir_new, precision), repeat)
+        _old = _time(lambda: _write_csv_rows(_csvs, _dir_old, precision), repeat)
+        _same = all(_read_bytes(_dir_new, _filename) == _read_bytes(_dir_old, _filename) for _filename in _csvs)
+    finally:
+        shutil.rmtree(_dir, ignore_errors=True)
+    return {"files": len(_csvs), "new": _new, "old": _old, "same": _same}
+
+
+def benchmark_compression(D, policies=None, repeat=3):
+    """
+    Time writing and reading one dataset with each compression policy, and report the file size each one gives.
+    Every write formats and compresses all the tables. Copies of unchanged tables are turned off for the benchmark.
+
+    :param dict D: Metadata
+    :param list policies: Compression policies to run (optional, default: all of COMPRESSION_POLICIES)
+    :param int repeat: Number of runs. The fastest run is kept.
+    :return dict: For each policy: seconds to write, seconds to read, and file size in bytes
+    """
+    _dsn = get_dsn(D)
+    _results = {}
+    _dir = tempfile.mkdtemp()
+    try:
+        for _policy in policies or list(COMPRESSION_POLICIES):
+            _path = os.path.join(_dir, _dsn + ".lpd")
+
+            def _write():
+                put_sources(_dsn, {})
+                _lipd_write(D, _dir, compression=_policy)
+
+            _write_time = _time(_write, repeat)
+            _read_time = _time(lambda: lipd_read(_path), repeat)
+            _results[_policy] = {"write": _write_time, "read": _read_time, "size": os.path.getsize(_path)}
+    finally:
+        put_sources(_dsn, {})
+        shutil.rmtree(_dir, ignore_errors=True)
+    return _results
+
+
+def synthetic_dataset(rows=100000, columns=10, seed=0):
+    """
+    Make a dataset with one large paleo measurement table of random values, to benchmark large records with.
+
+    :param int rows: Number of rows
+    :param int columns: Number of columns, including depth
+    :param int seed: Random seed
+    :return dict: Metadata
+    """
+    _random = np.random.RandomState(seed)
+    _columns = {"depth": {"number": 1, "variableName": "depth", "units": "cm",
+                          "values": list(np.arange(rows, dtype=float) * 0.5)}}
+    for _i in range(1, columns):
+        _name = "var{}".format(_i)
+        _columns[_name] = {"number": _i + 1, "variableName": _name, "units": "unitless",
+                           "values": list(np.round(_random.normal(0, 1, rows), 6))}
+    _table = {"tableName": "paleo0measurement0", "filename": "synthetic.paleo0measurement0.csv",
+              "missingValue": "nan", "columns": _columns}
+    return {"dataSetName": "synthetic{}x{}".format(rows, columns), "lipdVersion": 1.3,
+            "archiveType": "marine sediment", "createdBy": "benchmark",
+            "paleoData": {"paleo0": {"measurementTable": {"paleo0measurement0": _table}}}}
+
+
+def _print_compression(label, results):
+    """
+    Print the compression benchmark results for one dataset.
+
+    :param str label: Dataset label
+    :param dict results: Results from benchmark_compression()
+    :return none:
+    """
+    print("compression: {}".format(label))
+    print("{:<10}{:>12}{:>12}{:>14}".format("policy", "write (s)", "read (s)", "size (bytes)"))
+    for _policy, _result in results.items():
+        print("{:<10}{:>12.4f}{:>12.4f}{:>14}".format(_policy, _result["write"], _result["read"], _result["size"]))
+    return
+
+
+def _write_csv_rows(d, path, precision=3):
+    """
+    The old csv writer. Zip the columns into rows, and round the values one row at a time.
+
+    :param dict d: Csv data
+    :param str path: Target directory
+    :param int precision: Number of decimals to keep
+    :return none:
+    """
+    for filename, data in d.items():
+        rows = zip(*_reorder_csv(data, filename))
+        with open(os.path.join(path, filename), 'w+') as f:
+            w = csv.writer(f)
+            for row in rows:
+                w.writerow(decimal_precision(row, precision))
+    return
+
+
+def _time(fn, repeat=3):
+    """
+    Run a function a few times, and keep the fastest time.
+
+    :param func fn: Function to time
+    :param int repeat: Number of runs
+    :return float: Seconds
+    """
+    _best = None
+    for _ in range(max(1, repeat)):
+        start = clock()
+        fn()
+        end = clock()
+        if _best is None or end - start < _best:
+            _best = end - start
+    return _best
+
+
+def _read_bytes(path, filename):
+    with open(os.path.join(path, filename), "rb") as f:
+        return f.read()
+
+
+def main(args=None):
+    """
+    Run the benchmarks on a LiPD file, and print the results.
+
+    :param list args: Command line arguments: path to a LiPD file
+    :return none:
+    """
+    args = sys.argv[1:] if args is None else args
+    if not args:
+        print("Usage: python -m lipd.benchmark /path/to/file.lpd")
+        return
+    D = lipd_read(args[0])
+    if not D:
+        return
+    _results = benchmark_csv_writer(D)
+    print(log_benchmark("write_csv_to_file", 0, _results["new"]))
+    print(log_benchmark("write_csv_rows (old)", 0, _results["old"]))
+    print("csv files: {}, same output: {}".format(_results["files"], _results["same"]))
+    _print_compression(os.path.basename(args[0]), benchmark_compression(D))
+    for _rows in (10000, 100000):
+        _print_compression("synthetic {} rows".format(_rows), benchmark_compression(synthetic_dataset(_rows), repeat=1))
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .directory import open_tmp_sibling, rm_file_if_exists
+from .loggers import create_logger
+from .tracking import get_sources, put_sources
+
+logger_cache = create_logger("cache")
+
+"""
+Caches of fully processed LiPD datasets, so that reading the same file again skips the unzip, json parse, version
+update, TSids, csv parse, and inferred data.
+
+DiskCache pickles each dataset into a cache directory. Loading a pickle can run code, so the cache directory must only
+be writable by the user who reads it. It is made with mode 0700. A directory that belongs to another user, or that
+others can write to, is never loaded from or written to, and neither is an entry that belongs to another user. Entries are keyed by the sha256 of the LiPD file contents, the
+read options, and the version of this library. An edited file, or an upgraded library, gets a new key, and its old
+entries are evicted in time. When the entries add up to more than the size limit, the least recently used entries are
+removed first.
+
+MemoryCache keeps the most recently read datasets in this process, keyed by path, size, and mtime. Every hit hands
+out a fresh copy of the dicts and lists, so a caller that changes its dataset never changes the cached one. numpy
+arrays are handed out as read-only views. Copy an array to change it.
+"""
+
+# Bump when the processed output of a read changes, so that entries from older code are never used
+CACHE_FORMAT = 3
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".lipd", "cache")
+# Total size of the cache entries, in bytes
+DEFAULT_MAX_BYTES = 2 ** 30
+# Permissions of a new cache directory. Only its owner can read or change its entries.
+DIR_MODE = 0o700
+# Protocol 5 (python 3.8+) stores large numpy arrays without an extra copy. Older pythons use their newest protocol.
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+# Cache entry extension. Temp files left by a killed write don't end in it, and are never read.
+EXT = ".pkl"
+
+# Most file hashes remembered. The oldest are forgotten first.
+MAX_HASHES = 20000
+
+# Content hash of each file, keyed by (path, size, mtime). Saves hashing a file again when it hasn't changed.
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+_library_version = ""
+# Cache directories found unsafe, so the warning is only shown once for each
+_unsafe_dirs = set()
+# Default number of datasets that the memory cache keeps. 0 turns it off.
+DEFAULT_MEMORY_SIZE = 0
+# Values that can't be changed in place, so copies of a dataset can share them
+SCALAR_TYPES = {str, int, float, bool, type(None)}
+
+
+class DiskCache(object):
+    """
+    Cache of processed LiPD datasets in one directory. Holds only the settings, so it can be handed to worker
+    processes, and more than one process can use the same directory.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def get_key(self, path, as_numpy=False, csv_engine="auto"):
+        """
+        Cache key for one LiPD file and read options.
+
+        :param str path: Source path
+        :param bool as_numpy: Read option
+        :param str csv_engine: Read option
+        :return str: Key
+        :return tuple: (size, mtime) of the source file when it was hashed
+        """
+        _stat = os.stat(path)
+        _sha = _get_file_hash(path, _stat)
+        _key = "|".join([_sha, _get_library_version(), str(CACHE_FORMAT), str(bool(as_numpy)), csv_engine])
+        return hashlib.sha256(_key.encode("utf-8")).hexdigest(), (_stat.st_size, _stat.st_mtime_ns)
+
+    def load(self, path, key):
+        """
+        Load a dataset from the cache. The tracked table sources are restored too, so unchanged tables are still
+        copied as they are when the dataset is written.
+
+        :param str path: Source path
+        :param str key: Cache key
+        :return dict: Metadata, or empty dict when the key isn't cached
+        """
+        _entry_path = os.path.join(self.path, key + EXT)
+        try:
+            if not self._is_safe():
+                return {}
+            with open(_entry_path, "rb") as f:
+                if not _is_owner(os.fstat(f.fileno())):
+                    raise ValueError("entry belongs to another user")
+                _entry = pickle.load(f)
+            D = _entry["D"]
+            _stat = os.stat(path)
+            put_sources(D["dataSetName"], {_fingerprint: (path, _stat.st_size, _stat.st_mtime_ns) + _source
+                                           for _fingerprint, _source in _entry["sources"].items()})
+            # Mark the entry as recently used
+            os.utime(_entry_path)
+            return D
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            # A broken entry is only a miss. Remove it, and read the file again.
+            logger_cache.info("load: {}, {}".format(_entry_path, e))
+            self._remove(_entry_path)
+        return {}
+
+    def save(self, path, key, stat, D):
+        """
+        Save a dataset that was just read into the cache, and evict old entries if the cache is too big.
+
+        :param str path: Source path
+        :param str key: Cache key
+        :param tuple stat: (size, mtime) of the source file when the key was made
+        :param dict D: Metadata
+        :return none:
+        """
+        try:
+            _stat = os.stat(path)
+            # The file changed while it was read. The data may not match the key.
+            if (_stat.st_size, _stat.st_mtime_ns) != stat:
+                return
+            os.makedirs(self.path, mode=DIR_MODE, exist_ok=True)
+            if not self._is_safe():
+                return
+            # (member, crc, precision) of each table. The path, size, and mtime are the file's on load.
+            _sources = {_fingerprint: _source[3:] for _fingerprint, _source in get_sources(D["dataSetName"]).items()
+                        if _source[0] == path}
+            _data = pickle.dumps({"D": D, "sources": _sources}, protocol=PICKLE_PROTOCOL)
+            if len(_data) <= self.max_bytes:
+                self._write(key, _data)
+            self.evict()
+        except Exception as e:
+            logger_cache.info("save: {}, {}".format(path, e))
+        return
+
+    def _write(self, key, data):
+        """
+        Write one cache entry. The entry is swapped into place, so other processes never load a partial entry.
+
+        :param str key: Cache key
+        :param bytes data: Pickled entry
+        :return none:
+        """
+        _entry_path = os.path.join(self.path, key + EXT)
+        _tmp, f = open_tmp_sibling(_entry_path)
+        try:
+            with f:
+                f.write(data)
+            os.replace(_tmp, _entry_path)
+        except BaseException:
+            rm_file_if_exists("", _tmp)
+            raise
+        return
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its size limit.
+
+        :return none:
+        """
+        _entries = self._list()
+        _total = sum(_size for _mtime, _size, _entry_path in _entries)
+        for _mtime, _size, _entry_path in sorted(_entries):
+            if _total <= self.max_bytes:
+                break
+            self._remove(_entry_path)
+            _total -= _size
+        return
+
+    def clear(self):
+        """
+        Remove all the entries in the cache.
+
+        :return none:
+        """
+        for _mtime, _size, _entry_path in self._list():
+            self._remove(_entry_path)
+        return
+
+    def size(self):
+        """
+        Total size of the entries in the cache.
+
+        :return int: Bytes
+        """
+        return sum(_size for _mtime, _size, _entry_path in self._list())
+
+    def _is_safe(self):
+        """
+        Is the cache directory safe to load pickles from? It must belong to this user, and no one else can write to it.
+        A missing directory is safe. It is made with DIR_MODE when the first entry is saved.
+
+        :return bool:
+        """
+        try:
+            _stat = os.stat(self.path)
+            if _is_owner(_stat) and not _stat.st_mode & 0o022:
+                return True
+        except FileNotFoundError:
+            return True
+        if self.path not in _unsafe_dirs:
+            _unsafe_dirs.add(self.path)
+            print("Error: cache: {} belongs to another user, or others can write to it. It is not used. "
+                  "Set settings[\"cache_dir\"] to a directory of your own.".format(self.path))
+            logger_cache.error("is_safe: unsafe cache directory: {}".format(self.path))
+        return False
+
+    def _list(self):
+        """
+        List the cache entries.
+
+        :return list: (mtime, size, path) for each entry
+        """
+        _entries = []
+        try:
+            for _entry in os.scandir(self.path):
+                if _entry.name.endswith(EXT) and not _entry.name.startswith("."):
+                    try:
+                        _stat = _entry.stat()
+                        _entries.append((_stat.st_mtime_ns, _stat.st_size, _entry.path))
+                    except FileNotFoundError:
+                        # Removed by another process
+                        pass
+        except FileNotFoundError:
+            pass
+        return _entries
+
+    @staticmethod
+    def _remove(path):
+        """
+        Remove one cache entry. It may already be gone, removed by another process.
+
+        :param str path: Entry path
+        :return none:
+        """
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger_cache.info("remove: {}, {}".format(path, e))
+        return
+
+
+class MemoryCache(object):
+    """
+    Least recently used cache of processed LiPD datasets, in this process. Counts its hits and misses.
+    """
+
+    def __init__(self, max_size=DEFAULT_MEMORY_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_key(self, path, as_numpy=False, csv_engine="auto"):
+        """
+        Cache key for one LiPD file and read options.
+
+        :param str path: Source path
+        :param bool as_numpy: Read option
+        :param str csv_engine: Read option
+        :return tuple: Key
+        """
+        _stat = os.stat(path)
+        return os.path.abspath(path), _stat.st_size, _stat.st_mtime_ns, bool(as_numpy), csv_engine
+
+    def get(self, key):
+        """
+        Get a copy of a cached dataset. The tracked table sources are restored too, so unchanged tables are still
+        copied as they are when the dataset is written.
+
+        :param tuple key: Cache key
+        :return dict: Metadata, or empty dict when the key isn't cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return {}
+            self.hits += 1
+            self._entries.move_to_end(key)
+            D, _sources = self._entries[key]
+        put_sources(D["dataSetName"], _sources)
+        return copy_dataset(D)
+
+    def put(self, key, D):
+        """
+        Cache a dataset that was just read. The cache keeps its own copy of the dicts and lists, so the caller can
+        change the dataset it has.
+
+        :param tuple key: Cache key
+        :param dict D: Metadata
+        :return none:
+        """
+        if not self.max_size or not D:
+            return
+        try:
+            _stat = os.stat(key[0])
+            # The file changed while it was read. The data may not match the key.
+            if (_stat.st_size, _stat.st_mtime_ns) != key[1:3]:
+                return
+        except OSError:
+            return
+        _entry = (copy_dataset(D, read_only=False), get_sources(D["dataSetName"]))
+        with self._lock:
+            self._entries[key] = _entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return
+
+    def clear(self):
+        """
+        Remove all the cached datasets, and reset the counters.
+
+        :return none:
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        return
+
+    def info(self):
+        """
+        Cache statistics.
+
+        :return dict: hits, misses, size (datasets cached), max_size
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
+
+
+def copy_dataset(x, read_only=True):
+    """
+    (Recursive) Copy a dataset. Dicts and lists are copied, down to the column values. The values themselves are
+    numbers and strings, which can't be changed, so they are shared.
+
+    :param any x: Metadata
+    :param bool read_only: Hand out numpy arrays as read-only views. If False, arrays are copied.
+    :return any: Copy
+    """
+    if isinstance(x, dict):
+        _d = OrderedDict() if isinstance(x, OrderedDict) else {}
+        for k, v in x.items():
+            _d[k] = copy_dataset(v, read_only)
+        return _d
+    elif isinstance(x, list):
+        # Column values are flat lists. Copy them in one go, instead of one entry at a time.
+        if set(map(type, x)) <= SCALAR_TYPES:
+            return list(x)
+        return [copy_dataset(i, read_only) for i in x]
+    elif isinstance(x, np.ndarray):
+        if not read_only:
+            return x.copy()
+        _view = x.view()
+        _view.flags.writeable = False
+        return _view
+    return x
+
+
+def _is_owner(stat):
+    """
+    Does a file or directory belong to this user? Always true where there are no user ids (Windows).
+
+    :param obj stat: os.stat_result
+    :return bool:
+    """
+    return not hasattr(os, "getuid") or stat.st_uid == os.getuid()
+
+
+def _get_file_hash(path, stat):
+    """
+    Hash the contents of a file. The hash is kept for as long as the file's size and mtime stay the same.
+
+    :param str path: Source path
+    :param obj stat: os.stat() of the file
+    :return str: sha256
+    """
+    _id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hashes_lock:
+        if _id in _hashes:
+            return _hashes[_id]
+    _sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for _chunk in iter(lambda: f.read(1048576), b""):
+            _sha.update(_chunk)
+    with _hashes_lock:
+        _hashes[_id] = _sha.hexdigest()
+        while len(_hashes) > MAX_HASHES:
+            _hashes.popitem(last=False)
+    return _sha.hexdigest()
+
+
+def _get_library_version():
+    """
+    Hash the source code of this library. Any change to the code, such as an upgrade, gives a new version, and the
+    entries that older code made are never used again.
+
+    :return str: Version hash
+    """
+    global _library_version
+    if not _library_version:
+        _md5 = hashlib.md5()
+        _dir = os.path.dirname(os.path.abspath(__file__))
+        for _filename in sorted(os.listdir(_dir)):
+            if _filename.endswith(".py"):
+                with open(os.path.join(_dir, _filename), "rb") as f:
+                    _md5.update(_filename.encode("utf-8"))
+                    _md5.update(f.read())
+        _library_version = _md5.hexdigest()
+    return _library_version
+
+
+# One memory cache for the whole process
+memory_cache = MemoryCache()
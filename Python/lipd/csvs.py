@@ -1,43 +1,56 @@
+import codecs
 import csv
+import io
 import math
+import operator
+import os
 import sys
-import copy
+import warnings
 from collections import OrderedDict
 
+import numpy as np
+import pandas as pd
+
 from .directory import list_files
 from .loggers import create_logger
 from .inferred_data import get_inferred_data_table
-from .misc import cast_values_csvs, cast_int, get_missing_value_key, _replace_missing_values_table, rm_missing_values_table, is_ensemble, decimal_precision
+from .misc import cast_values_csvs, cast_values_array, cast_int, get_missing_value_key, _replace_missing_values_table, rm_missing_values_table, is_ensemble, decimal_precision_column, copy_metadata
 
 logger_csvs = create_logger("csvs")
 
+# CSV parsers that can be used to read csv files. See _read_csv_text()
+CSV_ENGINES = ["auto", "python", "numpy", "pandas"]
+# Bytes used to detect the csv file encoding
+ENCODING_SAMPLE_SIZE = 65536
+
 
 # MERGE - CSV w/ Metadata
 
 
-def merge_csv_metadata(d, csvs):
+def merge_csv_metadata(d, csvs, as_numpy=False):
     """
     Using the given metadata dictionary, retrieve CSV data from CSV files, and insert the CSV
     values into their respective metadata columns. Checks for both paleoData and chronData tables.
 
     :param dict d: Metadata
+    :param bool as_numpy: Store numeric column values as numpy arrays
     :return dict: Modified metadata dictionary
     """
     logger_csvs.info("enter merge_csv_metadata")
 
     # Add CSV to paleoData
     if "paleoData" in d:
-        d["paleoData"] = _merge_csv_section(d["paleoData"], "paleo", csvs)
+        d["paleoData"] = _merge_csv_section(d["paleoData"], "paleo", csvs, as_numpy)
 
     # Add CSV to chronData
     if "chronData" in d:
-        d["chronData"] = _merge_csv_section(d["chronData"], "chron", csvs)
+        d["chronData"] = _merge_csv_section(d["chronData"], "chron", csvs, as_numpy)
 
     logger_csvs.info("exit merge_csv_metadata")
     return d
 
 
-def _merge_csv_section(sections, pc, csvs):
+def _merge_csv_section(sections, pc, csvs, as_numpy=False):
     """
     Add csv data to all paleo data tables
 
@@ -51,10 +64,10 @@ def _merge_csv_section(sections, pc, csvs):
         for _name, _section in sections.items():
 
             if "measurementTable" in _section:
-                sections[_name]["measurementTable"] = _merge_csv_table(_section["measurementTable"], pc, csvs)
+                sections[_name]["measurementTable"] = _merge_csv_table(_section["measurementTable"], pc, csvs, as_numpy)
 
             if "model" in _section:
-                sections[_name]["model"] = _merge_csv_model(_section["model"], pc, csvs)
+                sections[_name]["model"] = _merge_csv_model(_section["model"], pc, csvs, as_numpy)
 
     except Exception as e:
         print("Error: There was an error merging CSV data into the metadata ")
@@ -64,7 +77,7 @@ def _merge_csv_section(sections, pc, csvs):
     return sections
 
 
-def _merge_csv_model(models, pc, csvs):
+def _merge_csv_model(models, pc, csvs, as_numpy=False):
     """
     Add csv data to each column in chron model
 
@@ -77,13 +90,13 @@ def _merge_csv_model(models, pc, csvs):
         for _name, _model in models.items():
 
             if "summaryTable" in _model:
-                models[_name]["summaryTable"] = _merge_csv_table(_model["summaryTable"], pc, csvs)
+                models[_name]["summaryTable"] = _merge_csv_table(_model["summaryTable"], pc, csvs, as_numpy)
 
             if "ensembleTable" in _model:
-                models[_name]["ensembleTable"] = _merge_csv_table(_model["ensembleTable"], pc, csvs)
+                models[_name]["ensembleTable"] = _merge_csv_table(_model["ensembleTable"], pc, csvs, as_numpy)
 
             if "distributionTable" in _model:
-                models[_name]["distributionTable"] = _merge_csv_table(_model["distributionTable"], pc, csvs)
+                models[_name]["distributionTable"] = _merge_csv_table(_model["distributionTable"], pc, csvs, as_numpy)
 
     except Exception as e:
         logger_csvs.error("merge_csv_model: {}",format(e))
@@ -92,42 +105,21 @@ def _merge_csv_model(models, pc, csvs):
     return models
 
 
-def _merge_csv_table(tables, pc, csvs):
+def _merge_csv_table(tables, pc, csvs, as_numpy=False):
 
     try:
 
         for _name, _table in tables.items():
             # Get the filename of this table
             filename = _get_filename(_table)
-            ensemble = False
             # If there's no filename, bypass whole process because there's no way to know which file to open
             if not filename:
                 print("Error: merge_csv_column: No filename found for table")
-            else:
-                # Call read_csv_to_columns for this filename. csv_data is list of lists.
-                _one_csv = csvs[filename]
-
-                # If all the data columns are non-numeric types, then a missing value is not necessary
-                _only_numerics = _is_numeric_data(_one_csv)
-
-                if not _only_numerics:
-                    # Get the Missing Value key from the table-level data
-                    _mv = get_missing_value_key(_table)
-                    if _mv:
-                        # Use the Missing Value key to replace all current missing values with "nan"
-                        _one_csv = _replace_missing_values_table(_one_csv, _mv)
-                    else:
-                        print("No missing value found. You may encounter errors with this data.")
-                # Merge the values into the columns
-                _table, ensemble = _merge_csv_column(_table, _one_csv)
-                # Remove and missing values keys that are at the column level
-                _table = rm_missing_values_table(_table)
-                # Now put the missing value as "nan" (standard)
-                _table["missingValue"] = "nan"
-
-            if not ensemble:
                 # calculate inferred data before leaving this section! paleo AND chron tables
                 _table = get_inferred_data_table(_table, pc)
+            else:
+                # Call read_csv_to_columns for this filename. csv_data is list of lists.
+                _table = merge_csv_table(_table, pc, csvs[filename], as_numpy)
 
             tables[_name] = _table
     except Exception as e:
@@ -137,6 +129,43 @@ def _merge_csv_table(tables, pc, csvs):
     return tables
 
 
+def merge_csv_table(table, pc, one_csv, as_numpy=False):
+    """
+    Merge the values of one csv file into its table metadata. Then calculate the inferred data for the table.
+
+    :param dict table: Table metadata
+    :param str pc: Paleo or Chron table type
+    :param list one_csv: Column values of the csv file (list of lists)
+    :param bool as_numpy: Store numeric column values as numpy arrays
+    :return dict: Table metadata with csv "values" entries
+    """
+    # If all the data columns are non-numeric types, then a missing value is not necessary
+    _only_numerics = _is_numeric_data(one_csv)
+
+    if not _only_numerics:
+        # Get the Missing Value key from the table-level data
+        _mv = get_missing_value_key(table)
+        if _mv:
+            # Use the Missing Value key to replace all current missing values with "nan"
+            one_csv = _replace_missing_values_table(one_csv, _mv)
+        else:
+            print("No missing value found. You may encounter errors with this data.")
+        if as_numpy:
+            # Columns that only had missing values mixed in are numeric now
+            one_csv = _get_numeric_columns(one_csv)
+    # Merge the values into the columns
+    table, ensemble = _merge_csv_column(table, one_csv)
+    # Remove and missing values keys that are at the column level
+    table = rm_missing_values_table(table)
+    # Now put the missing value as "nan" (standard)
+    table["missingValue"] = "nan"
+
+    if not ensemble:
+        # calculate inferred data before leaving this section! paleo AND chron tables
+        table = get_inferred_data_table(table, pc)
+    return table
+
+
 def _merge_csv_column(table, csvs):
     """
     Add csv data to each column in a list of columns
@@ -155,7 +184,7 @@ def _merge_csv_column(table, csvs):
             # realization columns
             if len(table["columns"]) == 1:
                 for _name, _column in table["columns"].items():
-                    _column["values"] = csvs
+                    _column["values"] = _get_ensemble_values(csvs)
             # depth column + realization columns
             elif len(table["columns"]) == 2:
                 _multi_column = False
@@ -170,7 +199,7 @@ def _merge_csv_column(table, csvs):
                                   "\tPlease manually fix the ensemble columns in 'metadata.jsonld' inside of your LiPD file.")
                         else:
                             _multi_column = True
-                            _column["values"] = csvs[2:]
+                            _column["values"] = _get_ensemble_values(csvs[2:])
         else:
             for _name, _column in table['columns'].items():
                 col_num = cast_int(_column["number"])
@@ -205,79 +234,322 @@ def read_csvs():
     return _l
 
 
-def read_csv_from_file(filename, encoding="utf-8"):
+def read_csv_from_file(filename, encoding=None, as_numpy=False, engine="auto"):
     """
     Opens the target CSV file and creates a dictionary with one list for each CSV column.
 
     :param str filename:
+    :param str encoding: File encoding (optional, default: detected from the file contents)
+    :param bool as_numpy: Parse numeric columns to numpy arrays
+    :param str engine: CSV engine. One of CSV_ENGINES
     :return list of lists: column values
     """
     logger_csvs.info("enter read_csv_from_file")
-    d = {}
     l = []
     try:
         logger_csvs.info("open file: {}".format(filename))
-        with open(filename, 'r', encoding=encoding) as f:
-            r = csv.reader(f, delimiter=',')
-
-            # Create a dict with X lists corresponding to X columns
-            for idx, col in enumerate(next(r)):
-                d[idx] = []
-                d = cast_values_csvs(d, idx, col)
-
-            # Start iter through CSV data
-            for row in r:
-                for idx, col in enumerate(row):
-                    # Append the cell to the correct column list
-                    d = cast_values_csvs(d, idx, col)
-
-        # Make a list of lists out of the dictionary instead
-        for idx, col in d.items():
-            l.append(col)
+        with open(filename, 'rb') as f:
+            _data = f.read()
+        l = read_csv_from_bytes(_data, filename, as_numpy, engine, encoding)
     except FileNotFoundError as e:
         print('CSV FileNotFound: ' + filename)
         logger_csvs.warn("read_csv_to_columns: FileNotFound: {}, {}".format(filename, e))
-    except UnicodeDecodeError:
+    except Exception as e:
+        logger_csvs.warn("read_csv_to_columns: Error: {}, {}".format(filename, e))
+
+    logger_csvs.info("exit read_csv_from_file")
+    return l
+
+
+def read_csvs_from_archive(z, members, as_numpy=False, engine="auto"):
+    """
+    Read csv members directly out of an open LiPD archive. Nothing is extracted to disk.
+
+    :param obj z: Open zipfile.ZipFile
+    :param list members: Member names of the csv files
+    :param bool as_numpy: Parse numeric columns to numpy arrays
+    :param str engine: CSV engine. One of CSV_ENGINES
+    :return dict: Column values, keyed by csv filename (no directory)
+    """
+    logger_csvs.info("enter read_csvs_from_archive")
+    _l = {}
+    for member in members:
+        _filename = member.rsplit("/", 1)[-1]
         try:
-            l = read_csv_from_file(filename, "ISO-8859-1")
+            _l[_filename] = read_csv_from_bytes(z.read(member), _filename, as_numpy, engine)
+        except Exception as e:
+            logger_csvs.warn("read_csvs_from_archive: {}, {}".format(member, e))
+    return _l
+
+
+def read_csv_from_bytes(data, filename="", as_numpy=False, engine="auto", encoding=None):
+    """
+    Creates a list of column values from csv file contents that are already in memory.
+
+    :param bytes data: Raw csv file contents
+    :param str filename: Filename, for error messages
+    :param bool as_numpy: Parse numeric columns to numpy arrays
+    :param str engine: CSV engine. One of CSV_ENGINES
+    :param str encoding: File encoding (optional, default: detected from the file contents)
+    :return list of lists: column values
+    """
+    l = []
+    try:
+        _text = _decode_csv(data, encoding)
+        # Same universal newline handling as reading the file from disk in text mode
+        _text = _text.replace("\r\n", "\n").replace("\r", "\n")
+        l = _read_csv_text(_text, as_numpy, engine)
+    except Exception as e:
+        logger_csvs.warn("read_csv_from_bytes: Error: {}, {}".format(filename, e))
+    return l
+
+
+def _decode_csv(data, encoding=None):
+    """
+    Decode csv file contents. Unless an encoding is given, it is picked once from a sample of the bytes: utf-8 if the
+    sample is valid utf-8, otherwise ISO-8859-1 (latin).
+
+    :param bytes data: Raw csv file contents
+    :param str encoding: File encoding (optional)
+    :return str: File contents
+    """
+    if not encoding:
+        try:
+            # An incremental decoder doesn't fail on a character that is cut off at the end of the sample
+            codecs.getincrementaldecoder("utf-8")().decode(data[:ENCODING_SAMPLE_SIZE], final=False)
+            encoding = "utf-8"
         except UnicodeDecodeError:
-            try:
-                l = read_csv_from_file(filename, 'latin')
-            except Exception as e:
-                logger_csvs.warn("read_csv_to_columns: UnicodeDecodeError: {}, {}".format(filename, e))
-                l = []
+            encoding = "ISO-8859-1"
+    try:
+        return data.decode(encoding)
+    except UnicodeDecodeError:
+        # Bad bytes past the sample. ISO-8859-1 maps every byte, so it can't fail.
+        logger_csvs.info("decode_csv: {} decode failed, using ISO-8859-1".format(encoding))
+        return data.decode("ISO-8859-1")
 
 
+def _read_csv_text(text, as_numpy=False, engine="auto"):
+    """
+    Parse csv file contents with the chosen engine. The numpy and pandas engines only take files that they are sure to
+    parse the same as the python engine. Anything else falls back to the python engine.
+
+    | auto: numpy for purely numeric files, python for everything else
+    | python: csv module, cast one cell at a time
+    | numpy: numpy.loadtxt. Purely numeric files only
+    | pandas: pandas.read_csv (C engine). Numeric and text columns
+
+    :param str text: File contents, with unix line endings
+    :param bool as_numpy: Parse numeric columns to numpy arrays
+    :param str engine: CSV engine. One of CSV_ENGINES
+    :return list of lists: column values
+    """
+    l = None
+    if engine in ["auto", "numpy"]:
+        l = _read_csv_numpy(text, as_numpy)
+    elif engine == "pandas":
+        l = _read_csv_pandas(text, as_numpy)
+    elif engine != "python":
+        logger_csvs.warn("read_csv_text: unknown csv engine: {}, using python".format(engine))
+    if l is None:
+        l = _read_csv_columns(io.StringIO(text), as_numpy)
+    return l
+
+
+def _read_csv_numpy(text, as_numpy=False):
+    """
+    numpy engine. Parse a purely numeric csv file in one step. The rows aren't checked beforehand: numpy.loadtxt
+    raises ValueError for anything that isn't one float in every cell of equally long rows (ragged rows, blank cells,
+    whitespace-only rows, text), and the file then goes to the python engine.
+
+    :param str text: File contents
+    :param bool as_numpy: Keep the columns as numpy arrays
+    :return list: column values, or None if the file isn't purely numeric
+    """
+    if not _is_plain_csv_text(text):
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            _arr = np.loadtxt(io.StringIO(text), delimiter=",", dtype=float, comments=None, ndmin=2)
+    except (ValueError, TypeError):
+        return None
+    if not _arr.size:
+        return None
+    if as_numpy:
+        return list(_arr.T.copy())
+    return [_col.tolist() for _col in _arr.T]
+
+
+def _read_csv_pandas(text, as_numpy=False):
+    """
+    pandas engine. Split the csv file with the pandas C parser, then cast each column in one step where possible.
+
+    :param str text: File contents
+    :param bool as_numpy: Parse numeric columns to numpy arrays
+    :return list: column values, or None if the file can't be parsed this way
+    """
+    if not _is_simple_csv(text):
+        return None
+    try:
+        # Keep every cell as the raw string. No NA detection, so blank and "NA" cells are handled the usual way later.
+        _df = pd.read_csv(io.StringIO(text), header=None, dtype=str, keep_default_na=False, na_filter=False,
+                          engine="c")
     except Exception as e:
-        logger_csvs.warn("read_csv_to_columns: Error: {}, {}".format(filename, e))
+        logger_csvs.info("read_csv_pandas: {}".format(e))
+        return None
+    return [_cast_column(_df[_name].tolist(), as_numpy) for _name in _df.columns]
 
 
-    logger_csvs.info("exit read_csv_from_file")
+def _is_simple_csv(text):
+    """
+    Can this csv file be handed to numpy or pandas? Every row has the same number of cells, and there is nothing
+    that those parsers treat differently than the csv module: quotes, whitespace-only rows, a blank first row,
+    a byte order mark, or NUL characters.
+
+    :param str text: File contents
+    :return bool:
+    """
+    if not _is_plain_csv_text(text):
+        return False
+    _lines = [_line for _line in text.split("\n") if _line]
+    if len({_line.count(",") for _line in _lines}) != 1:
+        return False
+    return not any(_line.isspace() for _line in _lines)
+
+
+def _is_plain_csv_text(text):
+    """
+    Quick checks over the whole text, without going through it line by line: no quotes, blank first row, byte order
+    mark, or NUL characters.
+
+    :param str text: File contents
+    :return bool:
+    """
+    return bool(text) and text[0] not in "\n\ufeff" and '"' not in text and "\x00" not in text
+
+
+def _read_csv_columns(f, as_numpy=False):
+    """
+    python engine. Parse csv rows from an open text stream into a list with one list for each CSV column.
+
+    :param obj f: Text stream
+    :param bool as_numpy: Parse numeric columns to numpy arrays. Non-numeric columns stay as lists.
+    :return list of lists: column values
+    """
+    d = {}
+    l = []
+    r = csv.reader(f, delimiter=',')
+
+    if as_numpy:
+        return _read_csv_arrays(r)
+
+    # Create a dict with X lists corresponding to X columns
+    for idx, col in enumerate(next(r)):
+        d[idx] = []
+        d = cast_values_csvs(d, idx, col)
+
+    # Start iter through CSV data
+    for row in r:
+        for idx, col in enumerate(row):
+            # Append the cell to the correct column list
+            d = cast_values_csvs(d, idx, col)
+
+    # Make a list of lists out of the dictionary instead
+    for idx, col in d.items():
+        l.append(col)
     return l
 
 
+def _read_csv_arrays(r):
+    """
+    Parse csv rows into columns, and cast each numeric column to a float array in one step, instead of one cell at a
+    time. Columns that have text in them are cast cell by cell, the same as the default reader.
+
+    :param obj r: csv reader
+    :return list: column values. numpy arrays and lists
+    """
+    _rows = list(r)
+    if not _rows:
+        return []
+    _count = len(_rows[0])
+    if all(len(_row) == _count for _row in _rows):
+        _columns = [list(map(operator.itemgetter(idx), _rows)) for idx in range(_count)]
+    else:
+        # Ragged rows. Fill the columns the slow way, so the values end up in the same places as the default reader.
+        # The first row sets the number of columns, and cells past it are dropped, the same as the default reader.
+        _columns = [[] for _ in range(_count)]
+        for _row in _rows:
+            for idx, col in enumerate(_row[:_count]):
+                _columns[idx].append(col)
+            if len(_row) > _count:
+                logger_csvs.warning("read_csv_arrays: dropped {} cells past column {}".format(len(_row) - _count, _count))
+    return [_cast_column(_col, True) for _col in _columns]
+
+
+def _cast_column(values, as_numpy=False):
+    """
+    Cast a column of csv strings in one step. If any cell isn't a number, cast one cell at a time instead, which
+    keeps the text cells as strings.
+
+    :param list values: Column values (str)
+    :param bool as_numpy: Numeric columns become numpy arrays, with NaN for blank cells
+    :return list: Column values
+    """
+    if as_numpy:
+        _values = cast_values_array(values)
+        if _values is not None:
+            return _values
+    else:
+        try:
+            return np.array(values, dtype=float).tolist()
+        except (ValueError, TypeError):
+            pass
+    d = {0: []}
+    for col in values:
+        d = cast_values_csvs(d, 0, col)
+    return d[0]
+
+
 # WRITE
 
 
-def write_csv_to_file(d):
+def write_csv_to_file(d, path="", precision=3):
     """
     Writes columns of data to a target CSV file.
+    Values are rounded one column at a time, and the rows are written in bulk.
 
     :param dict d: A dictionary containing one list for every data column. Keys: int, Values: list
+    :param str path: Target directory (defaults to the current working directory)
+    :param int precision: Number of decimals to keep
     :return None:
     """
     logger_csvs.info("enter write_csv_to_file")
+    for filename, data in get_csv_bytes(d, precision):
+        with open(os.path.join(path, filename), 'wb') as f:
+            f.write(data)
+    logger_csvs.info("exit write_csv_to_file")
+    return
+
 
+def get_csv_bytes(d, precision=3):
+    """
+    Build the contents of the CSV files in memory, as utf-8 encoded bytes.
+    Values are rounded one column at a time, and the rows are written in bulk.
+
+    :param dict d: A dictionary containing one list for every data column. Keys: int, Values: list
+    :param int precision: Number of decimals to keep
+    :return list: (filename, bytes) for each CSV file
+    """
+    _files = []
     try:
         for filename, data in d.items():
             try:
                 l_columns = _reorder_csv(data, filename)
-                rows = zip(*l_columns)
-                with open(filename, 'w+') as f:
-                    w = csv.writer(f)
-                    for row in rows:
-                        row2 = decimal_precision(row)
-                        w.writerow(row2)
+                rows = zip(*[decimal_precision_column(_col, precision) for _col in l_columns])
+                f = io.StringIO()
+                w = csv.writer(f)
+                w.writerows(rows)
+                _files.append((filename, f.getvalue().encode("utf-8")))
             except TypeError as e:
                 print("Error: Unable to write values to CSV file, {}:\n"
                       "(1) The data table may have 2 or more identical variables. Please correct the LiPD file manually\n"
@@ -287,25 +559,28 @@ def write_csv_to_file(d):
                 print("Error: CSV file not written, {}, {}:\n"
                       "The data table may have 2 or more identical variables. Please correct the LiPD file manually".format(filename, e))
     except AttributeError as e:
-        logger_csvs.error("write_csv_to_file: Unable to write CSV File: {}".format(e, exc_info=True))
-    logger_csvs.info("exit write_csv_to_file")
-    return
+        logger_csvs.error("get_csv_bytes: Unable to write CSV File: {}".format(e, exc_info=True))
+    return _files
 
 
 # GET
 
 
-def get_csv_from_metadata(dsn, d):
+def get_csv_from_metadata(dsn, d, copy=True):
     """
     Two goals. Get all csv from metadata, and return new metadata with generated filenames to match files.
+    The new metadata is a copy of the structure only. Its column values, and the csv values, are the same lists as
+    in the original metadata.
 
     :param str dsn: Dataset name
     :param dict d: Metadata
+    :param bool copy: Copy the metadata structure. If False, the filenames are set in the original metadata.
+    :return dict _d: Metadata
     :return dict _csvs: Csv
     """
     logger_csvs.info("enter get_csv_from_metadata")
     _csvs = OrderedDict()
-    _d = copy.deepcopy(d)
+    _d = copy_metadata(d) if copy else d
 
     try:
         if "paleoData" in _d:
@@ -323,13 +598,33 @@ def get_csv_from_metadata(dsn, d):
     return _d, _csvs
 
 
+def put_csv_filenames(dsn, d):
+    """
+    Align the table filenames with the csv filenames that get_csv_from_metadata generates. Works in place, without
+    copying the metadata or touching any column values.
+
+    :param str dsn: Dataset name
+    :param dict d: Metadata
+    :return dict d: Metadata
+    """
+    try:
+        if "paleoData" in d:
+            d["paleoData"], _ignore = _get_csv_from_section(d["paleoData"], "{}.paleo".format(dsn), None)
+        if "chronData" in d:
+            d["chronData"], _ignore = _get_csv_from_section(d["chronData"], "{}.chron".format(dsn), None)
+    except Exception as e:
+        print("Error: put_csv_filenames: {}, {}".format(dsn, e))
+        logger_csvs.error("put_csv_filenames: {}, {}".format(dsn, e))
+    return d
+
+
 def _get_csv_from_section(sections, crumbs, csvs):
     """
     Get table name, variable name, and column values from paleo metadata
 
     :param dict sections: Metadata
     :param str crumbs: Crumbs
-    :param dict csvs: Csv
+    :param dict csvs: Csv. If None, only the table filenames are set.
     :return dict sections: Metadata
     :return dict csvs: Csv
     """
@@ -391,7 +686,8 @@ def _get_csv_from_table(tables, crumbs, csvs):
             # Set the filename inside the metadata also, so our _csv and _meta will match
             _table = _put_filename(_table, filename)
             # Get a nested list of table values
-            csvs = _get_csv_from_columns(_table, filename, csvs)
+            if csvs is not None:
+                csvs = _get_csv_from_columns(_table, filename, csvs)
             tables[_name] = _table
             _idx += 1
     except Exception as e:
@@ -551,6 +847,20 @@ def _is_numeric_data(ll):
     """
     for l in ll:
         try:
+            if isinstance(l, np.ndarray):
+                # Float arrays can only hold numbers and NaN
+                if np.isnan(l).any():
+                    return False
+                continue
+            _types = set(map(type, l))
+            if _types <= {float}:
+                # All floats. Check for NaN in one step
+                if np.isnan(np.array(l, dtype=float)).any():
+                    return False
+                continue
+            if _types <= {float, str}:
+                # Floats and at least one string
+                return False
             if any(math.isnan(float(i)) or isinstance(i, str) for i in l):
                 return False
             # if not all(isinstance(i, (int, float)) or math.isnan(float(i)) for i in l):
@@ -563,6 +873,33 @@ def _is_numeric_data(ll):
     return True
 
 
+def _get_numeric_columns(ll):
+    """
+    Cast the columns that are fully numeric to float arrays. Any column with text in it stays a list.
+
+    :param list ll: Column values
+    :return list ll: Column values
+    """
+    for idx, l in enumerate(ll):
+        if not isinstance(l, np.ndarray):
+            _values = cast_values_array(l)
+            if _values is not None:
+                ll[idx] = _values
+    return ll
+
+
+def _get_ensemble_values(ll):
+    """
+    Ensemble columns that were all read as arrays are stacked into one 2D array, one row per csv column.
+
+    :param list ll: Column values
+    :return list or numpy.ndarray: Column values
+    """
+    if ll and all(isinstance(l, np.ndarray) and len(l) == len(ll[0]) for l in ll):
+        return np.vstack(ll)
+    return ll
+
+
 def _merge_ensemble(ensemble, col_nums, col_vals):
     """
     The second column is not typical.
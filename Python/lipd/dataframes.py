@@ -1,5 +1,6 @@
 import collections
 
+import numpy as np
 import pandas as pd
 
 from .regexes import re_pandas_x_num
@@ -141,6 +142,82 @@ def _plot_ts_cols(ts):
     return d
 
 
+def ts_to_table(ts):
+    """
+    Create a table from a time series. One row per time series entry, and one column per key. A key that an entry
+    doesn't have is <NA> in its row.
+    Columns that only hold strings, booleans, ints, or floats get a nullable pandas type. All other columns, like
+    "paleoData_values", "age", and "year", hold the entries' own lists (or numpy arrays). The values are not copied.
+
+    :param list ts: Time series
+    :return obj: Pandas DataFrame
+    """
+    logger_dataframes.info("enter ts_to_table")
+    _n = len(ts)
+    _columns = {}
+    for _idx, _tso in enumerate(ts):
+        for k, v in _tso.items():
+            try:
+                _columns[k][_idx] = v
+            except KeyError:
+                _columns[k] = [pd.NA] * _n
+                _columns[k][_idx] = v
+    _table = pd.DataFrame({k: _get_table_column(v) for k, v in _columns.items()}, index=pd.RangeIndex(_n),
+                          copy=False)
+    logger_dataframes.info("exit ts_to_table: {} rows, {} columns".format(_n, len(_columns)))
+    return _table
+
+
+def table_to_ts(table):
+    """
+    Create a time series from a table that ts_to_table() made (and that may since be filtered, sorted, or have new
+    columns). One entry per row, with the keys in column order. <NA> cells are left out of the entry.
+
+    :param obj table: Pandas DataFrame
+    :return list: Time series
+    """
+    logger_dataframes.info("enter table_to_ts")
+    _keys = list(table.columns)
+    # Nullable columns give <NA> for missing cells, and python scalars for all others
+    _columns = [table.iloc[:, _idx].to_numpy(dtype=object) for _idx in range(len(_keys))]
+    _ts = [{k: v for k, v in zip(_keys, _row) if v is not pd.NA} for _row in zip(*_columns)]
+    logger_dataframes.info("exit table_to_ts: {} entries".format(len(_ts)))
+    return _ts
+
+
+def _get_table_column(values):
+    """
+    Create one column of a time series table. Values of one scalar type get a nullable array, so that NaN stays a
+    value, apart from the <NA> of missing keys. Anything else is an object array that holds the values themselves.
+
+    :param list values: Column values, with pd.NA for missing keys
+    :return obj: Pandas extension array, or numpy object array
+    """
+    _mask = np.array([v is pd.NA for v in values], dtype=bool)
+    _types = {type(v) for v in values if v is not pd.NA}
+    if len(_types) == 1:
+        _type = _types.pop()
+        try:
+            if _type is str:
+                return pd.array(values, dtype="string")
+            elif _type is bool:
+                return pd.arrays.BooleanArray(np.array([v is True for v in values], dtype=bool), _mask)
+            elif _type is int:
+                return pd.arrays.IntegerArray(np.array([0 if v is pd.NA else v for v in values], dtype=np.int64),
+                                              _mask)
+            elif _type is float:
+                return pd.arrays.FloatingArray(np.array([0.0 if v is pd.NA else v for v in values],
+                                                        dtype=np.float64), _mask)
+        except OverflowError:
+            # Ints too large for int64. Keep them as they are.
+            pass
+    _column = np.empty(len(values), dtype=object)
+    # One at a time, so that lists are stored as they are, and not taken as more dimensions
+    for _idx, v in enumerate(values):
+        _column[_idx] = v
+    return _column
+
+
 def _get_dfs(csvs):
     """
     LiPD Version 1.2
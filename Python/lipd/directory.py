@@ -4,6 +4,7 @@ import shutil
 import ntpath
 import time
 import sys
+import uuid
 
 import subprocess
 from .loggers import create_logger
@@ -491,6 +492,40 @@ def rm_files_in_dir(path):
     return
 
 
+def open_tmp_sibling(path):
+    """
+    Create a new temp file next to a target file, and open it for writing. The name is hidden and ends in ".tmp", so
+    a temp file left behind by a killed process is never picked up as a LiPD file.
+    :param str path: Target file path
+    :return str: Temp file path
+    :return obj: Temp file, open for binary writing
+    """
+    _dir, _filename = os.path.split(path)
+    _tmp = os.path.join(_dir, ".{}.{}.tmp".format(_filename, uuid.uuid4().hex[:12]))
+    return _tmp, open(_tmp, "xb")
+
+
+def fsync_dir(path):
+    """
+    Flush a directory to disk, so that files renamed into it are still there after a crash.
+    Directories can't be opened on Windows, so this is skipped there.
+    :param str path: Directory
+    :return none:
+    """
+    try:
+        _fd = os.open(path or ".", os.O_RDONLY)
+    except OSError as e:
+        logger_directory.info("fsync_dir: {}, {}".format(path, e))
+        return
+    try:
+        os.fsync(_fd)
+    except OSError as e:
+        logger_directory.info("fsync_dir: {}, {}".format(path, e))
+    finally:
+        os.close(_fd)
+    return
+
+
 def rm_file_if_exists(path, filename):
     """
     Remove a file if it exists. Useful for when we want to write a file, but it already exists in that locaiton.
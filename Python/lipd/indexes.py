@@ -0,0 +1,285 @@
+import operator
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .loggers import create_logger
+from .query import OPERATORS, RANGE_OPERATORS, _MISSING, _build_test
+
+logger_indexes = create_logger("indexes")
+
+"""
+Secondary indexes over a time series, for running many queries on the same one. An index is made for a time series
+list once (by index_ts(), or by the first query that asks for one), and queries that ask for an index with index=True
+use it for that list from then on. Queries without index=True never look at it.
+
+Each key that a query uses is indexed the first time it is used: a hash of the entries for each text value, and the
+numbers sorted, with their entry positions. A comparison then finds its entries in O(log n + k), and "in" and "~="
+only look at each distinct text once. Values that are neither text nor a number (lists, booleans, ...) are few, and
+are checked one by one, the same as without an index.
+
+Before each search, the index checks that the list still holds the same entries, in the same order, that it indexed.
+Entries appended to the list are indexed then. If entries were replaced, removed, inserted, or sorted, the index is
+made again. Changes made inside an entry (a value set on the dict itself) are not seen. Make the index again after
+doing that.
+
+Lists can't be weakly referenced, so each index holds on to its list. Up to MAX_INDEXES lists are kept this way, until
+their index is dropped (drop_ts_index()), or pushed out by newer ones.
+"""
+
+# Most time series lists with an index. The oldest are dropped first.
+MAX_INDEXES = 16
+# Largest int that a float64 holds exactly. Larger ints are compared one by one.
+MAX_EXACT_INT = 2 ** 53
+
+# Index for each time series list, keyed by id(). Each index holds its list, so the id can't be reused meanwhile,
+# and the list stays in memory until the index is dropped.
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+class TsIndex(object):
+    """
+    Index over one time series list.
+    """
+
+    def __init__(self, ts, keys=None):
+        self.ts = ts
+        self.size = len(ts)
+        # The entries indexed, to check that the list still holds them
+        self._entries = list(ts)
+        self._keys = {}
+        # Spatial index, made by spatial.py the first time a spatial query runs on this time series
+        self.geo = None
+        for _key in keys or []:
+            self._get_key_index(_key)
+
+    def update(self):
+        """
+        Catch up with the time series list. Appended entries are added to the key indexes. If the entries that were
+        indexed aren't all still there, in the same positions, the key indexes are made again.
+
+        :return none:
+        """
+        if len(self.ts) < self.size or any(map(operator.is_not, self.ts, self._entries)):
+            logger_indexes.info("update: time series entries changed, rebuilding")
+            self.size = len(self.ts)
+            self._entries = list(self.ts)
+            self._keys = {_key: _KeyIndex(_key, self.ts) for _key in self._keys}
+            self.geo = None
+        elif len(self.ts) > self.size:
+            for _key_index in self._keys.values():
+                _key_index.add(self.ts, self.size)
+            self._entries.extend(self.ts[self.size:])
+            self.size = len(self.ts)
+        return
+
+    def search(self, query):
+        """
+        Find the entries that match a query.
+
+        :param obj query: Query
+        :return list: Indices of the matched entries, in order
+        """
+        self.update()
+        return self._search(query.plan).tolist()
+
+    def _search(self, plan):
+        """
+        Find the entries that match a plan node.
+
+        :param tuple plan: Plan node
+        :return obj: Numpy array of entry positions, sorted
+        """
+        _kind = plan[0]
+        if _kind == "and":
+            _results = sorted((self._search(i) for i in plan[1]), key=len)
+            _result = _results[0]
+            for _other in _results[1:]:
+                _result = np.intersect1d(_result, _other, assume_unique=True)
+            return _result
+        elif _kind == "or":
+            _result = self._search(plan[1][0])
+            for _node in plan[1][1:]:
+                _result = np.union1d(_result, self._search(_node))
+            return _result
+        elif _kind == "not":
+            return np.setdiff1d(np.arange(self.size), self._search(plan[1]), assume_unique=True)
+        return self._get_key_index(plan[1]).search(plan, self.ts)
+
+    def _get_key_index(self, key):
+        """
+        Get the index of one key. Made the first time the key is used.
+
+        :param str key: Time series key
+        :return obj: Key index
+        """
+        if key not in self._keys:
+            self._keys[key] = _KeyIndex(key, self.ts)
+        return self._keys[key]
+
+
+class _KeyIndex(object):
+    """
+    Index of the values of one key: entry positions for each text value, sorted numbers with their entry positions,
+    and the positions of all other values.
+    """
+
+    def __init__(self, key, ts):
+        self.key = key
+        self.strings = {}
+        self.numbers = np.empty(0, dtype=np.float64)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.others = []
+        self.add(ts, 0)
+
+    def add(self, ts, start):
+        """
+        Add entries to the index.
+
+        :param list ts: Time series
+        :param int start: Position of the first entry to add
+        :return none:
+        """
+        _numbers = []
+        _positions = []
+        for _idx in range(start, len(ts)):
+            v = ts[_idx].get(self.key, _MISSING)
+            if v is _MISSING:
+                continue
+            elif v.__class__ is str:
+                try:
+                    self.strings[v].append(_idx)
+                except KeyError:
+                    self.strings[v] = [_idx]
+            elif v.__class__ is float:
+                # NaN compares false with everything. Leave it out.
+                if v == v:
+                    _numbers.append(v)
+                    _positions.append(_idx)
+            elif v.__class__ is int and -MAX_EXACT_INT <= v <= MAX_EXACT_INT:
+                _numbers.append(v)
+                _positions.append(_idx)
+            else:
+                self.others.append(_idx)
+        if _numbers:
+            _numbers = np.array(_numbers, dtype=np.float64)
+            _positions = np.array(_positions, dtype=np.int64)
+            _order = np.argsort(_numbers, kind="stable")
+            _numbers, _positions = _numbers[_order], _positions[_order]
+            _at = np.searchsorted(self.numbers, _numbers, side="right")
+            self.numbers = np.insert(self.numbers, _at, _numbers)
+            self.positions = np.insert(self.positions, _at, _positions)
+        return
+
+    def search(self, plan, ts):
+        """
+        Find the entries whose value matches a comparison (or range) node.
+
+        :param tuple plan: "leaf" or "range" node, on this key
+        :param list ts: Time series
+        :return obj: Numpy array of entry positions, sorted
+        """
+        _parts = [self._search_numbers(plan), self._search_strings(plan)]
+        if self.others:
+            _test = _build_test(plan)
+            _parts.append(np.array([_idx for _idx in self.others if _test(ts[_idx][self.key])], dtype=np.int64))
+        return np.sort(np.concatenate(_parts))
+
+    def _search_numbers(self, plan):
+        """
+        Find the numbers that match. Only a number (or a range of numbers) can match a number.
+
+        :param tuple plan: "leaf" or "range" node
+        :return obj: Numpy array of entry positions
+        """
+        if plan[0] == "range":
+            _bounds = plan[2]
+        elif isinstance(plan[3], float) and (plan[2] in OPERATORS or plan[2] == "~="):
+            _bounds = [(plan[2], plan[3])] if plan[2] in RANGE_OPERATORS else \
+                [(">=", plan[3]), ("<=", plan[3])]
+        else:
+            return np.empty(0, dtype=np.int64)
+        _lo = 0
+        _hi = len(self.numbers)
+        for _op, _cut in _bounds:
+            if _cut != _cut:
+                # NaN
+                return np.empty(0, dtype=np.int64)
+            if _op == ">":
+                _lo = max(_lo, np.searchsorted(self.numbers, _cut, side="right"))
+            elif _op == ">=":
+                _lo = max(_lo, np.searchsorted(self.numbers, _cut, side="left"))
+            elif _op == "<":
+                _hi = min(_hi, np.searchsorted(self.numbers, _cut, side="left"))
+            elif _op == "<=":
+                _hi = min(_hi, np.searchsorted(self.numbers, _cut, side="right"))
+        return self.positions[_lo:max(_lo, _hi)]
+
+    def _search_strings(self, plan):
+        """
+        Find the text values that match. Only text can match text. Equality is one lookup, and the other comparisons
+        look at each distinct text once.
+
+        :param tuple plan: "leaf" or "range" node
+        :return obj: Numpy array of entry positions
+        """
+        if plan[0] == "range" or not isinstance(plan[3], str):
+            return np.empty(0, dtype=np.int64)
+        if plan[2] == "=":
+            return np.array(self.strings.get(plan[3], []), dtype=np.int64)
+        _test = _build_test(plan)
+        _positions = []
+        for _value, _idxs in self.strings.items():
+            if _test(_value):
+                _positions.extend(_idxs)
+        return np.array(_positions, dtype=np.int64)
+
+
+def index_ts(ts, keys=None):
+    """
+    Make an index for a time series list, and keep it, so that queries on the list use it.
+
+    :param list ts: Time series
+    :param list keys: Keys to index now. Other keys are indexed when a query first uses them.
+    :return obj: TsIndex
+    """
+    _index = TsIndex(ts, keys)
+    with _lock:
+        _indexes[id(ts)] = _index
+        _indexes.move_to_end(id(ts))
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return _index
+
+
+def get_ts_index(ts):
+    """
+    Get the index of a time series list. One is made if the list has none.
+
+    :param list ts: Time series
+    :return obj: TsIndex, or None if ts isn't a list
+    """
+    if not isinstance(ts, list):
+        return None
+    with _lock:
+        _index = _indexes.get(id(ts))
+        if _index is not None and _index.ts is ts:
+            _indexes.move_to_end(id(ts))
+            return _index
+    return index_ts(ts)
+
+
+def drop_ts_index(ts):
+    """
+    Drop the index of a time series list.
+
+    :param list ts: Time series
+    :return none:
+    """
+    with _lock:
+        _index = _indexes.get(id(ts))
+        if _index is not None and _index.ts is ts:
+            del _indexes[id(ts)]
+    return
@@ -68,7 +68,7 @@ def _get_age(columns):
             age = columns["yrbp"]["values"]
 
         # Step 2 No exact matches, check for an "inferredVariableType" : "Age" or "Year"
-        if not age:
+        if len(age) == 0:
             # Loop through column variableNames
             for k, v in columns.items():
                 try:
@@ -81,7 +81,7 @@ def _get_age(columns):
                     pass
 
         # Step 3: No year or age found, start searching for a loose match with "age" or "year" in the variableName.
-        if not age:
+        if len(age) == 0:
             # Loop through column variableNames
             for k, v in columns.items():
                 k_low = k.lower()
@@ -268,8 +268,8 @@ def get_inferred_data_table(table, pc):
         age = _get_age(table["columns"])
 
     try:
-        # If age values were not found, then skip resolution.
-        if age:
+        # If age values were not found, then skip resolution. (Values may be a list or a numpy array)
+        if age is not None and len(age) != 0:
             # Loop for all the columns in the table
             for var, col in table["columns"].items():
                 # Special cases
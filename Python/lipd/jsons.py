@@ -4,6 +4,7 @@ from .regexes import re_ensemble_collapse
 
 import json
 import demjson3
+import numpy as np
 from collections import OrderedDict
 import os
 import re
@@ -29,14 +30,14 @@ def read_jsonld():
 		if _filename:
 			try:
 				# Load and decode
-				_d = demjson3.decode_file(_filename, decode_float=float)
+				_d = _decode_json(_read_file_bytes(_filename))
 				logger_jsons.info("Read JSONLD successful: {}".format(_filename))
 			except FileNotFoundError as fnf:
 				print("Error: metadata file not found: {}".format(_filename))
 				logger_jsons.error("read_jsonld: FileNotFound: {}, {}".format(_filename, fnf))
 			except Exception:
 				try:
-					_d = demjson3.decode_file(_filename, decode_float=float, encoding="latin-1")
+					_d = _decode_json(_read_file_bytes(_filename), encoding="latin-1")
 					logger_jsons.info("Read JSONLD successful: {}".format(_filename))
 				except Exception as e:
 					print("Error: unable to read metadata file: {}".format(e))
@@ -50,6 +51,28 @@ def read_jsonld():
 	return _d
 
 
+def read_jsonld_from_bytes(data, filename="metadata.jsonld"):
+	"""
+	Decode jsonld data that has already been read into memory (i.e. straight from a LiPD archive member)
+	:param bytes data: Raw jsonld file contents
+	:param str filename: Filename, for error messages
+	:return dict: Jsonld data
+	"""
+	_d = {}
+	try:
+		# Load and decode
+		_d = _decode_json(data)
+		logger_jsons.info("Read JSONLD successful: {}".format(filename))
+	except Exception:
+		try:
+			_d = _decode_json(data, encoding="latin-1")
+			logger_jsons.info("Read JSONLD successful: {}".format(filename))
+		except Exception as e:
+			print("Error: unable to read metadata file: {}".format(e))
+			logger_jsons.error("read_jsonld_from_bytes: Exception: {}, {}".format(filename, e))
+	return _d
+
+
 def read_json_from_file(filename):
 	"""
 	Import the JSON data from target file.
@@ -60,12 +83,12 @@ def read_json_from_file(filename):
 	d = OrderedDict()
 	try:
 		# Load and decode
-		d = demjson3.decode_file(filename, decode_float=float)
+		d = _decode_json(_read_file_bytes(filename))
 		logger_jsons.info("successful read from json file")
 	except FileNotFoundError:
 		# Didn't find a jsonld file. Maybe it's a json file instead?
 		try:
-			d = demjson3.decode_file(os.path.splitext(filename)[0] + '.json', decode_float=float)
+			d = _decode_json(_read_file_bytes(os.path.splitext(filename)[0] + '.json'))
 		except FileNotFoundError as e:
 			# No json or jsonld file. Exit
 			print("Error: jsonld file not found: {}".format(filename))
@@ -79,6 +102,61 @@ def read_json_from_file(filename):
 	return d
 
 
+def _read_file_bytes(filename):
+	"""
+	Read the raw contents of a file
+	:param str filename: Target file
+	:return bytes: File contents
+	"""
+	with open(filename, "rb") as f:
+		return f.read()
+
+
+def _decode_json(data, encoding=None):
+	"""
+	Decode json text. The json module does the work, and demjson3 is kept as a fallback for files that aren't
+	strict json (trailing commas, comments, etc). Numbers are decoded the same way as demjson3 for both.
+	:param bytes data: Raw json file contents
+	:param str encoding: Text encoding. Detected from the data if not given.
+	:return dict: JSON data
+	"""
+	try:
+		_text = data.decode(encoding) if encoding else data
+		return json.loads(_text, parse_float=_parse_float, parse_int=_parse_int)
+	except ValueError:
+		# JSONDecodeError and UnicodeDecodeError
+		logger_jsons.info("decode_json: not strict json, decoding with demjson3")
+		return demjson3.decode(data, decode_float=float, encoding=encoding)
+
+
+def _parse_float(s):
+	"""
+	Decode a json number that has a fraction or an exponent. demjson3 decodes numbers with a positive exponent and no
+	fraction as integers (1e5 -> 100000), so do the same.
+	:param str s: Number
+	:return float|int: Number
+	"""
+	if "." not in s:
+		_mantissa, _, _exponent = s.lower().partition("e")
+		if int(_exponent) >= 0:
+			_n = int(_mantissa) * 10 ** int(_exponent)
+			if _n == 0 and _mantissa.startswith("-"):
+				return -0.0
+			return _n
+	return float(s)
+
+
+def _parse_int(s):
+	"""
+	Decode a json integer. demjson3 decodes "-0" as the float -0.0, so do the same.
+	:param str s: Number
+	:return int|float: Number
+	"""
+	if s == "-0":
+		return -0.0
+	return int(s)
+
+
 def idx_num_to_name(L):
 	"""
 	Switch from index-by-number to index-by-name.
@@ -328,20 +406,20 @@ def _remove_csv_from_section(d, pc):
 # EXPORT
 
 
-def write_json_to_file(json_data, filename="metadata"):
+def write_json_to_file(json_data, filename="metadata", path=""):
 	"""
 	Write all JSON in python dictionary to a new json file.
 	:param dict json_data: JSON data
 	:param str filename: Target filename (defaults to 'metadata.jsonld')
+	:param str path: Target directory (defaults to the current working directory)
 	:return None:
 	"""
 	logger_jsons.info("enter write_json_to_file")
-	json_data = rm_empty_fields(json_data)
-	# Use demjson to maintain unicode characters in output
-	json_bin = demjson3.encode(json_data, encoding='utf-8', compactly=False)
+	json_bin = get_json_bytes(json_data)
 	# Write json to file
 	try:
-		open("{}.jsonld".format(filename), "wb").write(json_bin)
+		with open(os.path.join(path, "{}.jsonld".format(filename)), "wb") as f:
+			f.write(json_bin)
 		logger_jsons.info("wrote data to json file")
 	except FileNotFoundError as e:
 		print("Error: Writing json to file: {}".format(filename))
@@ -350,6 +428,42 @@ def write_json_to_file(json_data, filename="metadata"):
 	return
 
 
+def get_json_bytes(json_data):
+	"""
+	Build the contents of a json file in memory. Empty fields are removed, and the text is utf-8 encoded.
+	:param dict json_data: JSON data
+	:return bytes: Encoded json
+	"""
+	json_data = rm_empty_fields(json_data)
+	return _encode_json(json_data)
+
+
+def _encode_json(json_data):
+	"""
+	Encode json data as utf-8 text. Keys are sorted, and unicode characters are kept as they are (not escaped).
+	The json module does the work, and demjson3 is kept as a fallback for data that it can't encode.
+	:param dict json_data: JSON data
+	:return bytes: Encoded json
+	"""
+	try:
+		return json.dumps(json_data, indent=2, sort_keys=True, ensure_ascii=False, default=_json_default).encode("utf-8")
+	except (TypeError, ValueError) as e:
+		# UnicodeEncodeError is a ValueError
+		logger_jsons.info("encode_json: encoding with demjson3: {}".format(e))
+		return demjson3.encode(json_data, encoding='utf-8', compactly=False)
+
+
+def _json_default(o):
+	"""
+	Encode numpy values that the json module doesn't know about (i.e. data read with as_numpy=True)
+	:param any o: Value
+	:return any: Plain python value
+	"""
+	if isinstance(o, (np.ndarray, np.generic)):
+		return o.tolist()
+	raise TypeError("Object of type {} is not JSON serializable".format(type(o).__name__))
+
+
 def idx_name_to_num(L):
 	"""
 	Switch from index-by-name to index-by-number.
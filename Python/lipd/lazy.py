@@ -0,0 +1,199 @@
+import copy
+import threading
+import zipfile
+
+from .csvs import read_csv_from_bytes, merge_csv_table
+from .loggers import create_logger
+from .misc import iter_tables
+
+logger_lazy = create_logger("lazy")
+
+"""
+Lazy loading for LiPD data tables. Only the metadata is read up front. Each table keeps a reference to its csv member
+in the LiPD archive, and the csv is parsed, merged, and used to calculate inferred data the first time any of the
+table's column "values" are requested.
+"""
+
+
+class ArchiveMember(object):
+    """
+    Reads one csv member from a LiPD archive on demand. Holds a path, not an open file, so it can be pickled.
+    """
+
+    def __init__(self, path, member, as_numpy=False, csv_engine="auto"):
+        self.path = path
+        self.member = member
+        self.as_numpy = as_numpy
+        self.csv_engine = csv_engine
+
+    def __call__(self):
+        with zipfile.ZipFile(self.path) as z:
+            return read_csv_from_bytes(z.read(self.member), self.member, self.as_numpy, self.csv_engine)
+
+
+class LazyTable(object):
+    """
+    One data table whose csv values have not been loaded yet. Shared by all the columns of the table.
+    Loading is done once, under a lock, so threads that use the table at the same time all wait for the same load.
+    """
+
+    def __init__(self, table, pc, loader, as_numpy=False):
+        self.table = table
+        self.pc = pc
+        self.loader = loader
+        self.as_numpy = as_numpy
+        self.loaded = False
+        self._loading = False
+        # Reentrant: the merge reads the column values too, from the thread that holds the lock
+        self._lock = threading.RLock()
+
+    def load(self):
+        """
+        Read the csv, merge the values into every column, and calculate the inferred data for the table.
+        The table is only marked loaded when the merge succeeds. If it fails, the columns stay lazy, and the next access
+        tries again.
+        :return none:
+        """
+        if self.loaded:
+            return
+        with self._lock:
+            # Loaded by another thread while this one waited, or the merge itself is reading the columns
+            if self.loaded or self._loading:
+                return
+            self._loading = True
+            try:
+                merge_csv_table(self.table, self.pc, self.loader(), self.as_numpy)
+                self.loaded = True
+            except Exception as e:
+                print("Error: lazy: unable to load table values: {}, {}".format(self.table.get("filename", ""), e))
+                logger_lazy.error("load: {}, {}".format(self.table.get("filename", ""), e))
+            finally:
+                self._loading = False
+            if self.loaded:
+                # Loaded columns are plain columns from now on
+                for _column in self.table["columns"].values():
+                    if isinstance(_column, LazyColumn):
+                        _column._lazy = None
+        return
+
+    def __getstate__(self):
+        # Locks can't be pickled. The unpickled table gets a new one.
+        _state = self.__dict__.copy()
+        del _state["_lock"]
+        return _state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+
+class LazyColumn(dict):
+    """
+    Column metadata whose "values" are loaded from the LiPD archive the first time they are accessed.
+    Any access that needs the full column (iterating, copying, printing) loads the values as well.
+    """
+
+    def __init__(self, data=None, lazy=None):
+        super(LazyColumn, self).__init__(data or {})
+        self._lazy = lazy
+
+    def _load(self):
+        if self._lazy is not None:
+            self._lazy.load()
+
+    def __getitem__(self, key):
+        if key == "values":
+            self._load()
+        return super(LazyColumn, self).__getitem__(key)
+
+    def __contains__(self, key):
+        if key == "values" and self._lazy is not None:
+            return True
+        return super(LazyColumn, self).__contains__(key)
+
+    def __iter__(self):
+        self._load()
+        return super(LazyColumn, self).__iter__()
+
+    def __len__(self):
+        self._load()
+        return super(LazyColumn, self).__len__()
+
+    def __eq__(self, other):
+        self._load()
+        return super(LazyColumn, self).__eq__(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        self._load()
+        return super(LazyColumn, self).__repr__()
+
+    def get(self, key, default=None):
+        if key == "values":
+            self._load()
+        return super(LazyColumn, self).get(key, default)
+
+    def keys(self):
+        self._load()
+        return super(LazyColumn, self).keys()
+
+    def values(self):
+        self._load()
+        return super(LazyColumn, self).values()
+
+    def items(self):
+        self._load()
+        return super(LazyColumn, self).items()
+
+    def pop(self, key, *args):
+        if key == "values":
+            self._load()
+        return super(LazyColumn, self).pop(key, *args)
+
+    def copy(self):
+        self._load()
+        return dict(super(LazyColumn, self).items())
+
+    def __deepcopy__(self, memo):
+        # A copy is a plain, fully loaded column
+        self._load()
+        _d = {}
+        memo[id(self)] = _d
+        for k, v in super(LazyColumn, self).items():
+            _d[k] = copy.deepcopy(v, memo)
+        return _d
+
+    def __reduce__(self):
+        # Pickle without loading. State is restored after the object is created, so the
+        # column -> table -> column reference cycle is fine.
+        return LazyColumn, (), self.__dict__, None, iter(super(LazyColumn, self).items())
+
+    __hash__ = None
+
+
+def put_lazy_tables(d, path, members, as_numpy=False, csv_engine="auto"):
+    """
+    Set up every data table in a dataset to load its csv values on first access.
+
+    :param dict d: Metadata
+    :param str path: Path to the LiPD archive
+    :param dict members: Archive member names of the csv files, keyed by csv filename (no directory)
+    :param bool as_numpy: Store numeric column values as numpy arrays
+    :param str csv_engine: CSV engine used to parse the csv files
+    :return dict d: Metadata
+    """
+    for _pc, _table in iter_tables(d):
+        try:
+            _filename = _table.get("filename", "")
+            if _filename not in members:
+                print("Error: lazy: No csv file found for table: {}".format(_filename))
+                continue
+            _lazy = LazyTable(_table, _pc, ArchiveMember(path, members[_filename], as_numpy, csv_engine),
+                               as_numpy)
+            for _name, _column in _table["columns"].items():
+                _table["columns"][_name] = LazyColumn(_column, _lazy)
+        except Exception as e:
+            logger_lazy.error("put_lazy_tables: {}".format(e))
+    return d
@@ -1,15 +1,21 @@
-from .zips import unzipper, zipper
-from .directory import rm_file_if_exists, create_tmp_dir, find_files
-from .bag import create_bag
-from .csvs import get_csv_from_metadata, write_csv_to_file, merge_csv_metadata, read_csvs
-from .jsons import write_json_to_file, idx_num_to_name, idx_name_to_num, rm_empty_fields, read_jsonld
+from .zips import zipper_from_memory, get_data_members
+from .directory import rm_file_if_exists, open_tmp_sibling, fsync_dir
+from .bag import get_bag_files
+from .csvs import get_csv_from_metadata, get_csv_bytes, merge_csv_metadata, read_csvs_from_archive, put_csv_filenames
+from .lazy import put_lazy_tables
+from .jsons import get_json_bytes, idx_num_to_name, idx_name_to_num, rm_empty_fields, read_jsonld_from_bytes
 from .loggers import create_logger
-from .misc import put_tsids, check_dsn, get_dsn, rm_empty_doi, rm_values_fields, print_filename
+from .misc import put_tsids, check_dsn, get_dsn, rm_empty_doi, rm_values_fields, print_filename, iter_tables, \
+    get_missing_value_key
+from .tracking import track_read, track_write, get_unchanged_members, get_sources, put_sources, get_write_precision, \
+    BAG_INFO_PRECISION
 from .versions import update_lipd_version
 
-import copy
+import csv
 import os
-import shutil
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 
 logger_lipd = create_logger('LiPD')
@@ -18,94 +24,585 @@ logger_lipd = create_logger('LiPD')
 # READ
 
 
-def lipd_read(path):
+def lipd_read(path, lazy=False, as_numpy=False, csv_engine="auto", cache=None, memory_cache=None, track=False):
     """
-    Loads a LiPD file from local path. Unzip, read, and process data
-    Steps: create tmp, unzip lipd, read files into memory, manipulate data, move to original dir, delete tmp.
+    Loads a LiPD file from local path. Read and process data straight out of the archive.
+    Steps: open lipd archive, find the data members, read jsonld and csv members into memory, manipulate data.
+    Nothing is extracted to disk, and the current working directory is never changed.
 
     :param str path: Source path
+    :param bool lazy: Read the metadata only. Table values (and inferred data) are loaded when first accessed.
+    :param bool as_numpy: Store numeric column values as numpy arrays (float64, NaN for missing values)
+    :param str csv_engine: CSV engine used to parse the csv files. One of: auto, python, numpy, pandas
+    :param obj cache: DiskCache of processed datasets. Used for full reads only, not lazy ones. (optional)
+    :param obj memory_cache: MemoryCache of processed datasets, in this process. Used for full reads only. (optional)
+    :param bool track: Track the tables, so that the ones that don't change are copied as they are on write
     :return none:
     """
     D = {}
-    dir_original = os.getcwd()
 
     # Import metadata into object
     try:
-        print("reading: {}".format(print_filename(path)))
-        # bigger than 2mb file? This could take a while
-        if os.stat(path).st_size > 1000000:
-            _size = os.stat(path).st_size
-            print("{} :That's a big file! This may take a while to load...".format("{} MB".format(round(_size/1000000,2))))
-        dir_tmp = create_tmp_dir()
-        unzipper(path, dir_tmp)
-        os.chdir(dir_tmp)
-        _dir_data = find_files()
-        os.chdir(_dir_data)
-        D = read_jsonld()
-        D = rm_empty_fields(D)
-        D = check_dsn(path, D)
-        D = update_lipd_version(D)
-        D = idx_num_to_name(D)
-        D = rm_empty_doi(D)
-        D = rm_empty_fields(D)
-        D = put_tsids(D)
-        _csvs = read_csvs()
-        D = merge_csv_metadata(D, _csvs)
-        # Why ? Because we need to align the csv filenames with the table filenames. We don't need the csv output here.
-        D, _csv = get_csv_from_metadata(D["dataSetName"], D)
-        os.chdir(dir_original)
-        shutil.rmtree(dir_tmp)
+        _key = _get_memory_key(memory_cache, path, lazy, as_numpy, csv_engine)
+        if _key:
+            D = memory_cache.get(_key)
+            if D:
+                print("reading: {}".format(print_filename(path)))
+        if not D:
+            D = _lipd_read(path, lazy, as_numpy, csv_engine, cache, track)
+            if _key:
+                memory_cache.put(_key, D)
     except FileNotFoundError:
         print("Error: lipd_read: LiPD file not found. Please make sure the filename includes the .lpd extension")
     except Exception as e:
         logger_lipd.error("lipd_read: {}".format(e))
         print("Error: lipd_read: unable to read LiPD: {}".format(e))
-    os.chdir(dir_original)
     logger_lipd.info("lipd_read: record loaded: {}".format(path))
     return D
 
 
+def lipd_read_batch(paths, workers=1, lazy=False, as_numpy=False, csv_engine="auto", cache=None,
+                    memory_cache=None, track=False):
+    """
+    Loads many LiPD files. With more than one worker, the files are spread across a process pool.
+    A file that fails to load does not stop the batch. Its error is collected and returned instead.
+
+    Note: On Windows and macOS, scripts that use workers must guard their entry point with
+    if __name__ == "__main__":
+
+    :param list paths: Source paths
+    :param int workers: Number of worker processes
+    :param bool lazy: Read the metadata only. Table values (and inferred data) are loaded when first accessed.
+    :param bool as_numpy: Store numeric column values as numpy arrays (float64, NaN for missing values)
+    :param str csv_engine: CSV engine used to parse the csv files. One of: auto, python, numpy, pandas
+    :param obj cache: DiskCache of processed datasets. Used for full reads only, not lazy ones. (optional)
+    :param obj memory_cache: MemoryCache of processed datasets, in this process. Used for full reads only. (optional)
+    :param bool track: Track the tables, so that the ones that don't change are copied as they are on write
+    :return dict D: Metadata, sorted by dataSetName
+    :return dict errors: Error messages, sorted by source path
+    """
+    D = {}
+    errors = {}
+    # Datasets in the memory cache are never sent to the workers
+    _keys = {}
+    _results = {}
+    for path in paths:
+        _keys[path] = _get_memory_key(memory_cache, path, lazy, as_numpy, csv_engine)
+        if _keys[path]:
+            _d = memory_cache.get(_keys[path])
+            if _d:
+                print("reading: {}".format(print_filename(path)))
+                _results[path] = (_d, "", get_sources(_d["dataSetName"]))
+    _paths = [path for path in paths if path not in _results]
+    if workers and workers > 1 and len(_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() keeps the results in the same order as the paths
+            _n = len(_paths)
+            _results.update(zip(_paths, executor.map(_lipd_read_worker, _paths, [lazy] * _n, [as_numpy] * _n,
+                                                     [csv_engine] * _n, [cache] * _n, [track] * _n,
+                                                     chunksize=_get_chunksize(_n, workers))))
+    else:
+        _results.update((path, _lipd_read_worker(path, lazy, as_numpy, csv_engine, cache, track)) for path in _paths)
+
+    for path in paths:
+        _d, _error, _sources = _results[path]
+        if _error:
+            errors[path] = _error
+        else:
+            D[_d["dataSetName"]] = _d
+            put_sources(_d["dataSetName"], _sources)
+            if _keys[path] and path in _paths:
+                memory_cache.put(_keys[path], _d)
+    logger_lipd.info("lipd_read_batch: records loaded: {}, errors: {}".format(len(D), len(errors)))
+    return D, errors
+
+
+def lipd_read_iter(paths, workers=1, prefetch=0, lazy=False, as_numpy=False, csv_engine="auto", cache=None,
+                   track=False):
+    """
+    Loads LiPD files one at a time, in the same order as the paths. Only the datasets that are waiting to be
+    yielded are held in memory, so a library of any size can be processed in constant memory.
+    With prefetch, up to that many files are read ahead in the background while the caller works on the current one.
+    More than one worker uses a process pool. One worker uses a single background thread.
+
+    :param list paths: Source paths
+    :param int workers: Number of worker processes
+    :param int prefetch: Number of files to read ahead (0 reads each file on demand)
+    :param bool lazy: Read the metadata only. Table values (and inferred data) are loaded when first accessed.
+    :param bool as_numpy: Store numeric column values as numpy arrays (float64, NaN for missing values)
+    :param str csv_engine: CSV engine used to parse the csv files. One of: auto, python, numpy, pandas
+    :param obj cache: DiskCache of processed datasets. Used for full reads only, not lazy ones. (optional)
+    :param bool track: Track the tables, so that the ones that don't change are copied as they are on write
+    :return generator: (path, metadata, error message) for each file
+    """
+    if not prefetch or prefetch < 1:
+        for path in paths:
+            _d, _error, _sources = _lipd_read_worker(path, lazy, as_numpy, csv_engine, cache, track)
+            yield path, _d, _error
+        return
+
+    if workers and workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+    _pending = deque()
+    _paths = iter(paths)
+    try:
+        # Fill the window, then submit one new read for every result handed back
+        for path in _paths:
+            _pending.append((path, executor.submit(_lipd_read_worker, path, lazy, as_numpy, csv_engine, cache,
+                                                   track)))
+            if len(_pending) >= prefetch:
+                break
+        while _pending:
+            path, _future = _pending.popleft()
+            _d, _error, _sources = _future.result()
+            if not _error:
+                put_sources(_d["dataSetName"], _sources)
+            for _next in _paths:
+                _pending.append((_next, executor.submit(_lipd_read_worker, _next, lazy, as_numpy, csv_engine, cache,
+                                                        track)))
+                break
+            yield path, _d, _error
+    finally:
+        # The caller may stop early. Drop any reads that haven't started yet. (Cancelled here rather than with
+        # shutdown(cancel_futures=True), which needs python 3.9)
+        for _path, _future in _pending:
+            _future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _lipd_read(path, lazy=False, as_numpy=False, csv_engine="auto", cache=None, track=False):
+    """
+    Read and process one LiPD file. Errors are raised to the caller.
+
+    :param str path: Source path
+    :param bool lazy: Read the metadata only. Table values (and inferred data) are loaded when first accessed.
+    :param bool as_numpy: Store numeric column values as numpy arrays (float64, NaN for missing values)
+    :param str csv_engine: CSV engine used to parse the csv files. One of: auto, python, numpy, pandas
+    :param obj cache: DiskCache of processed datasets. Used for full reads only, not lazy ones. (optional)
+    :param bool track: Track the tables, so that the ones that don't change are copied as they are on write
+    :return dict D: Metadata
+    """
+    if cache is not None and not lazy:
+        _key, _stat = cache.get_key(path, as_numpy, csv_engine)
+        D = cache.load(path, _key)
+        if D:
+            print("reading: {}".format(print_filename(path)))
+            return D
+        D = _lipd_read(path, lazy, as_numpy, csv_engine, track=track)
+        cache.save(path, _key, _stat, D)
+        return D
+    print("reading: {}".format(print_filename(path)))
+    # bigger than 2mb file? This could take a while
+    if os.stat(path).st_size > 1000000:
+        _size = os.stat(path).st_size
+        print("{} :That's a big file! This may take a while to load...".format("{} MB".format(round(_size/1000000,2))))
+    with zipfile.ZipFile(path) as z:
+        _jsonld, _csv_members = get_data_members(z)
+        if not _jsonld:
+            raise Exception("metadata file (.jsonld) not found in LiPD archive")
+        D = read_jsonld_from_bytes(z.read(_jsonld), _jsonld)
+        D = rm_empty_fields(D)
+        D = check_dsn(path, D)
+        D = update_lipd_version(D)
+        D = idx_num_to_name(D)
+        D = rm_empty_doi(D)
+        # Second clean up, and TSids for any columns that don't have them, in one pass
+        D = rm_empty_fields(D, tsids=True)
+        if not lazy:
+            _csvs = read_csvs_from_archive(z, _csv_members, as_numpy, csv_engine)
+            _crcs = {i.rsplit("/", 1)[-1]: (i, z.getinfo(i).CRC) for i in _csv_members}
+            if track:
+                _precision = get_write_precision(z, _jsonld)
+    if lazy:
+        # Point each table at its csv member. Nothing is parsed until the values are used.
+        D = put_lazy_tables(D, path, {i.rsplit("/", 1)[-1]: i for i in _csv_members}, as_numpy, csv_engine)
+        # Align the csv filenames with the table filenames in place. A copy would load every table.
+        D = put_csv_filenames(D["dataSetName"], D)
+    else:
+        # Source csv and missing value of each table, before the merge sets the missing values to "nan"
+        _sources = [(_table.get("filename", ""), get_missing_value_key(_table)) for _pc, _table in iter_tables(D)]
+        D = merge_csv_metadata(D, _csvs, as_numpy)
+        # Why ? Because we need to align the csv filenames with the table filenames. D is new, so no copy is needed.
+        D, _csv = get_csv_from_metadata(D["dataSetName"], D, copy=False)
+        if track:
+            # Remember where each table came from, so that unchanged tables can be copied as they are on write
+            _members = {}
+            for (_filename, _mv), (_pc, _table) in zip(_sources, iter_tables(D)):
+                if _filename in _crcs and _filename in _csvs:
+                    _member, _crc = _crcs[_filename]
+                    _members[_table.get("filename", "")] = (_member, _crc, _csvs[_filename], _mv)
+            track_read(path, D["dataSetName"], _csv, _members, _precision)
+        else:
+            put_sources(D["dataSetName"], {})
+    return D
+
+
+def _get_memory_key(memory_cache, path, lazy=False, as_numpy=False, csv_engine="auto"):
+    """
+    Memory cache key for one read. Lazy reads aren't cached, since their tables load later, from the file.
+
+    :param obj memory_cache: MemoryCache, or None
+    :param str path: Source path
+    :param bool lazy: Read option
+    :param bool as_numpy: Read option
+    :param str csv_engine: Read option
+    :return tuple: Key, or None when the read can't use the cache
+    """
+    if memory_cache is None or lazy:
+        return None
+    try:
+        return memory_cache.get_key(path, as_numpy, csv_engine)
+    except OSError:
+        # Let the read itself report the missing file
+        return None
+
+
+def _lipd_read_worker(path, lazy=False, as_numpy=False, csv_engine="auto", cache=None, track=False):
+    """
+    Process pool entry point. Read one LiPD file, and hand back the error message rather than raising it.
+
+    :param str path: Source path
+    :param bool lazy: Read the metadata only
+    :param bool as_numpy: Store numeric column values as numpy arrays
+    :param str csv_engine: CSV engine used to parse the csv files
+    :param obj cache: DiskCache of processed datasets
+    :param bool track: Track the tables
+    :return dict D: Metadata
+    :return str: Error message, or empty string
+    :return dict: Tracked table sources, to hand back across the process boundary
+    """
+    try:
+        D = _lipd_read(path, lazy, as_numpy, csv_engine, cache, track)
+        if not D or "dataSetName" not in D:
+            return {}, "no data loaded", {}
+        return D, "", get_sources(D["dataSetName"])
+    except FileNotFoundError:
+        return {}, "LiPD file not found", {}
+    except Exception as e:
+        logger_lipd.error("lipd_read: {}, {}".format(path, e))
+        return {}, "unable to read LiPD: {}".format(e), {}
+
+
+def lipd_scan(path):
+    """
+    Quick look at one LiPD file. Only the jsonld metadata is read. No csv parsing, version updates, TSids, or
+    inferred data. Table sizes come from the archive directory, the first line of each csv file, and a count of its
+    line breaks.
+
+    :param str path: Source path
+    :return dict: Scan record
+    """
+    with zipfile.ZipFile(path) as z:
+        _jsonld, _csv_members = get_data_members(z)
+        if not _jsonld:
+            raise Exception("metadata file (.jsonld) not found in LiPD archive")
+        D = read_jsonld_from_bytes(z.read(_jsonld), _jsonld)
+        _members = {i.rsplit("/", 1)[-1]: i for i in _csv_members}
+        _tables = []
+        _variables = []
+        for _table in _get_scan_tables(D):
+            _columns = _table.get("columns", [])
+            if isinstance(_columns, dict):
+                _columns = list(_columns.values())
+            _filename = _table.get("filename", "")
+            _member = _members.get(_filename, "")
+            _entry = {"tableName": _table.get("tableName", ""), "filename": _filename, "columns": 0, "rows": None,
+                      "bytes": None}
+            if _member:
+                _entry["bytes"] = z.getinfo(_member).file_size
+                with z.open(_member) as f:
+                    _entry["columns"], _entry["rows"] = _get_scan_shape(f)
+            else:
+                for _column in _columns:
+                    _number = _column.get("number", 1) if isinstance(_column, dict) else 1
+                    _entry["columns"] += len(_number) if isinstance(_number, list) else 1
+                    # Values kept in the metadata (not usual) give the row count
+                    if _entry["rows"] is None and isinstance(_column, dict) and \
+                            isinstance(_column.get("values"), list):
+                        _entry["rows"] = len(_column["values"])
+            for _column in _columns:
+                if isinstance(_column, dict) and _column.get("variableName") not in _variables + [None]:
+                    _variables.append(_column["variableName"])
+            _tables.append(_entry)
+    return {
+        "path": path,
+        "dataSetName": D.get("dataSetName", os.path.splitext(os.path.basename(path))[0]),
+        "archiveType": D.get("archiveType", ""),
+        "lipdVersion": D.get("lipdVersion", ""),
+        "coordinates": _get_scan_coordinates(D.get("geo", {})),
+        "variableNames": _variables,
+        "tables": _tables
+    }
+
+
+def _get_scan_shape(f):
+    """
+    Get the shape of one csv table without parsing it. LiPD csv files have no header, so the first row gives the
+    column count. It is parsed as csv, so quoted cells with commas count once. Rows are counted by line breaks.
+
+    :param obj f: Csv member, open for binary reading
+    :return int: Columns
+    :return int: Rows
+    """
+    _first = f.readline()
+    if not _first.strip():
+        return 0, 0
+    _columns = len(next(csv.reader([_first.decode("utf-8", errors="replace").rstrip("\r\n")]), []))
+    _rows = _first.count(b"\n")
+    _last = _first[-1:]
+    for _chunk in iter(lambda: f.read(1048576), b""):
+        _rows += _chunk.count(b"\n")
+        _last = _chunk[-1:]
+    # A last row with no line break after it
+    if _last != b"\n":
+        _rows += 1
+    return _columns, _rows
+
+
+def lipd_scan_batch(paths, workers=1):
+    """
+    Scan many LiPD files. Results are yielded one at a time, in the same order as the paths.
+    A file that fails to scan does not stop the batch.
+
+    :param list paths: Source paths
+    :param int workers: Number of worker processes
+    :return generator: (path, scan record, error message) for each file
+    """
+    if workers and workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, (_record, _error) in zip(paths, executor.map(
+                    _lipd_scan_worker, paths, chunksize=_get_chunksize(len(paths), workers))):
+                yield path, _record, _error
+    else:
+        for path in paths:
+            _record, _error = _lipd_scan_worker(path)
+            yield path, _record, _error
+
+
+def _lipd_scan_worker(path):
+    """
+    Process pool entry point. Scan one LiPD file, and hand back the error message rather than raising it.
+
+    :param str path: Source path
+    :return dict: Scan record
+    :return str: Error message, or empty string
+    """
+    try:
+        return lipd_scan(path), ""
+    except FileNotFoundError:
+        return {}, "LiPD file not found"
+    except Exception as e:
+        logger_lipd.error("lipd_scan: {}, {}".format(path, e))
+        return {}, "unable to scan LiPD: {}".format(e)
+
+
+def _get_scan_tables(x):
+    """
+    (Recursive) Find every table in raw metadata. Any dict with a "columns" key is a table. This works for all
+    LiPD versions, since the metadata has not been updated or indexed by name.
+
+    :param any x: Metadata
+    :return generator: Tables
+    """
+    if isinstance(x, dict):
+        if "columns" in x:
+            yield x
+        else:
+            for _k, _v in x.items():
+                if _k != "geo":
+                    yield from _get_scan_tables(_v)
+    elif isinstance(x, list):
+        for _v in x:
+            yield from _get_scan_tables(_v)
+
+
+def _get_scan_coordinates(geo):
+    """
+    Get the coordinates from the geo section. GeoJSON (LiPD v1.1+) or plain latitude and longitude keys.
+
+    :param dict geo: Geo metadata
+    :return list: [longitude, latitude, (elevation)], or empty list
+    """
+    try:
+        if "geometry" in geo:
+            return list(geo["geometry"]["coordinates"])
+        _coords = [geo.get("longitude"), geo.get("latitude")]
+        if None not in _coords:
+            if geo.get("elevation") is not None:
+                _coords.append(geo["elevation"])
+            return _coords
+    except Exception as e:
+        logger_lipd.info("get_scan_coordinates: {}".format(e))
+    return []
+
+
+def _get_chunksize(count, workers):
+    """
+    Hand out work in a few chunks per worker. Fewer round trips than one file at a time, but still balances the load.
+
+    :param int count: Number of files
+    :param int workers: Number of worker processes
+    :return int: Chunk size
+    """
+    return max(1, count // (workers * 4))
+
+
 # WRITE
 
 
-def lipd_write(D, path):
+def lipd_write(D, path, precision=3, compression="default", track=False):
     """
     Saves current state of LiPD object data. Outputs to a LiPD file.
-    Steps: create tmp, create bag dir, get dsn, splice csv from json, write csv, clean json, write json, create bagit,
-        zip up bag folder, place lipd in target dst, move to original dir, delete tmp
 
     :param dict D: Metadata
     :param str path: Destination path
+    :param int precision: Number of decimals to keep in the csv values
+    :param str compression: Compression policy: "stored", "fast", "default", or "max"
+    :param bool track: Copy the tables that haven't changed since they were read (or last written), and track the
+        tables written
     :return none:
     """
-    # JSON var is pass by reference. Make a copy so we don't mess up the original data in memory.
-    D_tmp = copy.deepcopy(D)
-    dir_original = os.getcwd()
     try:
-        dir_tmp = create_tmp_dir()
-        dir_bag = os.path.join(dir_tmp, "bag")
-        os.mkdir(dir_bag)
-        os.chdir(dir_bag)
-        _dsn = get_dsn(D_tmp)
-        _dsn_lpd = _dsn + ".lpd"
-        D_tmp, _csv = get_csv_from_metadata(_dsn, D_tmp)
-        write_csv_to_file(_csv)
-        D_tmp = rm_values_fields(D_tmp)
-        D_tmp = put_tsids(D_tmp)
-        D_tmp = idx_name_to_num(D_tmp)
-        write_json_to_file(D_tmp)
-        create_bag(dir_bag)
-        rm_file_if_exists(path, _dsn_lpd)
-        zipper(root_dir=dir_tmp, name="bag", path_name_ext=os.path.join(path, _dsn_lpd))
-        os.chdir(dir_original)
-        shutil.rmtree(dir_tmp)
+        _lipd_write(D, path, precision, compression=compression, track=track)
     except Exception as e:
         logger_lipd.error("lipd_write: {}".format(e))
         print("Error: lipd_write: {}".format(e))
     return
 
 
+def lipd_write_batch(datasets, path, workers=1, precision=3, compression="default", track=False):
+    """
+    Saves many datasets to LiPD files. With more than one worker, the writes are spread across a process pool.
+    A dataset that fails to write does not stop the batch. Its error is collected and reported instead.
+    Every file is replaced atomically, so a batch can be killed at any point and run again.
+
+    Note: On Windows and macOS, scripts that use workers must guard their entry point with
+    if __name__ == "__main__":
+
+    :param list datasets: (name, metadata) for each dataset
+    :param str path: Destination path
+    :param int workers: Number of worker processes
+    :param int precision: Number of decimals to keep in the csv values
+    :param str compression: Compression policy: "stored", "fast", "default", or "max"
+    :param bool track: Copy the tables that haven't changed since they were read (or last written), and track the
+        tables written
+    :return dict: Report for each dataset name. Keys: success, path, error
+    """
+    if workers and workers > 1 and len(datasets) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() keeps the results in the same order as the datasets
+            _n = len(datasets)
+            # The tracked table sources go along, so the workers can copy unchanged tables
+            _sources = [get_sources(_d.get("dataSetName", "")) if isinstance(_d, dict) else {} for _name, _d in datasets]
+            _results = list(executor.map(_lipd_write_worker, [_d for _name, _d in datasets], [path] * _n,
+                                         [precision] * _n, _sources, [compression] * _n, [track] * _n,
+                                         chunksize=_get_chunksize(_n, workers)))
+    else:
+        _results = [_lipd_write_worker(_d, path, precision, compression=compression, track=track)
+                    for _name, _d in datasets]
+
+    # Each file was flushed as it was written. One directory flush makes all the renames durable.
+    fsync_dir(path)
+    report = {}
+    for (_name, _d), (_path, _error, _sources) in zip(datasets, _results):
+        report[_name] = {"success": not _error, "path": _path, "error": _error}
+        if not _error:
+            put_sources(_d["dataSetName"], _sources)
+    logger_lipd.info("lipd_write_batch: records written: {}, errors: {}".format(
+        sum(1 for i in report.values() if i["success"]), sum(1 for i in report.values() if not i["success"])))
+    return report
+
 
+def _lipd_write_worker(D, path, precision=3, sources=None, compression="default", track=False):
+    """
+    Process pool entry point. Write one LiPD file, and hand back the error message rather than raising it.
+
+    :param dict D: Metadata
+    :param str path: Destination path
+    :param int precision: Number of decimals to keep in the csv values
+    :param dict sources: Tracked table sources of the dataset, handed across the process boundary
+    :param str compression: Compression policy
+    :param bool track: Copy unchanged tables, and track the tables written
+    :return str: Path of the LiPD file written, or empty string
+    :return str: Error message, or empty string
+    :return dict: Tracked table sources after the write
+    """
+    # get_dsn() exits when there's no dataSetName, which would take down the whole batch
+    if not isinstance(D, dict) or "dataSetName" not in D:
+        return "", "no dataSetName found", {}
+    if sources is not None:
+        put_sources(D["dataSetName"], sources)
+    try:
+        return _lipd_write(D, path, precision, sync_dir=False, compression=compression, track=track), "", \
+            get_sources(D["dataSetName"])
+    except Exception as e:
+        logger_lipd.error("lipd_write: {}".format(e))
+        return "", "unable to write LiPD: {}".format(e), {}
 
 
+def _lipd_write(D, path, precision=3, sync_dir=True, compression="default", track=False):
+    """
+    Saves current state of LiPD object data. Outputs to a LiPD file.
+    Steps: get dsn, splice csv from json, build csv, clean json, build json, build bagit files, zip up bag in target dst
+    The files are built in memory, and the bagit manifests are hashed from the same buffers. The archive is the only
+    thing written to disk, and the current working directory is never changed, so writes are safe to run from
+    multiple threads and processes.
+    With tracking, the csv bytes of tables that haven't changed since they were read (or last written) are copied from
+    their source LiPD file, with their md5, as long as they were written with the same precision. Only the changed
+    tables are formatted and hashed again. Every table is compressed with the given compression policy. The precision
+    is recorded in bag-info.txt, so that tables read back from this file can be copied too.
+    The new file replaces the old one atomically, so an interrupted write never loses the original file.
 
+    :param dict D: Metadata
+    :param str path: Destination path
+    :param int precision: Number of decimals to keep in the csv values
+    :param bool sync_dir: Flush the destination directory to disk. Batch writes do this once, at the end.
+    :param str compression: Compression policy: "stored" (no compression), "fast", "default", or "max" (smallest file)
+    :param bool track: Copy the tables that haven't changed since they were read (or last written), and track the
+        tables written
+    :return str: Path of the LiPD file written
+    """
+    _dsn = get_dsn(D)
+    _dsn_lpd = _dsn + ".lpd"
+    # Works on a copy of the metadata structure, so the original data in memory is never changed. The column values
+    # are shared, not copied, and only read from.
+    D_tmp, _csv = get_csv_from_metadata(_dsn, D)
+    _unchanged, _fingerprints = {}, {}
+    if track:
+        # Read the unchanged tables before anything is written. The source may be the file that gets replaced.
+        _unchanged, _fingerprints = get_unchanged_members(_dsn, _csv, precision)
+    _changed = OrderedDict((k, v) for k, v in _csv.items() if k not in _unchanged)
+    _payload = [("data/" + _filename, _data) for _filename, _data in get_csv_bytes(_changed, precision)]
+    D_tmp = rm_values_fields(D_tmp)
+    D_tmp = put_tsids(D_tmp)
+    D_tmp = idx_name_to_num(D_tmp)
+    _payload.append(("data/metadata.jsonld", get_json_bytes(D_tmp)))
+    _payload.sort()
+    _copied = [("data/" + _filename, _data) for _filename, (_data, _md5) in sorted(_unchanged.items())]
+    _known = [("data/" + _filename, _md5, len(_data)) for _filename, (_data, _md5) in sorted(_unchanged.items())]
+    _path = os.path.join(path, _dsn_lpd)
+    # Build the archive in a temp file next to the target, flush it to disk, and swap it into place. A crash or a kill
+    # at any point leaves either the old file or the new one, never a partial file.
+    _tmp, f = open_tmp_sibling(_path)
+    try:
+        with f:
+            _files = get_bag_files(_payload, _known, {BAG_INFO_PRECISION: str(precision)}) + _payload + _copied
+            _written = zipper_from_memory(f, "bag", _files, compression)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(_tmp, _path)
+    except BaseException:
+        rm_file_if_exists("", _tmp)
+        raise
+    if sync_dir:
+        fsync_dir(path)
+    if track:
+        track_write(_path, _dsn, _fingerprints, {_filename: (_written["data/" + _filename].filename,
+                                                             _written["data/" + _filename].CRC)
+                                                 for _filename in _fingerprints if "data/" + _filename in _written},
+                    precision)
+    else:
+        put_sources(_dsn, {})
+    return _path
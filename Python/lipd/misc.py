@@ -7,6 +7,7 @@ import re
 import shutil
 import string
 import unicodedata
+from collections import OrderedDict
 
 import numpy as np
 
@@ -42,6 +43,35 @@ def cast_values_csvs(d, idx, x):
     return d
 
 
+def get_type_masks(values):
+    """
+    Find which entries of a list are floats, and which are strings, without checking one entry at a time in Python.
+
+    :param list values: Column values
+    :return numpy.ndarray: True where the entry is a float
+    :return numpy.ndarray: True where the entry is a string
+    """
+    _types = np.fromiter(map(type, values), dtype=object, count=len(values))
+    return _types == float, _types == str
+
+
+def cast_values_array(values):
+    """
+    Cast a whole column of csv values to a float array in one step. Blank entries become NaN.
+
+    :param list values: Column values
+    :return numpy.ndarray: Column values, or None if the column has any non-numeric entries
+    """
+    try:
+        return np.array(values, dtype=float)
+    except (ValueError, TypeError):
+        pass
+    try:
+        return np.array([np.nan if v in EMPTY else v for v in values], dtype=float)
+    except (ValueError, TypeError):
+        return None
+
+
 def cast_float(x):
     """
     Attempt to cleanup string or convert to number value.
@@ -106,7 +136,7 @@ def clean_doi(doi_string):
     return m
 
 
-def decimal_precision(row):
+def decimal_precision(row, precision=3):
     """
     Change the "precision" of values before writing to CSV. Each value is rounded to 3 numbers.
 
@@ -115,6 +145,7 @@ def decimal_precision(row):
     ex: 3.123456e-25 - > 3.123e-25
 
     :param tuple row: Row of numbers to process
+    :param int precision: Number of decimals to keep
     :return list row: Processed row
     """
     # _row = []
@@ -122,20 +153,7 @@ def decimal_precision(row):
         # Convert tuple to list for processing
         row = list(row)
         for idx, x in enumerate(row):
-            x = str(x)
-            # Is this a scientific notated float? Tear it apart with regex, round, and piece together again
-            m = re.match(re_sci_notation, x)
-            if m:
-                _x2 = round(float(m.group(2)), 3)
-                x = m.group(1) + str(_x2)[1:] + m.group(3)
-            # A normal float? round to 3 decimals as usual
-            else:
-                try:
-                    x = round(float(x), 3)
-                except (ValueError, TypeError):
-                    x = x
-
-            row[idx] = x
+            row[idx] = _decimal_precision_value(x, precision)
         # Convert list back to tuple for csv writer
         row = tuple(row)
     except Exception as e:
@@ -143,6 +161,121 @@ def decimal_precision(row):
     return row
 
 
+def decimal_precision_column(values, precision=3):
+    """
+    Change the "precision" of a whole column of values before writing to CSV. Same results as decimal_precision(),
+    but a column of plain numbers is rounded and formatted in one step with numpy.
+
+    :param list values: Column values (list or numpy array)
+    :param int precision: Number of decimals to keep
+    :return list: Processed values, ready for the csv writer
+    """
+    if 0 <= precision <= 15 and _is_number_column(values):
+        try:
+            return _decimal_precision_array(np.asarray(values, dtype=float), precision)
+        except OverflowError:
+            # An int too large for a float. Fall through to one value at a time.
+            pass
+    return [_decimal_precision_value(x, precision) for x in values]
+
+
+def _decimal_precision_value(x, precision=3):
+    """
+    Change the "precision" of one value.
+
+    :param any x: Value
+    :param int precision: Number of decimals to keep
+    :return any: Rounded float, or a string
+    """
+    x = str(x)
+    # Is this a scientific notated float? Tear it apart with regex, round, and piece together again
+    m = re.match(re_sci_notation, x)
+    if m:
+        _x2 = round(float(m.group(2)), precision)
+        x = m.group(1) + str(_x2)[1:] + m.group(3)
+    # A normal float? round to 3 decimals as usual
+    else:
+        try:
+            x = round(float(x), precision)
+        except (ValueError, TypeError):
+            x = x
+    return x
+
+
+def _decimal_precision_array(values, precision=3):
+    """
+    Round and format a float array, with the same output as _decimal_precision_value() on each value.
+    The tiny positive values that str() writes in scientific notation have their mantissa rounded, like the regex
+    does in _decimal_precision_value(). Values that numpy can't round the same way as round() are done one at a time.
+
+    :param numpy.ndarray values: Column values
+    :param int precision: Number of decimals to keep
+    :return list: Values as strings
+    """
+    _rounded, _slow = _round_array(values, precision)
+    # numpy writes float64 values the same way as str()
+    _l = _rounded.astype(str).tolist()
+
+    # Scientific notation: "1.23456e-05" -> "1" + ".235" + "e-05"
+    _sci, _lead, _digits, _exponent = [], [], [], []
+    _candidates = np.flatnonzero((values > 0) & (values < 1e-3))
+    for idx, _s in zip(_candidates.tolist(), values[_candidates].astype(str).tolist()):
+        if "e-" in _s and "." in _s:
+            _mantissa, _, _e = _s.partition("e")
+            _a, _, _b = _mantissa.partition(".")
+            _sci.append(idx)
+            _lead.append(_a)
+            _digits.append("." + _b)
+            _exponent.append(_e)
+    if _sci:
+        _fraction = np.array(_digits, dtype=float)
+        _fraction_rounded, _fraction_slow = _round_array(_fraction, precision)
+        _fraction_strs = _fraction_rounded.astype(str).tolist()
+        for idx in np.flatnonzero(_fraction_slow):
+            _fraction_strs[idx] = str(round(float(_fraction[idx]), precision))
+        for idx, _a, _b, _c in zip(_sci, _lead, _fraction_strs, _exponent):
+            _l[idx] = _a + _b[1:] + "e" + _c
+        _slow[_sci] = False
+
+    for idx in np.flatnonzero(_slow):
+        _l[idx] = _decimal_precision_value(float(values[idx]), precision)
+    return _l
+
+
+def _round_array(values, precision=3):
+    """
+    Round a float array to a number of decimals. numpy rounds by scaling, which can land on the other side of a tie
+    from round(). Values too close to a tie to be sure, or too large to scale exactly, are flagged.
+
+    :param numpy.ndarray values: Values
+    :param int precision: Number of decimals to keep
+    :return numpy.ndarray: Rounded values
+    :return numpy.ndarray: True where the value has to be rounded with round() instead
+    """
+    _scale = 10.0 ** precision
+    with np.errstate(all="ignore"):
+        _scaled = values * _scale
+        _rounded = np.rint(_scaled) / _scale
+        _tie = np.abs(_scaled - np.floor(_scaled) - 0.5)
+        _slow = ~(np.abs(_scaled) < 2.0 ** 52)
+        _slow |= _tie <= np.abs(_scaled) * 2.0 ** -50
+    _slow &= ~np.isnan(values)
+    return _rounded, _slow
+
+
+def _is_number_column(values):
+    """
+    Is this a 1D column of plain numbers that converts to float64 without changing its str() form?
+    Python floats and ints, or a float64 / integer numpy array.
+
+    :param list values: Column values
+    :return bool:
+    """
+    if isinstance(values, np.ndarray):
+        return values.ndim == 1 and (values.dtype == np.float64 or values.dtype.kind in "iu")
+    return set(map(type, values)) <= {float, int}
+
+
 def fix_coordinate_decimal(d):
     """
     Coordinate decimal degrees calculated by an excel formula are often too long as a repeating decimal.
@@ -409,6 +542,23 @@ def is_one_dataset(D):
     return False
 
 
+def iter_tables(d):
+    """
+    Loop over every data table in a dataset (index-by-name format). Measurement tables first, then model tables.
+
+    :param dict d: Metadata
+    :return generator: (pc, table) for each table. pc is "paleo" or "chron"
+    """
+    for _pc in ["paleo", "chron"]:
+        for _name, _section in d.get(_pc + "Data", {}).items():
+            for _table in _section.get("measurementTable", {}).values():
+                yield _pc, _table
+            for _model in _section.get("model", {}).values():
+                for _key in ["summaryTable", "ensembleTable", "distributionTable"]:
+                    for _table in _model.get(_key, {}).values():
+                        yield _pc, _table
+
+
 def load_fn_matches_ext(file_path, file_type):
     """
     Check that the file extension matches the target extension given.
@@ -585,23 +735,7 @@ def put_tsids(x):
                 for k, v in x.items():
                     # Is this the columns key?
                     if k == "columns":
-                        try:
-                            # loop over each column of data. Sorted by variableName key
-                            for var, data in v.items():
-                                try:
-                                    # make a case-insensitive keys list for checking existence of "tsid"
-                                    keys = [key.lower() for key in data.keys()]
-                                    # If a TSid already exists, then we don't need to do anything.
-                                    if "tsid" not in keys:
-                                        # generate the TSid, and add it to the dictionary
-                                        data["TSid"] = generate_tsid()
-                                        logger_misc.info("put_tsids: Generated new TSid: {}".format(data["TSid"]))
-                                except AttributeError as e:
-                                    logger_misc.debug("put_tsids: level 3: AttributeError: {}".format(e))
-                                except Exception as e:
-                                    logger_misc.debug("put_tsids: level 3: Exception: {}".format(e))
-                        except Exception as e:
-                            print("put_tsids: level 2: Exception: {}, {}".format(k, e))
+                        _put_tsids_columns(k, v)
                     # If it's not "columns", then dive deeper.
                     else:
                         x[k] = put_tsids(v)
@@ -616,11 +750,42 @@ def put_tsids(x):
     return x
 
 
-def rm_empty_fields(x):
+def _put_tsids_columns(k, v):
+    """
+    Add in TSids into the columns of one table that do not have them.
+
+    :param str k: Key of the columns, i.e. "columns"
+    :param dict v: Columns
+    :return none:
+    """
+    try:
+        # loop over each column of data. Sorted by variableName key
+        for var, data in v.items():
+            try:
+                # make a case-insensitive keys list for checking existence of "tsid"
+                keys = [key.lower() for key in data.keys()]
+                # If a TSid already exists, then we don't need to do anything.
+                if "tsid" not in keys:
+                    # generate the TSid, and add it to the dictionary
+                    data["TSid"] = generate_tsid()
+                    logger_misc.info("put_tsids: Generated new TSid: {}".format(data["TSid"]))
+            except AttributeError as e:
+                logger_misc.debug("put_tsids: level 3: AttributeError: {}".format(e))
+            except Exception as e:
+                logger_misc.debug("put_tsids: level 3: Exception: {}".format(e))
+    except Exception as e:
+        print("put_tsids: level 2: Exception: {}, {}".format(k, e))
+    return
+
+
+def rm_empty_fields(x, tsids=False):
     """
     (Recursive) Go through N number of nested data types and remove all empty entries.
+    With tsids, also add TSids into any columns that do not have them, the same as put_tsids() run afterwards would.
+    One pass over the metadata instead of two.
 
     :param any x: Unknown
+    :param bool tsids: Add in TSids
     :return any x: Unknown
     """
     # No logger here because the function is recursive.
@@ -639,7 +804,7 @@ def rm_empty_fields(x):
         elif isinstance(x, list):
             # Recurse once for each item in the list
             for i, v in enumerate(x):
-                x[i] = rm_empty_fields(x[i])
+                x[i] = rm_empty_fields(x[i], tsids)
             # After substitutions, remove empty entries.
             for i in x:
                 # Many 0 values are important (coordinates, m/m/m/m). Don't remove them.
@@ -648,7 +813,11 @@ def rm_empty_fields(x):
         elif isinstance(x, dict):
             # First, go through and substitute "" (empty string) entry for any values in EMPTY
             for k, v in x.items():
-                x[k] = rm_empty_fields(v)
+                # put_tsids() doesn't look inside the columns, other than to add their TSids
+                x[k] = rm_empty_fields(v, tsids and k != "columns")
+                # Skip the columns that are about to be deleted as empty, like put_tsids() would never see them
+                if tsids and k == "columns" and (x[k] or x[k] in [0, 0.0]):
+                    _put_tsids_columns(k, x[k])
             # After substitutions, go through and delete the key-value pair.
             # This has to be done after we come back up from recursion because we cannot pass keys down.
             for key in list(x.keys()):
@@ -702,6 +871,31 @@ def rm_files(path, extension):
     return
 
 
+def copy_metadata(x, values=True):
+    """
+    (Recursive) Copy the metadata structure (dicts and lists) without copying the column values. The "values" fields
+    are shared with the original, or left out. The copy can be edited freely, as long as the shared values lists
+    are not changed in place.
+
+    :param any x: Any data type
+    :param bool values: Keep the "values" fields. If False, they are left out of the copy (and never loaded).
+    :return any: Copy
+    """
+    if isinstance(x, dict):
+        _d = OrderedDict() if isinstance(x, OrderedDict) else {}
+        # dict.items() skips the loading of lazy column values
+        for k, v in (x.items() if values else dict.items(x)):
+            if k == "values":
+                if values:
+                    _d[k] = v
+            else:
+                _d[k] = copy_metadata(v, values)
+        return _d
+    elif isinstance(x, list):
+        return [copy_metadata(i, values) for i in x]
+    return x
+
+
 def rm_values_fields(x):
     """
     (Recursive) Remove all "values" fields from the metadata
@@ -809,32 +1003,84 @@ def _replace_missing_values_table(values, mv):
     """
 
     for idx, column in enumerate(values):
-        values[idx] = _replace_missing_values_column(column, mv)
+        if isinstance(column, np.ndarray):
+            values[idx] = _replace_missing_values_array(column, mv)
+        else:
+            values[idx] = _replace_missing_values_column(column, mv)
+
+    return values
+
 
+def _replace_missing_values_array(values, mv):
+    """
+    Replace missing values in a float array with NaN. Blank entries are already NaN, so only a numeric missing value
+    can still be in the array.
+
+    :param numpy.ndarray values: Metadata (column values)
+    :param any mv: Missing value currently in use
+    :return numpy.ndarray values: Metadata (column values)
+    """
+    if isinstance(mv, (int, float)):
+        values[values == mv] = np.nan
     return values
 
 
 def _replace_missing_values_column(values, mv):
     """
-    Replace missing values in the values list where applicable
+    Replace missing values in the values list where applicable.
+    Float entries are checked all at once with a numpy mask. String entries are checked once per distinct string.
+    Any other data types fall back to checking one entry at a time.
 
     :param list values: Metadata (column values)
+    :param any mv: Missing value currently in use
     :return list values: Metadata (column values)
     """
-    for idx, v in enumerate(values):
-        try:
-            if v in EMPTY or v == mv:
+    _types = set(map(type, values))
+    if not isinstance(mv, (str, int, float)) or not _types <= {float, str}:
+        for idx, v in enumerate(values):
+            if _is_missing_value(v, mv):
                 values[idx] = "nan"
-            elif math.isnan(float(v)):
-                values[idx] = "nan"
-            else:
-                values[idx] = v
-        except (TypeError, ValueError):
-            values[idx] = v
+        return values
+
+    if str in _types:
+        _floats, _strs = get_type_masks(values)
+    else:
+        _floats, _strs = np.ones(len(values), dtype=bool), np.zeros(len(values), dtype=bool)
+    _mask = np.zeros(len(values), dtype=bool)
+    _values = np.array(values, dtype=object)
+    if _floats.any():
+        _f = _values[_floats].astype(float)
+        _m = np.isnan(_f)
+        if isinstance(mv, (int, float)):
+            _m |= _f == mv
+        _mask[_floats] = _m
+    if _strs.any():
+        _uniq, _inv = np.unique(_values[_strs], return_inverse=True)
+        _mask[_strs] = np.array([_is_missing_value(v, mv) for v in _uniq], dtype=bool)[_inv]
+    # Only the missing entries are touched
+    for idx in np.flatnonzero(_mask):
+        values[idx] = "nan"
 
     return values
 
 
+def _is_missing_value(v, mv):
+    """
+    Is this one value a missing value? Empty, the missing value in use, or NaN.
+
+    :param any v: Value
+    :param any mv: Missing value currently in use
+    :return bool:
+    """
+    try:
+        if v in EMPTY or v == mv:
+            return True
+        elif math.isnan(float(v)):
+            return True
+    except (TypeError, ValueError):
+        pass
+    return False
+
 def split_path_and_file(s):
     """
     Given a full path to a file, split and return a path and filename
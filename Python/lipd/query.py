@@ -0,0 +1,424 @@
+import operator
+import re
+
+import numpy as np
+import pandas as pd
+
+from .loggers import create_logger
+from .timeseries import translate_expression
+
+logger_query = create_logger("query")
+
+"""
+Query compiler for time series filters. An expression, or a list of expressions, is parsed once into a plan, and the
+plan is turned into one predicate for the time series entries, and into a vectorized mask for time series tables.
+
+Each comparison is written the same as for filterTs(), i.e. "geo_meanLat > 10", "archiveType == marine sediment".
+A list of expressions matches the entries that match all of them. Comparisons can also be grouped with and, or, and
+not, when each one is in parentheses, i.e. "(archiveType == coral) or not (geo_meanElev < 0)". Without parentheses,
+"and" is part of the value, the same as before, i.e. "archiveType == sand and gravel".
+
+"~=" is equality that ignores case. "in" is true when the value contains the given text or item. An entry that
+doesn't have the key, or whose value can't be compared (i.e. text against a number), doesn't match.
+"""
+
+# Ordering and equality operators. "in" and "~=" are handled on their own.
+OPERATORS = {">": operator.gt, "<": operator.lt, ">=": operator.ge, "<=": operator.le, "=": operator.eq}
+# Operators that give a numeric bound, and can be merged into a range
+RANGE_OPERATORS = [">", "<", ">=", "<="]
+# Value types that always compare with a number, and give a bool
+NUMBERS = {float, int}
+# Stands in for a key that an entry doesn't have
+_MISSING = object()
+
+re_query_group = re.compile(r"not\s*\(", re.IGNORECASE)
+re_query_word = re.compile(r"(and|or|not)\b", re.IGNORECASE)
+
+
+class Query(object):
+    """
+    A compiled time series query. Holds the plan, and the predicate made from it.
+
+    Plan nodes are tuples:
+    ("and", [nodes]), ("or", [nodes]), ("not", node),
+    ("leaf", key, operator, value), and ("range", key, [(operator, value), ...]) for bounds on one key.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.predicate = _build_predicate(plan)
+
+    def match(self, tso):
+        """
+        Check one time series entry.
+
+        :param dict tso: Time series entry
+        :return bool: Match
+        """
+        return self.predicate(tso)
+
+    def mask(self, table):
+        """
+        Check all the rows of a time series table at once.
+
+        :param obj table: Pandas DataFrame, as ts_to_table() gives it
+        :return obj: Numpy bool array, one item per row
+        """
+        return _build_mask(self.plan, table)
+
+    def __repr__(self):
+        return "Query({})".format(self.plan)
+
+
+def compile_query(expressions):
+    """
+    Parse an expression, or a list of expressions, into a query. Invalid expressions are skipped, the same as
+    filterTs() has always done.
+
+    :param str|list|Query expressions: Expression(s)
+    :return obj: Query, or None if no expression is valid
+    """
+    if isinstance(expressions, Query):
+        return expressions
+    _plan = None
+    if isinstance(expressions, str):
+        _plan = _parse_expression(expressions)
+    elif isinstance(expressions, list):
+        _plan = _make_node("and", [_parse_expression(i) for i in expressions if isinstance(i, str)])
+    if _plan is None:
+        return None
+    logger_query.info("compile_query: {}".format(_plan))
+    return Query(_plan)
+
+
+def get_query_matches(query, ts, index=None):
+    """
+    Get the time series entries that match a query.
+
+    :param obj query: Query
+    :param list|obj ts: Time series, or time series table
+    :param obj index: Index of the time series list, to search instead of checking every entry (optional)
+    :return list|obj new_ts: Matched time series entries, or table rows
+    :return list idxs: Indices (or row positions) of matched entries
+    """
+    logger_query.info("enter get_query_matches")
+    if isinstance(ts, pd.DataFrame):
+        idxs = np.flatnonzero(query.mask(ts)).tolist()
+        new_ts = ts.iloc[idxs]
+    elif index is not None:
+        idxs = index.search(query)
+        new_ts = [ts[idx] for idx in idxs]
+    else:
+        _predicate = query.predicate
+        idxs = [idx for idx, tso in enumerate(ts) if _predicate(tso)]
+        new_ts = [ts[idx] for idx in idxs]
+    if not idxs:
+        print("No matches found for that expression")
+    else:
+        print("Found {} matches from {} columns".format(len(idxs), len(ts)))
+    logger_query.info("exit get_query_matches")
+    return new_ts, idxs
+
+
+# PARSE
+
+
+def _parse_expression(expression):
+    """
+    Parse one expression. Expressions that start with a parenthesis (or "not (") are groups of comparisons. All others
+    are comparisons, as translate_expression() reads them.
+
+    :param str expression: Expression
+    :return tuple: Plan node, or None if invalid
+    """
+    _s = expression.strip()
+    if not (_s.startswith("(") or re_query_group.match(_s)):
+        return _make_node("and", [_make_leaf(i) for i in translate_expression(expression)])
+    _tokens = _tokenize(_s)
+    if _tokens is None:
+        return _invalid(expression)
+    # or binds loosest, then and, then not
+    _ors = []
+    _ands = []
+    _negate = False
+    _expect_group = True
+    for _token in _tokens:
+        if _expect_group:
+            if _token == "not":
+                _negate = not _negate
+                continue
+            if _token in ["and", "or"]:
+                return _invalid(expression)
+            _node = _parse_expression(_token[1:-1])
+            _ands.append(("not", _node) if _negate and _node is not None else _node)
+            _negate = False
+            _expect_group = False
+        else:
+            if _token == "or":
+                _ors.append(_make_node("and", _ands))
+                _ands = []
+            elif _token != "and":
+                return _invalid(expression)
+            _expect_group = True
+    if _expect_group:
+        return _invalid(expression)
+    _ors.append(_make_node("and", _ands))
+    return _make_node("or", _ors)
+
+
+def _tokenize(s):
+    """
+    Split a group expression into parenthesized groups (kept with their parentheses), and "and", "or", "not".
+
+    :param str s: Expression
+    :return list: Tokens, or None if the parentheses don't balance, or there is anything else between the groups
+    """
+    _tokens = []
+    _idx = 0
+    while _idx < len(s):
+        if s[_idx].isspace():
+            _idx += 1
+        elif s[_idx] == "(":
+            _depth = 0
+            for _end in range(_idx, len(s)):
+                if s[_end] == "(":
+                    _depth += 1
+                elif s[_end] == ")":
+                    _depth -= 1
+                    if not _depth:
+                        break
+            if _depth:
+                return None
+            _tokens.append(s[_idx:_end + 1])
+            _idx = _end + 1
+        else:
+            _m = re_query_word.match(s, _idx)
+            if not _m:
+                return None
+            _tokens.append(_m.group(1).lower())
+            _idx = _m.end()
+    return _tokens
+
+
+def _invalid(expression):
+    """
+    Report an invalid group expression.
+
+    :param str expression: Expression
+    :return none:
+    """
+    print("Invalid input expression")
+    logger_query.warn("parse_expression: invalid expression: {}".format(expression))
+    return None
+
+
+def _make_leaf(expr):
+    """
+    Make a plan node for one comparison.
+
+    :param list expr: [key, operator, value], as translate_expression() gives it
+    :return tuple: Plan node
+    """
+    return "leaf", expr[0], expr[1], expr[2]
+
+
+def _make_node(kind, nodes):
+    """
+    Make an "and" or "or" node. Invalid (None) children are dropped, and nested nodes of the same kind are flattened.
+    In an "and", two or more numeric bounds on the same key are merged into one range.
+
+    :param str kind: "and" or "or"
+    :param list nodes: Child nodes
+    :return tuple: Plan node, or None if no child is valid
+    """
+    _nodes = []
+    for _node in nodes:
+        if _node is None:
+            continue
+        if _node[0] == kind:
+            _nodes.extend(_node[1])
+        else:
+            _nodes.append(_node)
+    if kind == "and":
+        _nodes = _merge_ranges(_nodes)
+    if not _nodes:
+        return None
+    if len(_nodes) == 1:
+        return _nodes[0]
+    return kind, _nodes
+
+
+def _merge_ranges(nodes):
+    """
+    Merge the numeric bounds on each key into one range node, i.e. "x >= 1" and "x < 5".
+
+    :param list nodes: Child nodes of an "and"
+    :return list: Child nodes
+    """
+    _bounds = {}
+    for _node in nodes:
+        if _node[0] == "leaf" and _node[2] in RANGE_OPERATORS and isinstance(_node[3], float):
+            _bounds.setdefault(_node[1], []).append((_node[2], _node[3]))
+        elif _node[0] == "range":
+            _bounds.setdefault(_node[1], []).extend(_node[2])
+    _nodes = []
+    _done = set()
+    for _node in nodes:
+        if _node[0] in ["leaf", "range"] and len(_bounds.get(_node[1], [])) > 1 and \
+                (_node[0] == "range" or (_node[2] in RANGE_OPERATORS and isinstance(_node[3], float))):
+            if _node[1] not in _done:
+                _done.add(_node[1])
+                _nodes.append(("range", _node[1], _bounds[_node[1]]))
+        else:
+            _nodes.append(_node)
+    return _nodes
+
+
+# PREDICATE
+
+
+def _build_predicate(plan):
+    """
+    Turn a plan into one generated function that checks a time series entry. Each comparison looks its key up once,
+    and and/or/not are plain python boolean operators, so an entry is checked without any other calls.
+
+    :param tuple plan: Plan node
+    :return function: f(tso) -> bool
+    """
+    _namespace = {"_missing": _MISSING}
+    _source = "def _predicate(tso):\n    return {}\n".format(_get_predicate_source(plan, _namespace))
+    exec(compile(_source, "<query>", "exec"), _namespace)
+    return _namespace["_predicate"]
+
+
+def _get_predicate_source(plan, namespace):
+    """
+    Write the python expression for one plan node. The keys and tests that it uses are put in the namespace.
+
+    :param tuple plan: Plan node
+    :param dict namespace: Names for the generated function
+    :return str: Python expression
+    """
+    _kind = plan[0]
+    if _kind in ["and", "or"]:
+        return "(" + " {} ".format(_kind).join(_get_predicate_source(i, namespace) for i in plan[1]) + ")"
+    elif _kind == "not":
+        return "(not {})".format(_get_predicate_source(plan[1], namespace))
+    _n = len(namespace)
+    namespace["_key{}".format(_n)] = plan[1]
+    namespace["_test{}".format(_n)] = _build_test(plan)
+    return "_test{0}(tso.get(_key{0}, _missing))".format(_n)
+
+
+def _build_test(plan):
+    """
+    Turn a comparison (or range) node into a function that checks one value. Values that can't be compared don't
+    match, and neither does a missing value.
+
+    :param tuple plan: "leaf" or "range" node
+    :return function: f(value) -> bool
+    """
+    if plan[0] == "range":
+        _bounds = [(OPERATORS[_op], _cut) for _op, _cut in plan[2]]
+
+        def _compare(v):
+            for _function, _cut in _bounds:
+                if not _function(v, _cut):
+                    return False
+            return True
+    else:
+        _op, _cut = plan[2], plan[3]
+        if _op == "in":
+            def _compare(v):
+                return _cut in v
+        elif _op == "~=":
+            _folded = _cut.casefold() if isinstance(_cut, str) else _cut
+
+            def _compare(v):
+                if isinstance(v, str) and isinstance(_cut, str):
+                    return v.casefold() == _folded
+                return v == _cut
+        elif _op in OPERATORS:
+            _function = OPERATORS[_op]
+
+            def _compare(v):
+                return _function(v, _cut)
+        else:
+            logger_query.warn("build_test: invalid operator: {}".format(_op))
+            return lambda v: False
+
+    _numeric = plan[0] == "range" or isinstance(plan[3], float) and plan[2] in OPERATORS
+
+    def _test(v):
+        # Numbers against a number can't fail. Skip the error handling.
+        if _numeric and v.__class__ in NUMBERS:
+            return _compare(v)
+        if v is _MISSING:
+            return False
+        try:
+            return bool(_compare(v))
+        except (TypeError, ValueError, AttributeError):
+            return False
+    return _test
+
+
+# MASK
+
+
+def _build_mask(plan, table):
+    """
+    Check a plan against all the rows of a time series table.
+
+    :param tuple plan: Plan node
+    :param obj table: Pandas DataFrame
+    :return obj: Numpy bool array
+    """
+    _kind = plan[0]
+    if _kind == "and":
+        return np.logical_and.reduce([_build_mask(i, table) for i in plan[1]])
+    elif _kind == "or":
+        return np.logical_or.reduce([_build_mask(i, table) for i in plan[1]])
+    elif _kind == "not":
+        return ~_build_mask(plan[1], table)
+    if plan[1] not in table.columns:
+        return np.zeros(len(table), dtype=bool)
+    _column = table.iloc[:, table.columns.get_indexer([plan[1]])[0]]
+    _mask = _get_vector_mask(plan, _column)
+    if _mask is None:
+        # No vectorized path for this column. Check each cell. <NA> cells are keys that the entry doesn't have.
+        _test = _build_test(plan)
+        _mask = np.fromiter((v is not pd.NA and _test(v) for v in _column.to_numpy(dtype=object)), dtype=bool,
+                            count=len(_column))
+    return _mask
+
+
+def _get_vector_mask(plan, column):
+    """
+    Check a comparison against a whole numeric or string column, with the same results as checking each value.
+    Numbers and text never compare equal, and can't be ordered, so those comparisons are all False.
+
+    :param tuple plan: "leaf" or "range" node
+    :param obj column: Pandas Series
+    :return obj: Numpy bool array, or None if the column isn't numeric or string
+    """
+    _array = column.array
+    _numeric = isinstance(_array, (pd.arrays.FloatingArray, pd.arrays.IntegerArray))
+    _string = isinstance(column.dtype, pd.StringDtype)
+    if not _numeric and not _string:
+        return None
+    if plan[0] == "range":
+        if not _numeric:
+            return np.zeros(len(column), dtype=bool)
+        return np.logical_and.reduce([_get_vector_mask(("leaf", plan[1], _op, _cut), column) for _op, _cut in plan[2]])
+    _op, _cut = plan[2], plan[3]
+    if _numeric != isinstance(_cut, float) or _op not in OPERATORS and _op not in ["in", "~="]:
+        return np.zeros(len(column), dtype=bool)
+    if _op == "in":
+        if _numeric:
+            return np.zeros(len(column), dtype=bool)
+        _result = column.str.contains(_cut, regex=False).array
+    elif _op == "~=" and _string:
+        _result = (column.str.casefold() == _cut.casefold()).array
+    else:
+        _result = OPERATORS.get(_op, operator.eq)(_array, _cut)
+    return _result.to_numpy(dtype=bool, na_value=False)
@@ -0,0 +1,351 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from .indexes import get_ts_index
+from .loggers import create_logger
+
+logger_spatial = create_logger("spatial")
+
+"""
+Spatial queries over a time series: entries in a lat/lon box, entries within a distance of a point, and the nearest
+entries to a point. Locations are the "geo_meanLat" and "geo_meanLon" of each entry, as extract() gives them.
+Entries without a numeric location never match.
+
+Every query is vectorized over the whole time series. With index=True, a time series list also keeps its locations in
+its index (see index_ts()), with a grid of 1 degree cells over them, so that box and radius queries only look at the
+entries in the cells they touch.
+"""
+
+LAT = "geo_meanLat"
+LON = "geo_meanLon"
+# Mean earth radius
+EARTH_RADIUS_KM = 6371.0088
+# Size of the grid cells, in degrees
+GRID_DEGREES = 1.0
+GRID_ROWS = int(math.ceil(180 / GRID_DEGREES))
+GRID_COLUMNS = int(math.ceil(360 / GRID_DEGREES))
+
+
+class GeoIndex(object):
+    """
+    Locations of the entries of a time series list, and a grid over them. Entries are sorted by grid cell, so the
+    entries of a run of cells in one grid row are one slice.
+    """
+
+    def __init__(self, ts):
+        self.ts = ts
+        self.size = 0
+        self.lats = np.empty(0, dtype=np.float64)
+        self.lons = np.empty(0, dtype=np.float64)
+        self.update()
+
+    def update(self):
+        """
+        Catch up with the time series list. Locations of appended entries are added, and the grid is sorted again.
+
+        :return none:
+        """
+        if len(self.ts) == self.size:
+            return
+        if len(self.ts) < self.size:
+            self.size = 0
+            self.lats = np.empty(0, dtype=np.float64)
+            self.lons = np.empty(0, dtype=np.float64)
+        _lats, _lons = get_coordinates(self.ts[self.size:])
+        self.lats = np.concatenate([self.lats, _lats])
+        self.lons = np.concatenate([self.lons, _lons])
+        self.size = len(self.ts)
+        # Entries without a location are left out of the grid
+        _valid = np.flatnonzero(~np.isnan(self.lats) & ~np.isnan(self.lons))
+        _cells = _get_cells(self.lats[_valid], self.lons[_valid])
+        _order = np.argsort(_cells, kind="stable")
+        self.order = _valid[_order]
+        self.cells = _cells[_order]
+        return
+
+    def get_candidates(self, lat_min, lat_max, lon_ranges):
+        """
+        Find the entries in the grid cells that a box touches.
+
+        :param float lat_min: Southern edge
+        :param float lat_max: Northern edge
+        :param list lon_ranges: (west, east) ranges of the box, in -180 to 180
+        :return obj: Numpy array of entry positions, sorted, each one once
+        """
+        _rows = np.arange(_get_row(lat_min), _get_row(lat_max) + 1)
+        _slices = []
+        for _west, _east in lon_ranges:
+            _starts = np.searchsorted(self.cells, _rows * GRID_COLUMNS + _get_column(_west), side="left")
+            _ends = np.searchsorted(self.cells, _rows * GRID_COLUMNS + _get_column(_east), side="right")
+            _slices.extend(self.order[_start:_end] for _start, _end in zip(_starts, _ends) if _end > _start)
+        if not _slices:
+            return np.empty(0, dtype=np.int64)
+        # The two ranges of a box that crosses the date line can share a grid column
+        return np.unique(np.concatenate(_slices))
+
+
+def get_coordinates(ts):
+    """
+    Get the location of each entry of a time series, or each row of a time series table.
+
+    :param list|obj ts: Time series, or time series table
+    :return obj: Numpy array of latitudes, NaN where missing
+    :return obj: Numpy array of longitudes, in -180 (included) to 180 (not included), NaN where missing
+    """
+    if isinstance(ts, pd.DataFrame):
+        _lats = _get_column_floats(ts, LAT)
+        _lons = _get_column_floats(ts, LON)
+    else:
+        _lats = np.fromiter((_get_float(tso.get(LAT)) for tso in ts), dtype=np.float64, count=len(ts))
+        _lons = np.fromiter((_get_float(tso.get(LON)) for tso in ts), dtype=np.float64, count=len(ts))
+    # Latitudes out of range aren't locations
+    _lats[(_lats < -90) | (_lats > 90)] = np.nan
+    return _lats, _normalize_lon(_lons)
+
+
+def search_box(ts, lat_min, lat_max, lon_min, lon_max, index=False):
+    """
+    Find the entries inside a lat/lon box, edges included. A box with lon_min east of lon_max crosses the date line.
+
+    :param list|obj ts: Time series, or time series table
+    :param float lat_min: Southern edge
+    :param float lat_max: Northern edge
+    :param float lon_min: Western edge
+    :param float lon_max: Eastern edge
+    :param bool index: Use (or make) the index of the time series list
+    :return list: Indices of the matched entries, in order
+    """
+    _lon_ranges = _get_lon_ranges(lon_min, lon_max)
+    if lat_min > lat_max:
+        return []
+    _geo = _get_geo_index(ts) if index else None
+    if _geo is None:
+        _lats, _lons = get_coordinates(ts)
+        _candidates = None
+    else:
+        _candidates = _geo.get_candidates(max(lat_min, -90), min(lat_max, 90), _lon_ranges)
+        _lats, _lons = _geo.lats[_candidates], _geo.lons[_candidates]
+    _mask = (_lats >= lat_min) & (_lats <= lat_max) & _get_lon_mask(_lons, _lon_ranges)
+    return _get_positions(_mask, _candidates)
+
+
+def search_radius(ts, lat, lon, radius, index=False):
+    """
+    Find the entries within a great circle distance of a point, edge included.
+
+    :param list|obj ts: Time series, or time series table
+    :param float lat: Latitude of the point
+    :param float lon: Longitude of the point
+    :param float radius: Distance, in km
+    :param bool index: Use (or make) the index of the time series list
+    :return list: Indices of the matched entries, in order
+    """
+    if radius < 0:
+        return []
+    _geo = _get_geo_index(ts) if index else None
+    if _geo is None:
+        _lats, _lons = get_coordinates(ts)
+        _candidates = None
+    else:
+        # Only the cells in the box around the circle
+        _dlat = math.degrees(radius / EARTH_RADIUS_KM)
+        _lat_min, _lat_max = lat - _dlat, lat + _dlat
+        if _lat_min <= -90 or _lat_max >= 90 or _dlat >= 90:
+            # The circle covers a pole, so every longitude
+            _lon_ranges = [(-180.0, 180.0)]
+        else:
+            _dlon = math.degrees(math.asin(min(1.0, math.sin(radius / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+            _lon_ranges = _get_lon_ranges(lon - _dlon, lon + _dlon)
+        _candidates = _geo.get_candidates(max(_lat_min, -90), min(_lat_max, 90), _lon_ranges)
+        _lats, _lons = _geo.lats[_candidates], _geo.lons[_candidates]
+    # Leave a little room for rounding at the edge of the circle
+    _mask = get_distances(lat, lon, _lats, _lons) <= radius * (1 + 1e-12)
+    return _get_positions(_mask, _candidates)
+
+
+def search_nearest(ts, lat, lon, k=1, index=False):
+    """
+    Find the entries nearest to a point, nearest first. Entries at the same distance keep their order.
+
+    :param list|obj ts: Time series, or time series table
+    :param float lat: Latitude of the point
+    :param float lon: Longitude of the point
+    :param int k: Number of entries
+    :param bool index: Use (or make) the index of the time series list
+    :return list: Indices of the nearest entries
+    :return list: Distance of each, in km
+    """
+    _geo = _get_geo_index(ts) if index else None
+    if _geo is None:
+        _lats, _lons = get_coordinates(ts)
+    else:
+        _lats, _lons = _geo.lats, _geo.lons
+    _valid = np.flatnonzero(~np.isnan(_lats) & ~np.isnan(_lons))
+    if k <= 0 or not len(_valid):
+        return [], []
+    _distances = get_distances(lat, lon, _lats[_valid], _lons[_valid])
+    if k < len(_valid):
+        _nearest = np.argpartition(_distances, k - 1)[:k]
+        # Every entry as far as the k-th one is a candidate, so that ties keep their order
+        _nearest = np.flatnonzero(_distances <= _distances[_nearest].max())
+    else:
+        _nearest = np.arange(len(_valid))
+    _order = _nearest[np.lexsort((_valid[_nearest], _distances[_nearest]))][:k]
+    return _valid[_order].tolist(), _distances[_order].tolist()
+
+
+def get_distances(lat, lon, lats, lons):
+    """
+    Great circle distances from one point to many, by the haversine formula.
+
+    :param float lat: Latitude of the point
+    :param float lon: Longitude of the point
+    :param obj lats: Numpy array of latitudes
+    :param obj lons: Numpy array of longitudes
+    :return obj: Numpy array of distances, in km
+    """
+    # Same wrap as the entries, so that 180 and -180 are exactly the same place
+    lon = _normalize_lon(lon)
+    _lat = math.radians(lat)
+    _lats = np.radians(lats)
+    _a = np.sin((_lats - _lat) / 2) ** 2 + \
+        math.cos(_lat) * np.cos(_lats) * np.sin(np.radians(lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(_a, 0, 1)))
+
+
+def _get_geo_index(ts):
+    """
+    Get the spatial index of a time series list, kept in its index. Made the first time a spatial query asks for it.
+
+    :param list|obj ts: Time series
+    :return obj: GeoIndex, or None if ts isn't a list
+    """
+    _index = get_ts_index(ts)
+    if _index is None:
+        return None
+    # Rebuilds the index, and drops the spatial index, if the entries changed
+    _index.update()
+    if _index.geo is None:
+        _index.geo = GeoIndex(ts)
+    _index.geo.update()
+    return _index.geo
+
+
+def _get_positions(mask, candidates):
+    """
+    Turn a mask into sorted entry positions.
+
+    :param obj mask: Numpy bool array, over all entries or over the candidates
+    :param obj candidates: Numpy array of candidate positions, sorted, or None if the mask is over all entries
+    :return list: Entry positions
+    """
+    if candidates is None:
+        return np.flatnonzero(mask).tolist()
+    return candidates[mask].tolist()
+
+
+def _get_lon_ranges(lon_min, lon_max):
+    """
+    Split the longitudes of a box into ranges in -180 to 180. A box that crosses the date line is two ranges.
+
+    :param float lon_min: Western edge
+    :param float lon_max: Eastern edge
+    :return list: (west, east) ranges
+    """
+    if lon_max - lon_min >= 360:
+        return [(-180.0, 180.0)]
+    _west = float(_normalize_lon(np.array([lon_min]))[0])
+    _east = float(_normalize_lon(np.array([lon_max]))[0])
+    if _west <= _east:
+        return [(_west, _east)]
+    # Crosses the date line. An eastern edge of 180 wraps to -180, which is the same place.
+    return [(_west, 180.0), (-180.0, _east)]
+
+
+def _get_lon_mask(lons, lon_ranges):
+    """
+    Check which longitudes are in any of the ranges.
+
+    :param obj lons: Numpy array of longitudes, in -180 to 180
+    :param list lon_ranges: (west, east) ranges
+    :return obj: Numpy bool array
+    """
+    _mask = np.zeros(len(lons), dtype=bool)
+    for _west, _east in lon_ranges:
+        _mask |= (lons >= _west) & (lons <= _east)
+    return _mask
+
+
+def _normalize_lon(lons):
+    """
+    Wrap longitudes into -180 to 180. 180 becomes -180, which is the same place.
+
+    :param obj lons: Numpy array of longitudes
+    :return obj: Numpy array of longitudes
+    """
+    return (lons + 180) % 360 - 180
+
+
+def _get_cells(lats, lons):
+    """
+    Get the grid cell of each location.
+
+    :param obj lats: Numpy array of latitudes
+    :param obj lons: Numpy array of longitudes
+    :return obj: Numpy array of cell numbers
+    """
+    _rows = np.clip(((lats + 90) // GRID_DEGREES).astype(np.int64), 0, GRID_ROWS - 1)
+    _columns = np.clip(((lons + 180) // GRID_DEGREES).astype(np.int64), 0, GRID_COLUMNS - 1)
+    return _rows * GRID_COLUMNS + _columns
+
+
+def _get_row(lat):
+    """
+    :param float lat: Latitude
+    :return int: Grid row
+    """
+    return min(max(int((lat + 90) // GRID_DEGREES), 0), GRID_ROWS - 1)
+
+
+def _get_column(lon):
+    """
+    :param float lon: Longitude
+    :return int: Grid column
+    """
+    return min(max(int((lon + 180) // GRID_DEGREES), 0), GRID_COLUMNS - 1)
+
+
+def _get_float(x):
+    """
+    Get a number as a float, or NaN if it isn't one. Text, even "12.5", and booleans aren't numbers.
+
+    :param any x: Value
+    :return float:
+    """
+    if x.__class__ is float:
+        return x
+    try:
+        if isinstance(x, (int, float, np.number)) and not isinstance(x, bool):
+            return float(x)
+    except (ValueError, OverflowError):
+        pass
+    return float("nan")
+
+
+def _get_column_floats(table, key):
+    """
+    Get a table column as floats, NaN where missing or not a number.
+
+    :param obj table: Pandas DataFrame
+    :param str key: Column name
+    :return obj: Numpy array
+    """
+    if key not in table.columns:
+        return np.full(len(table), np.nan)
+    _column = table[key]
+    if isinstance(_column.array, (pd.arrays.FloatingArray, pd.arrays.IntegerArray)):
+        return _column.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.fromiter((_get_float(v) for v in _column.to_numpy(dtype=object)), dtype=np.float64,
+                       count=len(_column))
@@ -1,5 +1,6 @@
 import copy
 import re
+from collections import ChainMap
 
 from .alternates import COMPARISONS
 from .misc import match_operators, cast_float
@@ -12,7 +13,7 @@ logger_ts = create_logger('time_series')
 
 # EXTRACT
 
-def extract(d, whichtables, mode, time):
+def extract(d, whichtables, mode, time, shared=False):
     """
     LiPD Version 1.3
     Main function to initiate LiPD to TSOs conversion.
@@ -29,6 +30,7 @@ def extract(d, whichtables, mode, time):
     :param dict d: Metadata for one LiPD file
     :param str whichtables: all, meas, summ, or ens
     :param str mode: paleo or chron mode
+    :param bool shared: Share the root and table data between the TSOs, instead of copying it into each one
     :return list _ts: Time series
     """
     logger_ts.info("enter extract_main")
@@ -57,7 +59,7 @@ def extract(d, whichtables, mode, time):
                 if k not in ["chronData", "paleoData"]:
                     _root[k] = v
         # Create tso dictionaries for each individual column (build on root data)
-        _ts = _extract_pc(d, _root, _pc, whichtables)
+        _ts = _extract_pc(d, _root, _pc, whichtables, shared)
     except Exception as e:
         logger_ts.error("extract: Exception: {}".format(e))
         print("extract: Exception: {}".format(e))
@@ -193,13 +195,14 @@ def _extract_authors(pub, idx, _root):
     return _root
 
 
-def _extract_pc(d, root, pc, whichtables):
+def _extract_pc(d, root, pc, whichtables, shared=False):
     """
     Extract all data from a PaleoData dictionary.
     :param dict d: PaleoData dictionary
     :param dict root: Time series root data
     :param str pc: paleoData or chronData
     :param str whichtables: all, meas, summ, or ens
+    :param bool shared: Share the root and table data between the TSOs
     :return list _ts: Time series
     """
     logger_ts.info("enter extract_pc")
@@ -209,7 +212,7 @@ def _extract_pc(d, root, pc, whichtables):
         for k, v in d[pc].items():
             if whichtables == "all" or whichtables == "meas":
                 for _table_name1, _table_data1 in v["measurementTable"].items():
-                    _ts = _extract_table(_table_data1, copy.deepcopy(root), pc, _ts, "meas")
+                    _ts = _extract_table(_table_data1, _get_table_root(root, {}, shared), pc, _ts, "meas", shared)
             if whichtables != "meas":
                 if "model" in v:
                     for _table_name1, _table_data1 in v["model"].items():
@@ -218,24 +221,38 @@ def _extract_pc(d, root, pc, whichtables):
                         if whichtables == "all" or whichtables == "summ":
                             if "summaryTable" in _table_data1:
                                 for _table_name2, _table_data2 in _table_data1["summaryTable"].items():
-                                    # take a copy of this tso root
-                                    _tso = copy.deepcopy(root)
-                                    # add in the method details
-                                    _tso.update(_method)
+                                    # take a copy of this tso root, with the method details added in
+                                    _tso = _get_table_root(root, _method, shared)
                                     # add in the table details
-                                    _ts = _extract_table(_table_data2, _tso, pc, _ts, "summ")
+                                    _ts = _extract_table(_table_data2, _tso, pc, _ts, "summ", shared)
                         if whichtables == "all" or whichtables == "ens":
                             if "ensembleTable" in _table_data1:
                                 for _table_name2, _table_data2 in _table_data1["ensembleTable"].items():
-                                    _tso = copy.deepcopy(root)
-                                    _tso.update(_method)
-                                    _ts = _extract_table(_table_data2, _tso, pc, _ts, "ens")
+                                    _tso = _get_table_root(root, _method, shared)
+                                    _ts = _extract_table(_table_data2, _tso, pc, _ts, "ens", shared)
 
     except Exception as e:
         logger_ts.warn("extract_pc: Exception: {}".format(e))
     return _ts
 
 
+def _get_table_root(root, method, shared=False):
+    """
+    Start the root data of one table. Shared, it is a new layer on top of the root (and method) data, which the
+    table items are written into. Otherwise, it is a copy of the root data.
+
+    :param dict root: Time series root data
+    :param dict method: Method data, formatted. Empty for measurement tables
+    :param bool shared: Share the root data
+    :return dict: Table root data
+    """
+    if shared:
+        return ChainMap({}, method, root) if method else ChainMap({}, root)
+    _current = copy.deepcopy(root)
+    _current.update(method)
+    return _current
+
+
 def _extract_method(method):
     """
     Make a timeseries-formatted version of model method data
@@ -337,7 +354,7 @@ def _extract_table_model(table_data, current, tt):
     return current
 
 
-def _extract_table(table_data, current, pc, ts, tt):
+def _extract_table(table_data, current, pc, ts, tt, shared=False):
     """
     Use the given table data to create a time series entry for each column in the table.
 
@@ -346,6 +363,7 @@ def _extract_table(table_data, current, pc, ts, tt):
     :param str pc: paleoData or chronData
     :param list ts: Time series (so far)
     :param bool summary: Summary Table or not
+    :param bool shared: Share the table data between the column entries, instead of copying it into each one
     :return list ts: Time series (so far)
     """
     current["tableType"] = tt
@@ -358,8 +376,11 @@ def _extract_table(table_data, current, pc, ts, tt):
     try:
         # Start creating entries using dictionary copies.
         for _col_name, _col_data in table_data["columns"].items():
-            # Add column data onto root items. Copy so we don't ruin original data
-            _col_tmp = _extract_columns(_col_data, copy.deepcopy(_table_tmp), pc)
+            # Add column data onto root items. Copy (or layer on top) so we don't ruin original data
+            if shared:
+                _col_tmp = _extract_columns(_col_data, _table_tmp.new_child(), pc)
+            else:
+                _col_tmp = _extract_columns(_col_data, copy.deepcopy(_table_tmp), pc)
             try:
                 ts.append(_col_tmp)
             except Exception as e:
@@ -0,0 +1,268 @@
+import hashlib
+import os
+import pickle
+import posixpath
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from .csvs import _reorder_csv
+from .loggers import create_logger
+
+logger_tracking = create_logger("tracking")
+
+"""
+Change tracking for LiPD data tables. Tracking is opt-in (settings["track_changes"]), so reads and writes that don't
+use it pay nothing for it.
+
+When a LiPD file is read, each csv table that would read back the same from its source csv is remembered by a
+fingerprint of its values, along with the precision that the table was written with. When the dataset is written again
+with the same precision, a table whose values still have the same fingerprint has its csv bytes read out of the source
+archive (which checks them against their CRC), with the md5 from the source bag manifest, instead of being formatted
+and hashed again. The bytes are compressed with the compression policy of the new file, like any other member. Tables
+that did change are written as usual. After a write, the sources point at the new LiPD file, so the next write is
+incremental as well.
+
+Only tables that the LiPD writer made are tracked. It records the precision in bag-info.txt. Files from other writers
+have no such record, so their tables are always written again.
+"""
+
+# Most datasets whose table sources are remembered. The oldest are forgotten first.
+MAX_DATASETS = 20000
+
+# Missing values that read back the same as "nan", which is the missing value the writer puts in the metadata
+NAN_MISSING_VALUES = ["nan", ""]
+
+# Bag-info entry that records the precision that the csv tables of a LiPD file were written with
+BAG_INFO_PRECISION = "LiPD-Csv-Precision"
+
+# Source of each tracked table, for each dataset name.
+# {dsn: {fingerprint: (path, size, mtime, member, crc, precision)}}
+_sources = OrderedDict()
+_lock = threading.Lock()
+
+
+def fingerprint_csv(data, filename=""):
+    """
+    Fingerprint the values of one csv table, in the same column order that the csv writer uses.
+
+    :param dict data: Csv data for one table. { "var1": {"number": 1, "values": []}, ... }
+    :param str filename: Csv filename
+    :return str: Fingerprint
+    """
+    return _fingerprint_columns(_reorder_csv(data, filename))
+
+
+def _fingerprint_columns(columns):
+    """
+    Hash a list of column values. Equal values give equal fingerprints. A list and an array of the same numbers do
+    not, which only costs a rewrite of that table.
+
+    :param list columns: Column values
+    :return str: Fingerprint
+    """
+    _md5 = hashlib.md5()
+    for _column in columns:
+        if isinstance(_column, np.ndarray) and _column.dtype != object:
+            _md5.update(repr((_column.dtype.str, _column.shape)).encode("utf-8"))
+            _md5.update(np.ascontiguousarray(_column).tobytes())
+        else:
+            _md5.update(pickle.dumps(_column, protocol=4))
+    return _md5.hexdigest()
+
+
+def get_sources(dsn):
+    """
+    Get the tracked table sources of a dataset. Used to hand them across a process boundary.
+
+    :param str dsn: Dataset name
+    :return dict: Table sources, keyed by fingerprint
+    """
+    with _lock:
+        return dict(_sources.get(dsn, {}))
+
+
+def put_sources(dsn, sources):
+    """
+    Set the tracked table sources of a dataset. Replaces whatever was tracked for it before.
+
+    :param str dsn: Dataset name
+    :param dict sources: Table sources, keyed by fingerprint
+    :return none:
+    """
+    with _lock:
+        _sources.pop(dsn, None)
+        if sources:
+            _sources[dsn] = sources
+            while len(_sources) > MAX_DATASETS:
+                _sources.popitem(last=False)
+    return
+
+
+def get_write_precision(z, member):
+    """
+    Find the precision that the LiPD writer recorded in the bag-info.txt of a LiPD file.
+
+    :param obj z: Open zipfile.ZipFile
+    :param str member: Member name of the jsonld file, i.e. "bag/data/metadata.jsonld"
+    :return int: Precision, or None if not recorded
+    """
+    _info = {}
+    try:
+        _root = posixpath.dirname(posixpath.dirname(member))
+        _text = z.read(posixpath.join(_root, "bag-info.txt")).decode("utf-8")
+        for _line in _text.splitlines():
+            _parts = _line.split(":", 1)
+            if len(_parts) == 2:
+                _info[_parts[0].strip()] = _parts[1].strip()
+        return int(_info[BAG_INFO_PRECISION])
+    except (KeyError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def track_read(path, dsn, csvs, members, precision=None):
+    """
+    Remember the source csv member of each table of a dataset that was just read. A table is only tracked when its
+    values are exactly the parsed columns of its csv file, its missing value reads back the same as "nan", and the
+    file records the precision that its tables were written with.
+
+    :param str path: Source path
+    :param str dsn: Dataset name
+    :param dict csvs: Csv data for the dataset, keyed by csv filename. As get_csv_from_metadata() gives it.
+    :param dict members: Source for each csv filename: (member name, CRC, parsed csv columns, missing value)
+    :param int precision: Precision that the tables were written with. None if unknown.
+    :return none:
+    """
+    _sources_dsn = {}
+    if precision is None:
+        put_sources(dsn, _sources_dsn)
+        return
+    try:
+        _stat = os.stat(path)
+        for _filename, _data in csvs.items():
+            if _filename not in members:
+                continue
+            _member, _crc, _parsed, _mv = members[_filename]
+            if str(_mv).lower() not in NAN_MISSING_VALUES:
+                continue
+            _columns = _reorder_csv(_data, _filename)
+            if len(_columns) != len(_parsed):
+                continue
+            _fingerprint = _fingerprint_columns(_columns)
+            # The values are usually the parsed column objects themselves. If not, compare them by value.
+            if not all(a is b for a, b in zip(_columns, _parsed)) and _fingerprint != _fingerprint_columns(_parsed):
+                continue
+            _sources_dsn[_fingerprint] = (path, _stat.st_size, _stat.st_mtime_ns, _member, _crc, precision)
+    except Exception as e:
+        logger_tracking.info("track_read: {}, {}".format(path, e))
+        _sources_dsn = {}
+    put_sources(dsn, _sources_dsn)
+    return
+
+
+def track_write(path, dsn, fingerprints, members, precision):
+    """
+    Point the tracked table sources of a dataset at the LiPD file that was just written.
+
+    :param str path: Path of the LiPD file written
+    :param str dsn: Dataset name
+    :param dict fingerprints: Fingerprint of each csv filename
+    :param dict members: (member name, CRC) of each csv filename in the new archive
+    :param int precision: Precision that the tables were written with
+    :return none:
+    """
+    _sources_dsn = {}
+    try:
+        _stat = os.stat(path)
+        for _filename, _fingerprint in fingerprints.items():
+            if _filename in members:
+                _member, _crc = members[_filename]
+                _sources_dsn[_fingerprint] = (path, _stat.st_size, _stat.st_mtime_ns, _member, _crc, precision)
+    except Exception as e:
+        logger_tracking.info("track_write: {}, {}".format(path, e))
+        _sources_dsn = {}
+    put_sources(dsn, _sources_dsn)
+    return
+
+
+def get_unchanged_members(dsn, csvs, precision):
+    """
+    Find the tables of a dataset that haven't changed since they were read (or last written), and read their csv bytes
+    out of the source LiPD file. A table is only copied when it was written with the same precision, and its source
+    file and member are exactly as they were when the table was tracked.
+
+    :param str dsn: Dataset name
+    :param dict csvs: Csv data for the dataset, keyed by csv filename
+    :param int precision: Precision that the tables are written with
+    :return dict: Csv member for each unchanged csv filename: (bytes, md5)
+    :return dict: Fingerprint of each csv filename
+    """
+    _unchanged = {}
+    _fingerprints = {}
+    _sources_dsn = get_sources(dsn)
+    _by_path = {}
+    for _filename, _data in csvs.items():
+        try:
+            _fingerprints[_filename] = fingerprint_csv(_data, _filename)
+        except Exception as e:
+            logger_tracking.info("get_unchanged_members: {}, {}".format(_filename, e))
+            continue
+        _source = _sources_dsn.get(_fingerprints[_filename])
+        if _source and _source[5] == precision:
+            _by_path.setdefault(_source[0], []).append((_filename, _source))
+    for _path, _tables in _by_path.items():
+        try:
+            _unchanged.update(_read_members(_path, _tables))
+        except Exception as e:
+            logger_tracking.info("get_unchanged_members: {}, {}".format(_path, e))
+    return _unchanged, _fingerprints
+
+
+def _read_members(path, tables):
+    """
+    Read the csv members of tracked tables out of one LiPD file. zipfile checks each one against its CRC.
+
+    :param str path: Source path
+    :param list tables: (csv filename, source) for each table in this file
+    :return dict: Csv member for each csv filename: (bytes, md5)
+    """
+    _members = {}
+    _stat = os.stat(path)
+    with zipfile.ZipFile(path) as z:
+        _manifests = {}
+        for _filename, (_path, _size, _mtime, _member, _crc, _precision) in tables:
+            if (_size, _mtime) != (_stat.st_size, _stat.st_mtime_ns):
+                continue
+            if z.getinfo(_member).CRC != _crc:
+                continue
+            _data = z.read(_member)
+            _md5 = _get_manifest_md5(z, _member, _manifests)
+            if not _md5:
+                _md5 = hashlib.md5(_data).hexdigest()
+            _members[_filename] = (_data, _md5)
+    return _members
+
+
+def _get_manifest_md5(z, member, manifests):
+    """
+    Look up the md5 of an archive member in the manifest-md5.txt of its bag.
+
+    :param obj z: Open zipfile.ZipFile
+    :param str member: Member name, i.e. "bag/data/x.csv"
+    :param dict manifests: Manifests that have been parsed already, keyed by bag root
+    :return str: md5, or empty string if not found
+    """
+    _root = posixpath.dirname(posixpath.dirname(member))
+    if _root not in manifests:
+        manifests[_root] = {}
+        try:
+            _text = z.read(posixpath.join(_root, "manifest-md5.txt")).decode("utf-8")
+            for _line in _text.splitlines():
+                _parts = _line.split(None, 1)
+                if len(_parts) == 2:
+                    manifests[_root][_parts[1].strip()] = _parts[0].lower()
+        except KeyError:
+            pass
+    return manifests[_root].get(member[len(_root) + 1:] if _root else member, "")
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 import json
 import requests
-import copy
 import os
 from .loggers import create_logger
-from .misc import is_ensemble, get_ensemble_counts, rm_values_fields
+from .misc import is_ensemble, get_ensemble_counts, copy_metadata
 from .csvs import get_csv_from_metadata
 from .jsons import idx_name_to_num
 
@@ -28,7 +27,7 @@ def get_validator_format(L):
     _api_data = []
 
     _j, _csvs = get_csv_from_metadata(L["dataSetName"], L)
-    _j = rm_values_fields(copy.deepcopy(L))
+    _j = copy_metadata(L, values=False)
     _j = idx_name_to_num(_j)
 
     # All the filenames being processed
@@ -1,27 +1,80 @@
 import zipfile
 import shutil
 import os
+import posixpath
+import time
 
 from .loggers import create_logger
 
 logger_zips = create_logger("zips")
 
+# Compression policies for LiPD archives: (compression method, deflate level). "stored" doesn't compress at all, and
+# is the fastest to read and write. "fast" and "max" trade write time for file size. Every policy is plain zip, which
+# any LiPD reader can open.
+COMPRESSION_POLICIES = {"stored": (zipfile.ZIP_STORED, None), "fast": (zipfile.ZIP_DEFLATED, 1),
+                        "default": (zipfile.ZIP_DEFLATED, 6), "max": (zipfile.ZIP_DEFLATED, 9)}
 
-def zipper(root_dir="", name="", path_name_ext=""):
+
+def zipper(root_dir="", name="", path_name_ext="", compression="default"):
     """
     Zips up directory back to the original location
+    Works on explicit paths, and never changes the current working directory.
     :param str root_dir: Root directory of the archive
     :param str name: <datasetname>.lpd
     :param str path_name_ext: /path/to/filename.lpd
+    :param str compression: Compression policy. One of COMPRESSION_POLICIES
     """
     logger_zips.info("re_zip: name: {}, dir_tmp: {}".format(path_name_ext, root_dir))
-    # creates a zip archive in current directory. "somefile.lpd.zip"
-    shutil.make_archive(path_name_ext, format='zip', root_dir=root_dir, base_dir=name)
-    # drop the .zip extension. only keep .lpd
-    os.rename("{}.zip".format(path_name_ext), path_name_ext)
+    _method, _level = COMPRESSION_POLICIES[compression]
+    with zipfile.ZipFile(path_name_ext, "w", compression=_method, compresslevel=_level) as z:
+        for _dir, _subdirs, _files in os.walk(os.path.join(root_dir, name)):
+            _subdirs.sort()
+            # Keep the directory entries, the same as shutil.make_archive does
+            z.write(_dir, os.path.relpath(_dir, root_dir))
+            for _file in sorted(_files):
+                _path = os.path.join(_dir, _file)
+                z.write(_path, os.path.relpath(_path, root_dir))
     return
 
 
+def zipper_from_memory(path_name_ext="", name="", files=None, compression="default"):
+    """
+    Zip up files that are held in memory, with the same layout as zipper() gives for the same files on disk.
+    Nothing is written to disk except the archive itself.
+    :param str path_name_ext: /path/to/filename.lpd, or a file that is open for binary writing
+    :param str name: Root directory of the files in the archive, i.e. "bag"
+    :param list files: (path, bytes) for each file. Paths are relative to the root directory, i.e. "data/x.csv"
+    :param str compression: Compression policy for the files. One of COMPRESSION_POLICIES
+    :return dict: ZipInfo of each file written, keyed by path
+    """
+    logger_zips.info("zipper_from_memory: name: {}, compression: {}".format(path_name_ext, compression))
+    _method, _level = COMPRESSION_POLICIES[compression]
+    _date_time = time.localtime(time.time())[:6]
+    _dirs = {}
+    _written = {}
+    for _path, _data in files or []:
+        _dirs.setdefault(posixpath.dirname(posixpath.join(name, _path)), []).append((_path, _data))
+    # Parent directories need an entry too, even when they hold no files
+    for _dir in list(_dirs):
+        while _dir:
+            _dir = posixpath.dirname(_dir)
+            if _dir:
+                _dirs.setdefault(_dir, [])
+    with zipfile.ZipFile(path_name_ext, "w", compression=_method, compresslevel=_level) as z:
+        # Same order as os.walk() with sorted directories and files
+        for _dir in sorted(_dirs, key=lambda i: i.split("/")):
+            _info = zipfile.ZipInfo(_dir + "/", _date_time)
+            _info.external_attr = (0o40755 << 16) | 0x10
+            z.writestr(_info, b"")
+            for _path, _data in sorted(_dirs[_dir], key=lambda i: i[0]):
+                _info = zipfile.ZipInfo(posixpath.join(name, _path), _date_time)
+                _info.external_attr = 0o100644 << 16
+                _info.compress_type = _method
+                z.writestr(_info, _data, compresslevel=_level)
+                _written[_path] = _info
+    return _written
+
+
 def unzipper(filename, dir_tmp):
     """
     Unzip .lpd file contents to tmp directory.
@@ -41,3 +94,34 @@ def unzipper(filename, dir_tmp):
     return
 
 
+def get_data_members(z):
+    """
+    Find the jsonld and csv members inside an open LiPD archive, without extracting anything to disk.
+    The data files live in "bag/data" (LiPD v1.3), "<dataSetName>/data" (< LiPD v1.2), or at the archive root.
+    Use the shallowest jsonld file found, and the csv files that sit next to it.
+
+    :param obj z: Open zipfile.ZipFile
+    :return str _jsonld: Member name of the jsonld file
+    :return list _csvs: Member names of the csv files
+    """
+    _jsonld = ""
+    _csvs = []
+    try:
+        _names = [i for i in z.namelist() if not i.endswith("/")]
+        _jsonlds = [i for i in _names if i.endswith(".jsonld")]
+        if not _jsonlds:
+            # No jsonld file found. Fallback to a json file.
+            _jsonlds = [i for i in _names if i.endswith(".json")]
+        if _jsonlds:
+            _jsonld = min(_jsonlds, key=lambda i: i.count("/"))
+            _dir_data = posixpath.dirname(_jsonld)
+            for _name in _names:
+                _dir, _file = posixpath.split(_name)
+                # Same rules as list_files(): skip hidden and temp files
+                if _dir == _dir_data and _file.endswith(".csv") and not _file.startswith(("$", "~", ".")):
+                    _csvs.append(_name)
+    except Exception as e:
+        logger_zips.debug("get_data_members: {}".format(e))
+    return _jsonld, _csvs
+
+
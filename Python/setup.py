@@ -52,6 +52,8 @@ setup(
     packages=find_packages(),
     url='https://github.com/nickmckay/LiPD-utilities',
     license='GNU Public',
+    # zipfile compresslevel (LiPD compression policies) needs python 3.7
+    python_requires=">=3.7",
     description='LiPD utilities to process, convert, and analyze data.',
     # long_description=long_description,
     long_description_content_type="text/markdown",
@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+import pytest
+
+from lipd.csvs import read_csv_from_bytes, CSV_ENGINES
+
+"""
+Checks for the csv readers on ragged files, whose rows don't all have the same number of cells. Every engine, with and
+without as_numpy, must give the columns of the default reader (python engine, lists): the first row sets the number of
+columns, and cells past it are dropped.
+"""
+
+RAGGED = {
+    "longer_rows": b"1,2\n3,4,5\n6,7,8,9\n",
+    "shorter_rows": b"1,2,3\n4,5\n6\n7,8,9\n",
+    "first_row_shortest": b"1\n2,3\n4,5,6\n",
+    "text_cells": b"a,1,x\nb,2\nc,3,y,z\n",
+    "blank_cells": b"1,,3\n4,5\n,6,7,8\n",
+    "blank_line": b"1,2\n\n3,4,5\n",
+    "uniform": b"1,2,3\n4,5,6\n",
+}
+
+
+def _plain(column):
+    """
+    Column values as plain python values. Blank cells of a numeric column are NaN in numpy, and "" in lists.
+    """
+    if isinstance(column, np.ndarray):
+        return ["nan" if math.isnan(v) else v for v in column.tolist()]
+    return ["nan" if v == "" or (isinstance(v, float) and math.isnan(v)) else v for v in column]
+
+
+@pytest.mark.parametrize("engine", CSV_ENGINES)
+@pytest.mark.parametrize("as_numpy", [False, True])
+@pytest.mark.parametrize("name", sorted(RAGGED))
+def test_ragged_matches_default_reader(name, as_numpy, engine):
+    _expected = read_csv_from_bytes(RAGGED[name], name, as_numpy=False, engine="python")
+    _found = read_csv_from_bytes(RAGGED[name], name, as_numpy=as_numpy, engine=engine)
+    assert len(_found) == len(_expected)
+    assert [_plain(i) for i in _found] == [_plain(i) for i in _expected]
+
+
+def test_ragged_column_count():
+    _columns = read_csv_from_bytes(RAGGED["longer_rows"], as_numpy=True)
+    assert len(_columns) == 2
+    assert [i.tolist() for i in _columns] == [[1.0, 3.0, 6.0], [2.0, 4.0, 7.0]]
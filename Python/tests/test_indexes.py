@@ -0,0 +1,122 @@
+import random
+from collections import ChainMap
+
+import numpy as np
+import pytest
+
+from lipd.indexes import index_ts, get_ts_index, drop_ts_index
+from lipd.query import compile_query, get_query_matches
+
+"""
+Index vs scan checks for time series queries. get_query_matches() with an index (indexes.TsIndex) must give the same
+matches, in the same order, as checking every entry, including after the time series list is changed.
+"""
+
+KEYS = ["a", "b", "c"]
+POOL = [1.0, 2.5, -3.0, 0, 7, float("nan"), float("inf"), float("-inf"), 2 ** 60, 2 ** 60 + 1, -2 ** 70, "coral",
+        "Coral", "marine sediment", "x", "", "7", ["coral", 2.0], True, False, None, np.float64(2.5), np.int64(7),
+        np.array([1.0])]
+OPS = ["==", ">", "<", ">=", "<=", "in", "~="]
+VALUES = ["1", "2.5", "-3", "0", "7", "coral", "CORAL", "x", "nan", "inf", "-inf", "1e30", "1152921504606846976",
+          "True", "true"]
+
+
+def _entry(rng):
+    _tso = {k: rng.choice(POOL) for k in KEYS if rng.random() < 0.8}
+    return ChainMap(_tso) if rng.random() < 0.1 else _tso
+
+
+def _leaf(rng):
+    return "{} {} {}".format(rng.choice(KEYS + ["zz"]), rng.choice(OPS), rng.choice(VALUES))
+
+
+def _group(rng, depth=0):
+    if depth > 1 or rng.random() < 0.4:
+        return "(" + _leaf(rng) + ")"
+    return "{}({} {} {})".format(rng.choice(["not ", ""]), _group(rng, depth + 1), rng.choice(["and", "or"]),
+                                 _group(rng, depth + 1))
+
+
+def _expressions(rng):
+    if rng.random() < 0.5:
+        return [_leaf(rng) for _ in range(rng.randint(1, 3))]
+    return _group(rng)
+
+
+def _check(query, ts):
+    _expected = get_query_matches(query, ts)
+    _found = get_query_matches(query, ts, get_ts_index(ts))
+    assert _found[1] == _expected[1], query
+    assert all(a is b for a, b in zip(_found[0], _expected[0]))
+
+
+@pytest.fixture
+def ts():
+    _ts = []
+    yield _ts
+    drop_ts_index(_ts)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_queries_match_scan(ts, seed, capsys):
+    rng = random.Random(seed)
+    ts.extend(_entry(rng) for _ in range(200))
+    index_ts(ts, ["a"])
+    for trial in range(400):
+        if trial == 50:
+            ts.extend(_entry(rng) for _ in range(50))
+        elif trial == 100:
+            ts.append(_entry(rng))
+        elif trial == 150:
+            del ts[-80:]
+        elif trial == 200:
+            ts[5] = _entry(rng)
+            ts.insert(0, _entry(rng))
+        elif trial == 250:
+            rng.shuffle(ts)
+        elif trial == 300:
+            ts.sort(key=lambda i: str(i.get("b")))
+        elif trial == 350:
+            del ts[:]
+            ts.extend(_entry(rng) for _ in range(30))
+        _query = compile_query(_expressions(rng))
+        if _query is not None:
+            _check(_query, ts)
+    capsys.readouterr()
+
+
+@pytest.mark.parametrize("expression", [
+    "not (zz == 1)",
+    "not (a == coral)",
+    "not (a > 0)",
+    "not (a == nan)",
+    "not ((a < 1) or (zz in x))",
+    "a == nan",
+    "a > -inf",
+    "a < inf",
+    "a == 1152921504606846976",
+    "a > 1152921504606846976",
+    "a == True",
+    "a == 1",
+    "a == 0",
+    "a in oral",
+    "a ~= coral",
+    "a == 7",
+])
+def test_special_values_match_scan(ts, expression):
+    ts.extend({"a": v} for v in POOL)
+    ts.extend({"b": v} for v in POOL)
+    _check(compile_query(expression), ts)
+    # Again after changes that the index has to catch
+    ts.append({"a": float("nan")})
+    _check(compile_query(expression), ts)
+    ts.reverse()
+    _check(compile_query(expression), ts)
+    del ts[3:]
+    _check(compile_query(expression), ts)
+
+
+def test_not_matches_missing_keys(ts):
+    ts.extend([{"a": 1.0}, {"b": 1.0}, {}])
+    _found, _idx = get_query_matches(compile_query("not (a == 1)"), ts, get_ts_index(ts))
+    assert _idx == [1, 2]
@@ -0,0 +1,87 @@
+import contextlib
+import io
+import os
+import pickle
+import threading
+import time
+
+import pytest
+
+import lipd.lipd_io as lipd_io
+from lipd.lazy import LazyColumn
+
+"""
+Checks for lazy tables (readLipd with lazy loading): a failed load can be retried, threads that use a table at the
+same time load it once, and lazy datasets can be pickled before they are loaded.
+"""
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Examples",
+                       "ODP1098B13.lpd")
+
+
+def _read(lazy):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return lipd_io._lipd_read(EXAMPLE, lazy=lazy)
+
+
+def _columns(D):
+    return D["paleoData"]["paleo0"]["measurementTable"]["paleo0measurement0"]["columns"]
+
+
+class _Loader(object):
+    """
+    Wraps a table loader. Fails the first `fail` calls, and counts every call.
+    """
+
+    def __init__(self, loader, fail=0, delay=0):
+        self.loader = loader
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.fail:
+            raise IOError("archive not available")
+        return self.loader()
+
+
+@pytest.fixture(scope="module")
+def expected():
+    return _columns(_read(False))["depth"]["values"]
+
+
+def test_failed_load_is_retried(capsys, expected):
+    _column = _columns(_read(True))["depth"]
+    _table = _column._lazy
+    _table.loader = _Loader(_table.loader, fail=1)
+    with pytest.raises(KeyError):
+        _column["values"]
+    assert "unable to load table values" in capsys.readouterr().out
+    assert not _table.loaded
+    assert _column._lazy is _table
+    assert _column["values"] == expected
+    assert _table.loaded and _table.loader.calls == 2
+    assert _column._lazy is None
+
+
+def test_threads_load_once(expected):
+    _columns_lazy = _columns(_read(True))
+    _table = _columns_lazy["depth"]._lazy
+    _table.loader = _Loader(_table.loader, delay=0.2)
+    _results = []
+    _threads = [threading.Thread(target=lambda: _results.append(_columns_lazy["depth"]["values"])) for _ in range(8)]
+    for _thread in _threads:
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+    assert _table.loader.calls == 1
+    assert _results == [expected] * 8
+
+
+def test_pickle_before_load(expected):
+    D = pickle.loads(pickle.dumps(_read(True)))
+    _column = _columns(D)["depth"]
+    assert isinstance(_column, LazyColumn) and not _column._lazy.loaded
+    assert _column["values"] == expected
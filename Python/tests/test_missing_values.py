@@ -0,0 +1,161 @@
+import json
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+from lipd.blanks import EMPTY
+from lipd.csvs import _is_numeric_data
+from lipd.misc import _replace_missing_values_column
+
+"""
+Old vs new checks for the vectorized missing value replacement (misc._replace_missing_values_column) and numeric
+detection (csvs._is_numeric_data).
+
+data/missing_values_corpus.json holds columns with the output of the per-entry implementations that these replaced.
+The same per-entry implementations are kept below, as the reference for the randomized cases.
+
+Corpus case keys:
+    values:   Column values. NaN is written as NaN, and None as null.
+    mv:       Missing value in use
+    input:    "list" (values as is), "array" (float numpy array) or "scalars" (list of numpy float64 entries)
+    replaced: Column values after replacing missing values
+    numeric:  _is_numeric_data([values]). null when it raises TypeError.
+"""
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "missing_values_corpus.json")
+
+
+def _reference_replace_missing_values_column(values, mv):
+    """
+    Per-entry missing value replacement, as before vectorizing.
+    """
+    for idx, v in enumerate(values):
+        try:
+            if v in EMPTY or v == mv:
+                values[idx] = "nan"
+            elif math.isnan(float(v)):
+                values[idx] = "nan"
+            else:
+                values[idx] = v
+        except (TypeError, ValueError):
+            values[idx] = v
+
+    return values
+
+
+def _reference_is_numeric_data(ll):
+    """
+    Per-entry numeric detection, as before vectorizing.
+    """
+    for l in ll:
+        try:
+            if isinstance(l, np.ndarray):
+                if np.isnan(l).any():
+                    return False
+                continue
+            if any(math.isnan(float(i)) or isinstance(i, str) for i in l):
+                return False
+        except ValueError:
+            return False
+    return True
+
+
+def _get_input(case):
+    """
+    Make the column values for a corpus case.
+    """
+    if case["input"] == "array":
+        return np.array(case["values"], dtype=float)
+    elif case["input"] == "scalars":
+        return [np.float64(v) for v in case["values"]]
+    return list(case["values"])
+
+
+def _get_numeric(values):
+    """
+    _is_numeric_data output for one column, or None when it raises TypeError.
+    """
+    try:
+        return _is_numeric_data([values])
+    except TypeError:
+        return None
+
+
+def _get_reference_numeric(values):
+    try:
+        return _reference_is_numeric_data([values])
+    except TypeError:
+        return None
+
+
+def _plain(values):
+    """
+    Column values as plain python values, with their types, so numpy and json output can be compared.
+    """
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    _out = []
+    for v in values:
+        if isinstance(v, np.floating):
+            v = float(v)
+        if isinstance(v, float) and math.isnan(v):
+            _out.append((float, "NaN"))
+        else:
+            _out.append((type(v), v))
+    return _out
+
+
+def _load_corpus():
+    with open(CORPUS) as f:
+        return json.load(f)
+
+
+def _random_column(rng):
+    """
+    Random column of the kinds of entries that the csv reader and the metadata produce.
+    """
+    _pool = [
+        lambda: rng.uniform(-1000, 1000),
+        lambda: float(rng.randint(-5, 5)),
+        lambda: float("nan"),
+        lambda: -9999.0,
+        lambda: rng.choice(["nan", "NaN", "NAN", "-9999", "-9999.0", "1.5", "abc", "", " ", "na", "n/a", "?", "'",
+                            "''", "inf", "-inf", "1e3", "None", "missing"]),
+        lambda: rng.randint(-10, 10),
+        lambda: -9999,
+        lambda: None,
+        lambda: True,
+    ]
+    _kinds = rng.sample(range(len(_pool)), rng.randint(1, 4))
+    return [_pool[rng.choice(_kinds)]() for _ in range(rng.randint(0, 40))]
+
+
+@pytest.mark.parametrize("case", _load_corpus(), ids=lambda case: case["id"])
+def test_replace_missing_values_corpus(case):
+    assert _plain(_replace_missing_values_column(_get_input(case), case["mv"])) == _plain(case["replaced"])
+
+
+@pytest.mark.parametrize("case", _load_corpus(), ids=lambda case: case["id"])
+def test_is_numeric_data_corpus(case):
+    assert _get_numeric(_get_input(case)) == case["numeric"]
+
+
+@pytest.mark.parametrize("case", _load_corpus(), ids=lambda case: case["id"])
+def test_reference_matches_corpus(case):
+    # The corpus was made with the old implementations. Check that the reference copies here still agree with it.
+    assert _plain(_reference_replace_missing_values_column(_get_input(case), case["mv"])) == _plain(case["replaced"])
+    assert _get_reference_numeric(_get_input(case)) == case["numeric"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_columns_match_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        _values = _random_column(rng)
+        _mv = rng.choice([-9999, -9999.0, "-9999", "nan", "", 0, None])
+        assert _plain(_replace_missing_values_column(list(_values), _mv)) == \
+            _plain(_reference_replace_missing_values_column(list(_values), _mv))
+        assert _get_numeric(list(_values)) == _get_reference_numeric(list(_values))
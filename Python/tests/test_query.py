@@ -0,0 +1,127 @@
+import random
+
+import numpy as np
+import pytest
+
+import lipd
+from lipd.dataframes import ts_to_table
+from lipd.indexes import get_ts_index, drop_ts_index
+from lipd.query import compile_query, get_query_matches
+
+"""
+Checks for time series queries (filterTs, queryTs, and lipd.query).
+
+The old get_matches loop had two quirks that were dropped when queries were compiled: its match flag carried over
+from one entry to the next after a failed "in" test, and a comparison that raised returned the time series unfiltered.
+queryTs with a list of expressions also kept only the matches of the last one. The tests below pin the new behavior.
+Random queries must give the same matches from the generated predicate, the table mask, and the index.
+"""
+
+KEYS = ["archiveType", "geo_meanLat", "geo_meanElev", "paleoData_variableName"]
+POOL = {
+    "archiveType": ["coral", "Coral", "marine sediment", "lake sediment", "", "7", 3.0],
+    "geo_meanLat": [-90.0, -45.5, 0.0, 12.25, 45.5, 90.0, float("nan"), "unknown", 7],
+    "geo_meanElev": [-4000.0, -12.0, 0.0, 150.0, 2000.0, 5000.0, 2 ** 60, True],
+    "paleoData_variableName": ["d18O", "sst", "SST", "age", "depth", "Mg/Ca", "d18O sst"],
+}
+OPS = ["==", ">", "<", ">=", "<=", "in", "~="]
+VALUES = ["coral", "CORAL", "sediment", "d18O", "sst", "0", "12.25", "-12", "2000", "90", "-90", "nan", "7", "1e30",
+          "1152921504606846976"]
+
+
+def _query(ts, expression):
+    return lipd.queryTs(ts, expression)
+
+
+def _entry(rng, typed=False):
+    """
+    Random time series entry. A typed entry only has strings for text keys and floats for numeric keys, so that its
+    table gets string and float columns, which are checked without a per-cell loop.
+    """
+    _tso = {k: rng.choice(POOL[k]) for k in KEYS if rng.random() < 0.85}
+    if typed:
+        _tso = {k: v for k, v in _tso.items() if isinstance(v, str) == isinstance(POOL[k][0], str)
+                and not isinstance(v, (bool, int))}
+    return _tso
+
+
+def _leaf(rng):
+    return "{} {} {}".format(rng.choice(KEYS + ["geo_siteName"]), rng.choice(OPS), rng.choice(VALUES))
+
+
+def _group(rng, depth=0):
+    if depth > 1 or rng.random() < 0.4:
+        return "(" + _leaf(rng) + ")"
+    return "{}({} {} {})".format(rng.choice(["not ", ""]), _group(rng, depth + 1), rng.choice(["and", "or"]),
+                                 _group(rng, depth + 1))
+
+
+@pytest.fixture(autouse=True)
+def quiet(capsys):
+    yield
+    capsys.readouterr()
+
+
+def test_failed_in_does_not_leak():
+    # The old loop kept the match flag of entry 0 for entry 1
+    ts = [{"archiveType": "coral"}, {"archiveType": "lake"}, {"archiveType": "coral reef"}]
+    assert _query(ts, "archiveType in cor") == [0, 2]
+    assert lipd.filterTs(ts, "archiveType in cor") == [ts[0], ts[2]]
+
+
+def test_failed_comparison_is_no_match():
+    # The old loop returned the time series unfiltered when a comparison raised, like text against a number
+    ts = [{"geo_meanLat": 10.0}, {"geo_meanLat": "unknown"}, {"geo_meanLat": -10.0}, {"geo_meanLat": None}]
+    assert _query(ts, "geo_meanLat > 0") == [0]
+    assert lipd.filterTs(ts, "geo_meanLat > 0") == [ts[0]]
+    assert _query(ts, "geo_meanLat <= 0") == [2]
+
+
+def test_missing_key_is_no_match():
+    ts = [{"archiveType": "coral"}, {}]
+    assert _query(ts, "archiveType == coral") == [0]
+    assert _query(ts, "not (archiveType == coral)") == [1]
+
+
+def test_query_list_intersects():
+    # The old queryTs kept only the matches of the last expression
+    ts = [{"archiveType": "coral", "geo_meanLat": 10.0}, {"archiveType": "coral", "geo_meanLat": -10.0},
+          {"archiveType": "lake", "geo_meanLat": 10.0}]
+    assert _query(ts, ["archiveType == coral", "geo_meanLat > 0"]) == [0]
+    assert lipd.filterTs(ts, ["archiveType == coral", "geo_meanLat > 0"]) == [ts[0]]
+    assert _query(ts, ["geo_meanLat > 0"]) == [0, 2]
+
+
+def test_case_insensitive_equals():
+    ts = [{"archiveType": "Coral"}, {"archiveType": "coral"}, {"archiveType": "coral reef"}]
+    assert _query(ts, "archiveType ~= CORAL") == [0, 1]
+    assert _query(ts, "archiveType == coral") == [1]
+
+
+def test_compiled_query_reused():
+    ts = [{"geo_meanLat": 10.0}, {"geo_meanLat": -10.0}]
+    _compiled = lipd.compileQuery("geo_meanLat > 0")
+    assert _query(ts, _compiled) == [0]
+    assert _query(list(reversed(ts)), _compiled) == [1]
+
+
+@pytest.mark.parametrize("typed", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_predicate_mask_and_index_agree(seed, typed):
+    rng = random.Random(seed)
+    ts = [_entry(rng, typed) for _ in range(150)]
+    _table = ts_to_table(ts)
+    if typed:
+        assert {str(i) for i in _table.dtypes} <= {"string", "Float64"}
+    try:
+        for _ in range(300):
+            _expressions = [_leaf(rng) for _ in range(rng.randint(1, 3))] if rng.random() < 0.5 else _group(rng)
+            _compiled = compile_query(_expressions)
+            if _compiled is None:
+                continue
+            _expected = [idx for idx, tso in enumerate(ts) if _compiled.match(tso)]
+            assert get_query_matches(_compiled, ts)[1] == _expected, _expressions
+            assert np.flatnonzero(_compiled.mask(_table)).tolist() == _expected, _expressions
+            assert get_query_matches(_compiled, ts, get_ts_index(ts))[1] == _expected, _expressions
+    finally:
+        drop_ts_index(ts)
@@ -0,0 +1,170 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from lipd.dataframes import ts_to_table
+from lipd.indexes import drop_ts_index
+from lipd.spatial import search_box, search_radius, search_nearest, EARTH_RADIUS_KM
+
+"""
+Brute force checks for the spatial queries. Each query is checked entry by entry with the haversine formula and plain
+longitude arithmetic, on a time series list (scanned and indexed) and on its ts_to_table table.
+Locations include the poles, the date line, longitudes given as 180 and as -180, longitudes past 180, and entries
+without a numeric location.
+"""
+
+EDGE_LATS = [-90.0, 90.0, 0.0, 89.99, -89.5]
+EDGE_LONS = [180.0, -180.0, 179.999, -179.999, 0.0, 359.0, 540.0]
+
+
+def _distance(lat1, lon1, lat2, lon2):
+    lon1, lon2 = _normalize(lon1), _normalize(lon2)
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    _h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, _h)))
+
+
+def _normalize(lon):
+    return (lon + 180) % 360 - 180
+
+
+def _location(tso):
+    """
+    Location of an entry, or None if it has no numeric location.
+    """
+    _lat, _lon = tso.get("geo_meanLat"), tso.get("geo_meanLon")
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (_lat, _lon)):
+        return None
+    if math.isnan(_lat) or math.isnan(_lon) or not -90 <= _lat <= 90:
+        return None
+    return _lat, _lon
+
+
+def _in_box(tso, lat_min, lat_max, lon_min, lon_max):
+    _loc = _location(tso)
+    if _loc is None or not lat_min <= _loc[0] <= lat_max:
+        return False
+    if lon_max - lon_min >= 360:
+        return True
+    _lon, _west, _east = _normalize(_loc[1]), _normalize(lon_min), _normalize(lon_max)
+    if _west <= _east:
+        return _west <= _lon <= _east
+    return _lon >= _west or _lon <= _east
+
+
+def _entry(rng):
+    _r = rng.random()
+    if _r < 0.05:
+        return {}
+    if _r < 0.1:
+        return {"geo_meanLat": rng.choice(["12.5", "inf", None, True, float("nan"), 95.0]), "geo_meanLon": 1.0}
+    _lat = rng.choice([rng.uniform(-90, 90), rng.choice(EDGE_LATS), float(rng.randint(-90, 90))])
+    _lon = rng.choice([rng.uniform(-180, 180), rng.choice(EDGE_LONS), float(rng.randint(-180, 180))])
+    return {"geo_meanLat": _lat, "geo_meanLon": _lon}
+
+
+def _searches(ts, table):
+    """
+    The same query on the scanned list, the indexed list, and the table.
+    """
+    return [lambda f, *args: f(ts, *args, index=False), lambda f, *args: f(ts, *args, index=True),
+            lambda f, *args: f(table, *args)]
+
+
+@pytest.fixture
+def ts():
+    _ts = []
+    yield _ts
+    drop_ts_index(_ts)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_box_matches_brute_force(ts, seed):
+    rng = random.Random(seed)
+    ts.extend(_entry(rng) for _ in range(1500))
+    for trial in range(150):
+        if trial == 75:
+            rng.shuffle(ts)
+            ts.append({"geo_meanLat": 0.0, "geo_meanLon": 180.0})
+        _table = ts_to_table(ts)
+        _lat_min = rng.choice([rng.uniform(-95, 90), -90.0, 0.0, 89.99])
+        _lat_max = rng.choice([_lat_min + rng.uniform(0, 60), 90.0, _lat_min])
+        _lon_min = rng.choice([rng.uniform(-200, 200), -180.0, 170.0, 180.0])
+        _lon_max = rng.choice([_lon_min + rng.uniform(0, 400), 180.0, -180.0, _lon_min + 20, _lon_min - 30])
+        _args = (_lat_min, _lat_max, _lon_min, _lon_max)
+        _expected = [idx for idx, tso in enumerate(ts) if _in_box(tso, *_args)]
+        for _search in _searches(ts, _table):
+            assert _search(search_box, *_args) == _expected, _args
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_radius_matches_brute_force(ts, seed):
+    rng = random.Random(seed)
+    ts.extend(_entry(rng) for _ in range(1500))
+    _table = ts_to_table(ts)
+    for _ in range(150):
+        _lat = rng.choice([rng.uniform(-90, 90), 90.0, -90.0, 0.0])
+        _lon = rng.choice([rng.uniform(-180, 180), 180.0, -180.0, 179.9])
+        _radius = rng.choice([rng.uniform(0, 3000), 20000.0, 0.0, 100.0])
+        _expected = []
+        for idx, tso in enumerate(ts):
+            _loc = _location(tso)
+            if _loc is not None and _distance(_lat, _lon, _loc[0], _loc[1]) <= _radius * (1 + 1e-12):
+                _expected.append(idx)
+        for _search in _searches(ts, _table):
+            assert _search(search_radius, _lat, _lon, _radius) == _expected, (_lat, _lon, _radius)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_nearest_matches_brute_force(ts, seed):
+    rng = random.Random(seed)
+    ts.extend(_entry(rng) for _ in range(1500))
+    _table = ts_to_table(ts)
+    for _ in range(50):
+        _lat = rng.choice([rng.uniform(-90, 90), 90.0, -90.0])
+        _lon = rng.choice([rng.uniform(-180, 180), 180.0, -180.0])
+        _k = rng.choice([1, 5, 50, 5000])
+        _distances = sorted((_distance(_lat, _lon, _loc[0], _loc[1]), idx) for idx, _loc in
+                            ((idx, _location(tso)) for idx, tso in enumerate(ts)) if _loc is not None)[:_k]
+        for _search in _searches(ts, _table):
+            _idxs, _found = _search(search_nearest, _lat, _lon, _k)
+            assert len(_idxs) == len(_distances)
+            assert np.allclose(_found, [d for d, idx in _distances], rtol=1e-9, atol=1e-6)
+            # Ties may come in any order, but each index is at its own distance
+            for idx, d in zip(_idxs, _found):
+                assert math.isclose(_distance(_lat, _lon, *_location(ts[idx])), d, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def test_date_line_box():
+    ts = [{"geo_meanLat": 0.0, "geo_meanLon": 180.0}, {"geo_meanLat": 0.0, "geo_meanLon": -180.0},
+          {"geo_meanLat": 0.0, "geo_meanLon": 175.0}, {"geo_meanLat": 0.0, "geo_meanLon": -175.0},
+          {"geo_meanLat": 0.0, "geo_meanLon": 0.0}]
+    for _index in (False, True):
+        assert search_box(ts, -10, 10, 170, -170, _index) == [0, 1, 2, 3]
+        assert search_box(ts, -10, 10, 179, 180, _index) == [0, 1]
+        assert search_box(ts, -10, 10, -180, -179, _index) == [0, 1]
+        assert search_box(ts, -10, 10, -180, 180, _index) == [0, 1, 2, 3, 4]
+        # 180 and -180 are the same place
+        assert search_radius(ts, 0, 180, 0, _index) == [0, 1]
+        assert search_radius(ts, 0, -180, 0, _index) == [0, 1]
+        assert search_nearest(ts, 0, 180, 2, _index) == ([0, 1], [0.0, 0.0])
+    drop_ts_index(ts)
+
+
+def test_poles_radius():
+    # Every longitude is the same place at a pole
+    ts = [{"geo_meanLat": 90.0, "geo_meanLon": lon} for lon in (-180.0, -90.0, 0.0, 90.0, 180.0)]
+    ts.append({"geo_meanLat": -90.0, "geo_meanLon": 0.0})
+    assert search_radius(ts, 90, 45, 1) == [0, 1, 2, 3, 4]
+    assert search_radius(ts, 90, 45, 1, index=True) == [0, 1, 2, 3, 4]
+    assert search_radius(ts, 89.9, 0, 20) == [0, 1, 2, 3, 4]
+    drop_ts_index(ts)
+
+
+def test_text_is_not_a_location():
+    ts = [{"geo_meanLat": "12.5", "geo_meanLon": "20"}, {"geo_meanLat": "inf", "geo_meanLon": 20.0},
+          {"geo_meanLat": 12.5, "geo_meanLon": 20.0}]
+    assert search_box(ts, -90, 90, -180, 180) == [2]
+    assert search_box(ts_to_table(ts), -90, 90, -180, 180) == [2]
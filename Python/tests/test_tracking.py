@@ -0,0 +1,172 @@
+import contextlib
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+
+import lipd.lipd_io as lipd_io
+from lipd.tracking import get_write_precision, get_sources
+
+"""
+Checks for change tracking (settings["track_changes"]) on write: which tables are copied from their source LiPD file,
+and that the files written with copies are valid zip archives and valid bags.
+
+The example file was made by another writer, so its tables are written in full the first time. Files written here
+record their precision, so reading one back and writing it again copies the tables that haven't changed.
+"""
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Examples",
+                       "ODP1098B13.lpd")
+DSN = "ODP1098B13"
+PALEO_CSV = "ODP1098B13.paleo0measurement0.csv"
+CHRON_CSV = "ODP1098B13.chron0measurement0.csv"
+
+
+@pytest.fixture(scope="module")
+def first(tmp_path_factory):
+    """
+    The example file, written once with tracking. Its tables can be copied on the next write.
+    """
+    return _write(_read(EXAMPLE), tmp_path_factory.mktemp("first"))
+
+
+@pytest.fixture(scope="module")
+def tables(first):
+    """
+    Every csv filename in the example.
+    """
+    return sorted(_csv_members(first))
+
+
+@pytest.fixture
+def formatted(monkeypatch):
+    """
+    Record the csv filenames that each write formats, i.e. didn't copy.
+    """
+    _formatted = []
+    _get_csv_bytes = lipd_io.get_csv_bytes
+
+    def _spy(csvs, precision):
+        _formatted.extend(csvs)
+        return _get_csv_bytes(csvs, precision)
+
+    monkeypatch.setattr(lipd_io, "get_csv_bytes", _spy)
+    return _formatted
+
+
+def _read(path, track=True):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return lipd_io._lipd_read(path, track=track)
+
+
+def _write(D, path, precision=3, compression="default", track=True):
+    os.makedirs(str(path), exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return lipd_io._lipd_write(D, str(path), precision, compression=compression, track=track)
+
+
+def _csv_members(path):
+    with zipfile.ZipFile(path) as z:
+        return {i.filename.rsplit("/", 1)[-1]: z.read(i) for i in z.infolist() if i.filename.endswith(".csv")}
+
+
+def _check_archive(path, compression="default"):
+    """
+    The archive reads back with good CRCs, every payload file is in the md5 manifest with its own md5, and the members
+    use the compression method of the policy.
+    """
+    _method = {"stored": zipfile.ZIP_STORED}.get(compression, zipfile.ZIP_DEFLATED)
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        _manifest = {}
+        for _line in z.read("bag/manifest-md5.txt").decode("utf-8").splitlines():
+            _md5, _name = _line.split(None, 1)
+            _manifest[_name] = _md5
+        _payload = [i for i in z.infolist() if i.filename.startswith("bag/data/") and not i.is_dir()]
+        assert sorted(_manifest) == sorted(i.filename[4:] for i in _payload)
+        for _info in _payload:
+            assert hashlib.md5(z.read(_info)).hexdigest() == _manifest[_info.filename[4:]]
+            assert _info.compress_type == _method
+        _oxum = "{}.{}".format(sum(i.file_size for i in _payload), len(_payload))
+        assert "Payload-Oxum: {}".format(_oxum) in z.read("bag/bag-info.txt").decode("utf-8")
+
+
+def _paleo_values(D, column="depth"):
+    return D["paleoData"]["paleo0"]["measurementTable"]["paleo0measurement0"]["columns"][column]["values"]
+
+
+def test_write_precision_recorded(tmp_path):
+    with zipfile.ZipFile(EXAMPLE) as z:
+        assert get_write_precision(z, "bag/data/metadata.jsonld") is None
+    _path = _write(_read(EXAMPLE), tmp_path / "a", precision=4)
+    with zipfile.ZipFile(_path) as z:
+        assert get_write_precision(z, "bag/data/metadata.jsonld") == 4
+
+
+def test_foreign_file_written_in_full(tmp_path, formatted, tables):
+    _path = _write(_read(EXAMPLE), tmp_path)
+    assert sorted(formatted) == tables
+    assert {CHRON_CSV, PALEO_CSV} <= set(tables)
+    _check_archive(_path)
+
+
+def test_unchanged_tables_copied(tmp_path, formatted, first):
+    _check_archive(first)
+    _second = _write(_read(first), tmp_path)
+    assert formatted == []
+    assert _csv_members(_second) == _csv_members(first)
+    _check_archive(_second)
+    # The sources point at the new file, so the next write copies from it
+    assert {i[0] for i in get_sources(DSN).values()} == {_second}
+
+
+def test_write_in_place_copies(tmp_path, formatted, first):
+    _path = _write(_read(first), tmp_path)
+    del formatted[:]
+    assert _write(_read(_path), tmp_path) == _path
+    assert formatted == []
+    assert _csv_members(_path) == _csv_members(first)
+    _check_archive(_path)
+
+
+def test_changed_table_formatted(tmp_path, formatted, first):
+    D = _read(first)
+    _paleo_values(D)[0] = 12345.5
+    _second = _write(D, tmp_path)
+    assert formatted == [PALEO_CSV]
+    _check_archive(_second)
+    assert _csv_members(_second)[CHRON_CSV] == _csv_members(first)[CHRON_CSV]
+    assert _csv_members(_second)[PALEO_CSV] != _csv_members(first)[PALEO_CSV]
+    assert _paleo_values(_read(_second))[0] == 12345.5
+
+
+def test_other_precision_formatted(tmp_path, formatted, first, tables):
+    _second = _write(_read(first), tmp_path, precision=4)
+    assert sorted(formatted) == tables
+    _check_archive(_second)
+
+
+@pytest.mark.parametrize("compression", ["stored", "fast"])
+def test_other_compression_copied(tmp_path, formatted, first, compression):
+    # Copies are compressed again with the policy of the new file
+    _second = _write(_read(first), tmp_path, compression=compression)
+    assert formatted == []
+    assert _csv_members(_second) == _csv_members(first)
+    _check_archive(_second, compression)
+
+
+def test_changed_source_formatted(tmp_path, formatted, first, tables):
+    # A source file that changed after it was read is never copied from
+    _path = _write(_read(first), tmp_path / "a")
+    D = _read(_path)
+    _write(_read(first, track=False), tmp_path / "a", precision=4, track=False)
+    del formatted[:]
+    _write(D, tmp_path / "b")
+    assert sorted(formatted) == tables
+
+
+def test_untracked_read_formatted(tmp_path, formatted, first, tables):
+    _write(_read(first, track=False), tmp_path)
+    assert sorted(formatted) == tables